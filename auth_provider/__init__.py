@@ -2,21 +2,83 @@
 MuniStream Keycloak Authentication Provider
 """
 from .keycloak_provider import KeycloakAuthProvider
+from .cache import CacheBackend, SignedCache, TieredCache, TTLCache
+from .shared_cache import SharedMemoryCache, RedisCache
+from .instrumentation import (
+    Instrumentation,
+    NullInstrumentation,
+    StatsInstrumentation,
+    PrometheusInstrumentation,
+    OpenTelemetryInstrumentation
+)
+from .principal import Principal
+from .registry import KeycloakProviderRegistry
+from .service_account import ServiceAccountTokenManager, ServiceAccountAuth
 from .fastapi_integration import (
     KeycloakAuth,
     OptionalAuth,
+    PolicyEngine,
+    TokenValidation,
+    get_principal,
+    get_optional_principal,
     require_roles,
     require_all_roles,
+    set_default_role_index,
     security_scheme
 )
+from .middleware import KeycloakAuthMiddleware
+from .policy import CompiledPolicy, PolicyError, RoleIndex, compile_policy
+from .role_hierarchy import RoleHierarchy, RoleHierarchyResolver
+from .revocation import RevocationList, RevocationStatus
+from .resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+    KeycloakUnavailableError
+)
 
 __all__ = [
     "KeycloakAuthProvider",
+    "KeycloakProviderRegistry",
+    "Instrumentation",
+    "NullInstrumentation",
+    "StatsInstrumentation",
+    "PrometheusInstrumentation",
+    "OpenTelemetryInstrumentation",
+    "Principal",
+    "ServiceAccountTokenManager",
+    "ServiceAccountAuth",
     "KeycloakAuth",
     "OptionalAuth",
+    "PolicyEngine",
+    "TokenValidation",
     "require_roles",
     "require_all_roles",
-    "security_scheme"
+    "set_default_role_index",
+    "security_scheme",
+    "KeycloakAuthMiddleware",
+    "get_principal",
+    "get_optional_principal",
+    "CompiledPolicy",
+    "PolicyError",
+    "RoleIndex",
+    "compile_policy",
+    "RoleHierarchy",
+    "RoleHierarchyResolver",
+    "AdaptiveConcurrencyLimiter",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "ConcurrencyLimitExceeded",
+    "KeycloakUnavailableError",
+    "RevocationList",
+    "RevocationStatus",
+    "CacheBackend",
+    "SignedCache",
+    "TieredCache",
+    "TTLCache",
+    "SharedMemoryCache",
+    "RedisCache"
 ]
 
 __version__ = "1.0.0"
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Cache backends used by the Keycloak authentication provider
+"""
+from typing import Optional, Dict, Any, Hashable, List, Tuple
+from collections import OrderedDict
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token: str) -> str:
+    """
+    Build a cache key for a bearer token
+
+    Raw tokens are never used as keys so that cache dumps and metrics
+    labels cannot leak credentials.
+
+    Args:
+        token: Encoded token
+
+    Returns:
+        Hex SHA-256 digest of the token
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """
+    Interface of the provider's caches
+
+    Entries carry an absolute expiry time in epoch seconds. Backends shared
+    between processes (SharedMemoryCache, RedisCache) store JSON-serialisable
+    values and string keys; ``namespace`` gives a prefixed view so one
+    backend can hold the JWKS, introspection and claims caches.
+
+    ``evicts`` tells whether entries may be dropped before they expire
+    (e.g. when the cache is full); stores that must not lose entries, such
+    as a shared RevocationList, refuse evicting backends.
+    """
+
+    evicts = True
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, expires_at)`` for ``key`` or None if missing or expired"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for ``key`` or None if missing or expired"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Return the cached values of ``keys`` (None where missing), in one round trip if possible"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        """Store ``value`` under ``key`` until ``expires_at`` (epoch seconds)"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Remove ``key`` from the cache if present"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        raise NotImplementedError
+
+    def namespace(self, name: str) -> "CacheBackend":
+        """View of this backend whose keys are prefixed with ``name``"""
+        return NamespacedCache(self, name)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class TTLCache(CacheBackend):
+    """
+    Bounded LRU cache whose entries carry an absolute expiry time
+
+    Expiry times are epoch seconds so they can be compared directly with
+    the ``exp`` claim of a token. Once ``maxsize`` entries are stored the
+    least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        """
+        Args:
+            maxsize: Maximum number of entries kept in memory
+        """
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value for ``key`` or None if missing or expired
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_entry(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        value = self.get(key)
+        if value is None:
+            return None
+        return value, self._data[key][1]
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        """
+        Store ``value`` under ``key`` until ``expires_at`` (epoch seconds)
+        """
+        if self.maxsize <= 0 or expires_at <= time.time():
+            return
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Remove ``key`` from the cache if present"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+class NamespacedCache(CacheBackend):
+    """Prefixed view of another backend, see ``CacheBackend.namespace``"""
+
+    def __init__(self, backend: CacheBackend, name: str):
+        self.backend = backend
+        self.prefix = f"{name}:"
+
+    @property
+    def evicts(self) -> bool:
+        return self.backend.evicts
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        return self.backend.get_entry(self.prefix + key)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.backend.get(self.prefix + key)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return self.backend.get_many([self.prefix + key for key in keys])
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self.backend.set(self.prefix + key, value, expires_at)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        clear_prefix = getattr(self.backend, "clear_prefix", None)
+        if clear_prefix is not None:
+            clear_prefix(self.prefix)
+        else:
+            self.backend.clear()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats
+
+
+class TieredCache(CacheBackend):
+    """
+    In-process TTLCache in front of a shared backend
+
+    Hits are served from process memory; misses fall through to the shared
+    backend and are copied locally with the same expiry. Writes go to both.
+    """
+
+    def __init__(self, local: TTLCache, shared: CacheBackend):
+        """
+        Args:
+            local: Per-process first-level cache
+            shared: Cross-process second-level cache
+        """
+        self.local = local
+        self.shared = shared
+
+    @property
+    def evicts(self) -> bool:
+        return self.shared.evicts
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self.local.get_entry(key)
+        if entry is None:
+            entry = self.shared.get_entry(key)
+            if entry is not None:
+                self.local.set(key, entry[0], entry[1])
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is None:
+            entry = self.shared.get_entry(key)
+            if entry is not None:
+                value = entry[0]
+                self.local.set(key, value, entry[1])
+        return value
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self.local.set(key, value, expires_at)
+        self.shared.set(key, value, expires_at)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self) -> None:
+        self.local.clear()
+        self.shared.clear()
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {"local": self.local.stats, "shared": self.shared.stats}
+
+
+class SignedCache(CacheBackend):
+    """
+    HMAC-authenticated view of a shared backend
+
+    Anyone able to write to a shared cache (the memory-mapped file, the
+    Redis instance) could otherwise plant verified claims, introspection
+    results or a JWKS. Each entry is stored with its expiry and an
+    HMAC-SHA256 over key, expiry and value; entries failing the check are
+    deleted and treated as misses.
+    """
+
+    def __init__(self, backend: CacheBackend, key: bytes):
+        """
+        Args:
+            backend: Shared backend holding the signed entries
+            key: HMAC key, e.g. the provider's snapshot key
+        """
+        self.backend = backend
+        self._key = key
+        self.rejected = 0
+
+    @property
+    def evicts(self) -> bool:
+        return self.backend.evicts
+
+    def _mac(self, key: str, value: Any, expires_at: float) -> str:
+        canonical = json.dumps([key, expires_at, value], sort_keys=True, separators=(",", ":"))
+        return hmac.new(self._key, canonical.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _verify(self, key: str, signed: Any) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, expires_at)`` of a signed entry, None if absent, expired or forged"""
+        if signed is None:
+            return None
+        try:
+            value, expires_at, mac = signed
+            valid = hmac.compare_digest(mac, self._mac(key, value, expires_at))
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            self.rejected += 1
+            logger.warning(f"Dropping shared cache entry {key} with an invalid signature")
+            self.backend.delete(key)
+            return None
+        if expires_at <= time.time():
+            return None
+        return value, expires_at
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self.backend.get_entry(key)
+        return self._verify(key, entry[0] if entry is not None else None)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        values = []
+        for key, signed in zip(keys, self.backend.get_many(keys)):
+            entry = self._verify(key, signed)
+            values.append(entry[0] if entry is not None else None)
+        return values
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self.backend.set(key, [value, expires_at, self._mac(key, value, expires_at)], expires_at)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def clear_prefix(self, prefix: str) -> None:
+        """Delete the entries starting with ``prefix``, or all if the backend cannot"""
+        clear_prefix = getattr(self.backend, "clear_prefix", None)
+        if clear_prefix is not None:
+            clear_prefix(prefix)
+        else:
+            self.backend.clear()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {**self.backend.stats, "rejected": self.rejected}
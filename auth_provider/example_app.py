@@ -5,10 +5,20 @@ from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from .keycloak_provider import KeycloakAuthProvider
-from .fastapi_integration import KeycloakAuth, require_roles, require_all_roles, OptionalAuth
+from .fastapi_integration import (
+    KeycloakAuth,
+    PolicyEngine,
+    TokenValidation,
+    get_principal,
+    get_optional_principal
+)
+from .middleware import KeycloakAuthMiddleware
+from .policy import RoleIndex
+from .role_hierarchy import RoleHierarchyResolver
+from .shared_cache import RedisCache, SharedMemoryCache
 
 
 # Initialize Keycloak provider
@@ -16,20 +26,80 @@ keycloak_provider = KeycloakAuthProvider(
     server_url=os.getenv("KEYCLOAK_URL", "http://localhost:8180"),
     realm=os.getenv("KEYCLOAK_REALM", "munistream"),
     client_id=os.getenv("KEYCLOAK_CLIENT_ID", "munistream-backend"),
-    client_secret=os.getenv("KEYCLOAK_CLIENT_SECRET", "changeme-backend-secret-in-production")
+    client_secret=os.getenv("KEYCLOAK_CLIENT_SECRET", "changeme-backend-secret-in-production"),
+    timeout=float(os.getenv("KEYCLOAK_TIMEOUT", "10")),
+    max_connections=int(os.getenv("KEYCLOAK_MAX_CONNECTIONS", "100")),
+    http2=os.getenv("KEYCLOAK_HTTP2", "false").lower() == "true",
+    discovery=os.getenv("KEYCLOAK_DISCOVERY", "false").lower() == "true",
+    snapshot_path=os.getenv("KEYCLOAK_SNAPSHOT_PATH"),
+    # HMAC key of the snapshot, derived from the client secret when unset
+    snapshot_key=os.getenv("KEYCLOAK_SNAPSHOT_KEY"),
+    snapshot_max_age=float(os.getenv("KEYCLOAK_SNAPSHOT_MAX_AGE", "86400")),
+    # Share JWKS/introspection/claims caches between uvicorn workers,
+    # e.g. KEYCLOAK_SHARED_CACHE=/dev/shm/munistream-auth-cache
+    cache_backend=(
+        SharedMemoryCache(os.environ["KEYCLOAK_SHARED_CACHE"])
+        if os.getenv("KEYCLOAK_SHARED_CACHE") else None
+    ),
+    # Share revoked sessions between workers through a Redis running with
+    # maxmemory-policy noeviction, e.g. redis://auth-redis:6379/0
+    revocation_backend=(
+        RedisCache(os.environ["KEYCLOAK_REVOCATION_REDIS_URL"], noeviction=True)
+        if os.getenv("KEYCLOAK_REVOCATION_REDIS_URL") else None
+    )
+)
+
+REALM_EXPORT = os.getenv(
+    "KEYCLOAK_REALM_EXPORT",
+    os.path.join(os.path.dirname(__file__), "..", "realms", "munistream-realm.json")
+)
+
+# Composite roles and group roles are expanded from the realm export, or from
+# the admin API through the backend service account when no export is present
+role_resolver = RoleHierarchyResolver(
+    keycloak_provider,
+    realm_export=REALM_EXPORT if os.path.exists(REALM_EXPORT) else None
 )
 
 # Create auth dependencies
-auth = KeycloakAuth(keycloak_provider)
-optional_auth = OptionalAuth(keycloak_provider)
+auth = KeycloakAuth(keycloak_provider, role_expander=role_resolver)
+# Baseline policy applied by the middleware: high-traffic citizen endpoints
+# only introspect tokens older than a minute, strict routes use `auth`.
+# During a Keycloak brownout citizens keep access with locally verified tokens.
+citizen_auth = KeycloakAuth(
+    keycloak_provider,
+    validation=TokenValidation.HYBRID,
+    max_token_age=int(os.getenv("KEYCLOAK_MAX_TOKEN_AGE", "60")),
+    role_expander=role_resolver,
+    degraded_mode=os.getenv("KEYCLOAK_DEGRADED_MODE", "true").lower() == "true"
+)
+
+# Role policies are validated against the realm roles at import time
+role_index = (
+    RoleIndex.from_realm_export(REALM_EXPORT, client_id=keycloak_provider.client_id)
+    if os.path.exists(REALM_EXPORT) else None
+)
+# Citizen routes use the middleware principal, admin routes re-check strictly
+policies = PolicyEngine(role_index)
+admin_policies = PolicyEngine(role_index, auth=auth)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     print("Starting MuniStream Backend with Keycloak Authentication")
+    await keycloak_provider.bootstrap()
+    keycloak_provider.start_background_refresh()
+    try:
+        await role_resolver.load()
+    except Exception as e:
+        print(f"Role hierarchy not loaded, using token roles only: {e}")
+    if os.getenv("KEYCLOAK_SERVICE_ACCOUNT", "false").lower() == "true":
+        # Keep a client_credentials token warm for backend-to-backend calls
+        keycloak_provider.service_account.start()
     yield
     print("Shutting down MuniStream Backend")
+    await keycloak_provider.aclose()
 
 
 # Create FastAPI app
@@ -40,6 +110,22 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Authenticate every request once; CORS is added afterwards so it stays
+# outermost and answers preflight requests without a token
+app.add_middleware(
+    KeycloakAuthMiddleware,
+    auth=citizen_auth,
+    exclude_paths=[
+        "/api/v1/health",
+        "/api/v1/auth/refresh",
+        "/api/v1/auth/backchannel-logout",
+        "/docs*",
+        "/redoc",
+        "/openapi.json"
+    ],
+    optional_paths=["/api/v1/public/*"]
+)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -59,7 +145,7 @@ async def health_check():
 
 @app.get("/api/v1/public/workflows")
 async def get_public_workflows(
-    current_user: Dict[Any, Any] = Depends(optional_auth.get_optional_user)
+    current_user: Optional[Dict[Any, Any]] = Depends(get_optional_principal)
 ):
     """
     Get public workflows - authentication optional
@@ -81,7 +167,7 @@ async def get_public_workflows(
 # Protected endpoints
 @app.get("/api/v1/user/profile")
 async def get_user_profile(
-    current_user: Dict[Any, Any] = Depends(auth.get_current_user)
+    current_user: Dict[Any, Any] = Depends(get_principal)
 ):
     """Get current user profile - requires authentication"""
     return {
@@ -96,7 +182,7 @@ async def get_user_profile(
 # Role-based endpoints
 @app.get("/api/v1/admin/users")
 async def list_users(
-    current_user: Dict[Any, Any] = Depends(require_roles(["admin"]))
+    current_user: Dict[Any, Any] = Depends(admin_policies.require_any(["admin"]))
 ):
     """List all users - requires admin role"""
     return {
@@ -110,7 +196,7 @@ async def list_users(
 @app.post("/api/v1/workflows/{workflow_id}/approve")
 async def approve_workflow(
     workflow_id: str,
-    current_user: Dict[Any, Any] = Depends(require_roles(["approver", "admin"]))
+    current_user: Dict[Any, Any] = Depends(admin_policies.require("approver | admin"))
 ):
     """Approve workflow - requires approver or admin role"""
     return {
@@ -122,7 +208,7 @@ async def approve_workflow(
 
 @app.get("/api/v1/documents/review")
 async def get_documents_for_review(
-    current_user: Dict[Any, Any] = Depends(require_roles(["reviewer", "manager", "admin"]))
+    current_user: Dict[Any, Any] = Depends(admin_policies.require_any(["reviewer", "manager", "admin"]))
 ):
     """Get documents for review - requires reviewer, manager, or admin role"""
     return {
@@ -134,7 +220,7 @@ async def get_documents_for_review(
 @app.post("/api/v1/admin/system/config")
 async def update_system_config(
     config: Dict[Any, Any],
-    current_user: Dict[Any, Any] = Depends(require_all_roles(["admin", "manager"]))
+    current_user: Dict[Any, Any] = Depends(admin_policies.require_all(["admin", "manager"]))
 ):
     """Update system configuration - requires both admin AND manager roles"""
     return {
@@ -147,7 +233,7 @@ async def update_system_config(
 # Citizen-specific endpoints
 @app.get("/api/v1/citizen/applications")
 async def get_my_applications(
-    current_user: Dict[Any, Any] = Depends(require_roles(["citizen", "verified_citizen"]))
+    current_user: Dict[Any, Any] = Depends(policies.require_any(["citizen", "verified_citizen"]))
 ):
     """Get citizen's applications - requires citizen role"""
     return {
@@ -159,7 +245,7 @@ async def get_my_applications(
 @app.post("/api/v1/citizen/submit-document")
 async def submit_document(
     document_type: str,
-    current_user: Dict[Any, Any] = Depends(require_roles(["verified_citizen"]))
+    current_user: Dict[Any, Any] = Depends(policies.require_any(["verified_citizen"]))
 ):
     """Submit document - requires verified citizen role"""
     return {
@@ -172,7 +258,7 @@ async def submit_document(
 # Business entity endpoints
 @app.get("/api/v1/business/permits")
 async def get_business_permits(
-    current_user: Dict[Any, Any] = Depends(require_roles(["business_entity"]))
+    current_user: Dict[Any, Any] = Depends(policies.require_any(["business_entity"]))
 ):
     """Get business permits - requires business entity role"""
     return {
@@ -211,6 +297,13 @@ async def logout(
         )
 
 
+# Keycloak "Backchannel logout URL" of the backend client; revokes the
+# session so even LOCAL/HYBRID validation rejects its tokens. Keycloak calls
+# a single worker: without KEYCLOAK_REVOCATION_REDIS_URL the other workers
+# keep accepting the session's tokens until they expire.
+app.post("/api/v1/auth/backchannel-logout", include_in_schema=False)(auth.backchannel_logout)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,13 +1,24 @@
 """
 FastAPI integration for Keycloak authentication
 """
-from typing import Optional, List, Callable
-from fastapi import Depends, HTTPException, status
+from typing import Optional, List, Callable, Dict, Any, Union
+from enum import Enum
+from urllib.parse import parse_qs
+import os
+import time
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError
 import logging
 
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION, failure_reason
 from .keycloak_provider import KeycloakAuthProvider
+from .registry import KeycloakProviderRegistry
+from .resilience import is_unavailable
+from .revocation import RevocationStatus
+from .principal import Principal, RoleExpander
+from .policy import CompiledPolicy, RoleIndex, compile_policy
 
 logger = logging.getLogger(__name__)
 
@@ -15,22 +26,114 @@ logger = logging.getLogger(__name__)
 security_scheme = HTTPBearer()
 
 
+class TokenValidation(str, Enum):
+    """
+    Token validation policy used by KeycloakAuth
+
+    LOCAL: verify the JWT signature and claims only, no Keycloak round trip
+    INTROSPECT: verify locally and introspect every token with Keycloak
+    HYBRID: verify locally and introspect only tokens older than
+        ``max_token_age`` or issued before the last revocation notice
+    """
+    LOCAL = "local"
+    INTROSPECT = "introspect"
+    HYBRID = "hybrid"
+
+
 class KeycloakAuth:
     """
     FastAPI dependency for Keycloak authentication
     """
 
-    def __init__(self, provider: KeycloakAuthProvider):
+    def __init__(
+        self,
+        provider: Union[KeycloakAuthProvider, KeycloakProviderRegistry],
+        validation: TokenValidation = TokenValidation.INTROSPECT,
+        max_token_age: int = 60,
+        role_expander: Optional[RoleExpander] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        degraded_mode: bool = False,
+        degraded_max_token_age: Optional[int] = None
+    ):
+        """
+        Args:
+            provider: Keycloak authentication provider, or a registry
+                dispatching tokens to per-realm providers
+            validation: Token validation policy for this dependency
+            max_token_age: Seconds after ``iat`` before HYBRID mode introspects
+            role_expander: Optional composite-role and group expander,
+                e.g. a RoleHierarchyResolver
+            instrumentation: Metrics/tracing backend, defaults to the provider's
+            degraded_mode: Accept locally verified tokens while introspection
+                is unavailable (circuit open, timeouts, 5xx) instead of
+                answering 503
+            degraded_max_token_age: In degraded mode, only accept tokens issued
+                at most this many seconds ago (None accepts any unexpired token)
+        """
         self.provider = provider
+        self.role_expander = role_expander
+        self.instrumentation = (
+            instrumentation
+            or getattr(provider, "instrumentation", None)
+            or NULL_INSTRUMENTATION
+        )
+        self.validation = TokenValidation(validation)
+        self.max_token_age = max_token_age
+        self.degraded_mode = degraded_mode
+        self.degraded_max_token_age = degraded_max_token_age
+        self._revoked_before: Optional[float] = None
+
+    def mark_revocation(self, timestamp: Optional[float] = None) -> None:
+        """
+        Record a revocation event (e.g. a logout or a realm not-before push)
+
+        In HYBRID mode every token issued at or before this moment is
+        introspected until it expires.
+
+        Args:
+            timestamp: Epoch seconds of the revocation, defaults to now
+        """
+        self._revoked_before = timestamp if timestamp is not None else time.time()
+
+    def _needs_introspection(self, token_claims: Dict[str, Any]) -> bool:
+        """Decide whether the validation policy requires an introspection call"""
+        if self.validation == TokenValidation.INTROSPECT:
+            return True
+        if self.validation == TokenValidation.LOCAL:
+            return False
+
+        issued_at = token_claims.get("iat")
+        if issued_at is None:
+            return True
+        if time.time() - issued_at > self.max_token_age:
+            return True
+        return self._revoked_before is not None and issued_at <= self._revoked_before
+
+    def _accept_degraded(self, token_claims: Dict[str, Any]) -> bool:
+        """Decide whether a verified token may skip unavailable introspection"""
+        if not self.degraded_mode:
+            return False
+        issued_at = token_claims.get("iat")
+        if issued_at is None:
+            return False
+        if self._revoked_before is not None and issued_at <= self._revoked_before:
+            return False
+        return self.degraded_max_token_age is None or time.time() - issued_at <= self.degraded_max_token_age
 
     async def get_current_user(
         self,
+        request: Request,
         credentials: HTTPAuthorizationCredentials = Depends(security_scheme)
-    ) -> dict:
+    ) -> Principal:
         """
         Verify token and return current user
 
+        If KeycloakAuthMiddleware already authenticated the request with this
+        same KeycloakAuth instance, its result is reused without verifying
+        the token again.
+
         Args:
+            request: Incoming request
             credentials: Bearer token from request
 
         Returns:
@@ -39,6 +142,10 @@ class KeycloakAuth:
         Raises:
             HTTPException: If authentication fails
         """
+        state = request.scope.get("state")
+        if state and state.get("auth") is self and state.get("user") is not None:
+            return state["user"]
+
         if not credentials:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,34 +153,67 @@ class KeycloakAuth:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        return await self.authenticate(credentials.credentials)
+
+    async def authenticate(self, token: str) -> Principal:
+        """
+        Validate a bearer token according to this dependency's policy
+
+        Args:
+            token: Encoded access token
+
+        Returns:
+            User information from token
+
+        Raises:
+            HTTPException: If authentication fails
+        """
+        with self.instrumentation.span("authenticate"):
+            return await self._authenticate(token)
+
+    async def _authenticate(self, token: str) -> Principal:
         try:
             # Verify token
-            token_claims = await self.provider.verify_token(credentials.credentials)
-
-            # Check if token is active
-            introspection = await self.provider.introspect_token(credentials.credentials)
-            if not introspection.get("active"):
+            provider = self.provider.resolve(token)
+            token_claims = await provider.verify_token(token)
+
+            # Reject revoked sessions locally; Bloom filter hits are confirmed
+            # by introspection
+            revocation = provider.revocations.check(token_claims)
+            if revocation is RevocationStatus.REVOKED:
+                self.instrumentation.failure("token_validation", "revoked")
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token is not active",
+                    detail="Token has been revoked",
                     headers={"WWW-Authenticate": "Bearer"},
                 )
 
-            # Extract user information
-            user_info = {
-                "sub": token_claims.get("sub"),
-                "email": token_claims.get("email"),
-                "username": token_claims.get("preferred_username"),
-                "name": token_claims.get("name"),
-                "roles": self.provider.extract_roles(token_claims),
-                "email_verified": token_claims.get("email_verified", False),
-                "token_claims": token_claims
-            }
-
-            return user_info
-
+            # Check if token is active
+            if revocation is RevocationStatus.POSSIBLY_REVOKED or self._needs_introspection(token_claims):
+                try:
+                    introspection = await provider.introspect_token(token)
+                except Exception as e:
+                    degraded = revocation is RevocationStatus.NOT_REVOKED and self._accept_degraded(token_claims)
+                    if not (is_unavailable(e) and degraded):
+                        raise
+                    logger.warning(f"Introspection unavailable, accepting locally verified token: {e}")
+                    self.instrumentation.failure("degraded", failure_reason(e))
+                    introspection = {"active": True}
+                if not introspection.get("active"):
+                    self.instrumentation.failure("token_validation", "inactive")
+                    raise HTTPException(
+                        status_code=status.HTTP_401_UNAUTHORIZED,
+                        detail="Token is not active",
+                        headers={"WWW-Authenticate": "Bearer"},
+                    )
+
+            return Principal(token_claims, provider.client_id, self.role_expander)
+
+        except HTTPException:
+            raise
         except JWTError as e:
             logger.error(f"JWT verification failed: {e}")
+            self.instrumentation.failure("token_validation", failure_reason(e))
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication token",
@@ -81,65 +221,258 @@ class KeycloakAuth:
             )
         except Exception as e:
             logger.error(f"Authentication error: {e}")
+            self.instrumentation.failure("token_validation", failure_reason(e))
+            if is_unavailable(e):
+                retry_after = int(getattr(e, "retry_after", 0)) + 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service unavailable",
+                    headers={"Retry-After": str(retry_after)}
+                )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Authentication service error"
             )
 
+    async def backchannel_logout(self, request: Request) -> Response:
+        """
+        OIDC back-channel logout receiver
+
+        Mount it as a POST route and configure its URL as the client's
+        "Backchannel logout URL" in Keycloak. The route must not require a
+        bearer token. Tokens of the logged-out session are rejected from then
+        on, without introspection: by every worker when the provider has a
+        ``revocation_backend``, otherwise only by the worker receiving the
+        call.
 
-def require_roles(required_roles: List[str]) -> Callable:
+        Returns:
+            200 once the session is revoked, 400 for an invalid logout token
+        """
+        body = await request.body()
+        try:
+            logout_token = parse_qs(body.decode("utf-8")).get("logout_token", [None])[0]
+        except UnicodeDecodeError:
+            logout_token = None
+        if not logout_token:
+            return JSONResponse(
+                {"error": "invalid_request", "error_description": "Missing logout_token"},
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            provider = self.provider.resolve(logout_token)
+            await provider.handle_logout_token(logout_token)
+        except JWTError as e:
+            logger.warning(f"Rejected back-channel logout token: {e}")
+            return JSONResponse(
+                {"error": "invalid_request", "error_description": "Invalid logout token"},
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(status_code=status.HTTP_200_OK, headers={"Cache-Control": "no-store"})
+
+
+def get_optional_principal(request: Request) -> Optional[Principal]:
     """
-    Dependency to require specific roles
+    FastAPI dependency returning the user authenticated by KeycloakAuthMiddleware
 
-    Args:
-        required_roles: List of required role names
+    Returns:
+        User information, or None for anonymous requests
+    """
+    return request.scope.get("state", {}).get("user")
+
+
+def get_principal(request: Request) -> Principal:
+    """
+    FastAPI dependency requiring a user authenticated by KeycloakAuthMiddleware
 
     Returns:
-        FastAPI dependency
+        User information
+
+    Raises:
+        HTTPException: If the request is not authenticated
     """
-    async def role_checker(
-        current_user: dict = Depends(KeycloakAuth.get_current_user)
-    ) -> dict:
-        user_roles = current_user.get("roles", [])
+    user = request.scope.get("state", {}).get("user")
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
-        # Check if user has any of the required roles
-        if not any(role in user_roles for role in required_roles):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Insufficient permissions. Required roles: {', '.join(required_roles)}"
-            )
 
-        return current_user
+class PolicyEngine:
+    """
+    Builds role-checking dependencies from precompiled policies
+
+    Policies are compiled when the dependency is created (i.e. at import or
+    startup time), so malformed expressions and unknown roles fail fast.
+    Dependencies are memoised per expression, and each check is a bitmask
+    test against the principal's role mask.
+    """
+
+    def __init__(
+        self,
+        index: Optional[RoleIndex] = None,
+        auth: Optional[KeycloakAuth] = None
+    ):
+        """
+        Args:
+            index: Role index to validate policies against, e.g.
+                ``RoleIndex.from_realm_export("realms/munistream-realm.json")``
+            auth: Dependency used to authenticate the user; defaults to the
+                principal set by KeycloakAuthMiddleware
+        """
+        self.index = index
+        self.user_dependency = auth.get_current_user if auth is not None else get_principal
+        self._dependencies: Dict[Any, Callable] = {}
+
+    def compile(self, expression: str) -> CompiledPolicy:
+        return compile_policy(expression, self.index)
+
+    def require(self, expression: str) -> Callable:
+        """
+        Dependency requiring a role expression such as ``(approver | admin) & !suspended``
+
+        Args:
+            expression: Role expression, see ``compile_policy``
+
+        Returns:
+            FastAPI dependency
+        """
+        return self._checker(("policy", expression), self.compile(expression),
+                             f"Insufficient permissions. Required policy: {expression}")
+
+    def require_any(self, required_roles: List[str]) -> Callable:
+        """
+        Dependency requiring any of the given roles
+
+        Args:
+            required_roles: List of role names; an empty list denies everyone
+
+        Returns:
+            FastAPI dependency
+        """
+        return self._checker(
+            ("any", tuple(required_roles)),
+            self._compile_roles(required_roles, " | "),
+            f"Insufficient permissions. Required roles: {', '.join(required_roles)}"
+        )
+
+    def require_all(self, required_roles: List[str]) -> Callable:
+        """
+        Dependency requiring all of the given roles
+
+        Args:
+            required_roles: List of role names; an empty list admits any
+                authenticated user
+
+        Returns:
+            FastAPI dependency
+        """
+        def missing_roles(current_user: Principal) -> str:
+            missing = [role for role in required_roles if role not in current_user.roles]
+            return f"Missing required roles: {', '.join(missing)}"
+
+        return self._checker(
+            ("all", tuple(required_roles)),
+            self._compile_roles(required_roles, " & "),
+            missing_roles
+        )
+
+    def _compile_roles(self, roles: List[str], operator: str) -> CompiledPolicy:
+        """Compile a role list, keeping any([]) / all([]) semantics for empty lists"""
+        if roles:
+            return self.compile(operator.join(roles))
+        always = operator.strip() == "&"
+        return CompiledPolicy("", self.index or RoleIndex(()), [(0, 0)] if always else [], [])
+
+    def _checker(
+        self,
+        key: Any,
+        policy: CompiledPolicy,
+        detail: Union[str, Callable[[Principal], str]]
+    ) -> Callable:
+        dependency = self._dependencies.get(key)
+        if dependency is not None:
+            return dependency
+
+        async def role_checker(
+            current_user: Principal = Depends(self.user_dependency)
+        ) -> Principal:
+            if not policy.evaluate(current_user):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=detail if isinstance(detail, str) else detail(current_user)
+                )
+            return current_user
+
+        self._dependencies[key] = role_checker
+        return role_checker
 
-    return role_checker
 
+_default_engines: Dict[Optional[KeycloakAuth], PolicyEngine] = {}
+_default_role_index: Optional[RoleIndex] = None
 
-def require_all_roles(required_roles: List[str]) -> Callable:
+
+def set_default_role_index(index: Optional[RoleIndex]) -> None:
     """
-    Dependency to require all specified roles
+    Validate the roles of ``require_roles``/``require_all_roles`` against an index
+
+    Call it before routes are declared. Without it the index is loaded from
+    the realm export named by ``KEYCLOAK_REALM_EXPORT`` when that file exists,
+    with the roles of the ``KEYCLOAK_CLIENT_ID`` client under plain names.
+
+    Args:
+        index: Role index, e.g. ``RoleIndex.from_realm_export(...)``
+    """
+    global _default_role_index
+    _default_role_index = index
+    _default_engines.clear()
+
+
+def _default_engine(auth: Optional[KeycloakAuth]) -> PolicyEngine:
+    global _default_role_index
+    if _default_role_index is None:
+        realm_export = os.getenv("KEYCLOAK_REALM_EXPORT")
+        if realm_export and os.path.exists(realm_export):
+            _default_role_index = RoleIndex.from_realm_export(
+                realm_export, client_id=os.getenv("KEYCLOAK_CLIENT_ID")
+            )
+
+    engine = _default_engines.get(auth)
+    if engine is None:
+        engine = _default_engines[auth] = PolicyEngine(_default_role_index, auth=auth)
+    return engine
+
+
+def require_roles(required_roles: List[str], auth: Optional[KeycloakAuth] = None) -> Callable:
+    """
+    Dependency to require specific roles
 
     Args:
         required_roles: List of required role names
+        auth: Authentication dependency; defaults to the middleware principal
 
     Returns:
         FastAPI dependency
     """
-    async def role_checker(
-        current_user: dict = Depends(KeycloakAuth.get_current_user)
-    ) -> dict:
-        user_roles = current_user.get("roles", [])
+    return _default_engine(auth).require_any(required_roles)
 
-        # Check if user has all required roles
-        if not all(role in user_roles for role in required_roles):
-            missing_roles = [role for role in required_roles if role not in user_roles]
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Missing required roles: {', '.join(missing_roles)}"
-            )
 
-        return current_user
+def require_all_roles(required_roles: List[str], auth: Optional[KeycloakAuth] = None) -> Callable:
+    """
+    Dependency to require all specified roles
 
-    return role_checker
+    Args:
+        required_roles: List of required role names
+        auth: Authentication dependency; defaults to the middleware principal
+
+    Returns:
+        FastAPI dependency
+    """
+    return _default_engine(auth).require_all(required_roles)
 
 
 class OptionalAuth:
@@ -147,15 +480,20 @@ class OptionalAuth:
     Optional authentication - allows both authenticated and anonymous access
     """
 
-    def __init__(self, provider: KeycloakAuthProvider):
+    def __init__(
+        self,
+        provider: Union[KeycloakAuthProvider, KeycloakProviderRegistry],
+        role_expander: Optional[RoleExpander] = None
+    ):
         self.provider = provider
+        self.role_expander = role_expander
 
     async def get_optional_user(
         self,
         credentials: Optional[HTTPAuthorizationCredentials] = Depends(
             HTTPBearer(auto_error=False)
         )
-    ) -> Optional[dict]:
+    ) -> Optional[Principal]:
         """
         Optionally verify token if present
 
@@ -169,16 +507,20 @@ class OptionalAuth:
             return None
 
         try:
-            token_claims = await self.provider.verify_token(credentials.credentials)
-            return {
-                "sub": token_claims.get("sub"),
-                "email": token_claims.get("email"),
-                "username": token_claims.get("preferred_username"),
-                "name": token_claims.get("name"),
-                "roles": self.provider.extract_roles(token_claims),
-                "email_verified": token_claims.get("email_verified", False),
-                "token_claims": token_claims
-            }
+            provider = self.provider.resolve(credentials.credentials)
+            token_claims = await provider.verify_token(credentials.credentials)
+
+            # Logged-out sessions are anonymous; Bloom filter hits are
+            # confirmed by introspection
+            revocation = provider.revocations.check(token_claims)
+            if revocation is RevocationStatus.REVOKED:
+                return None
+            if revocation is RevocationStatus.POSSIBLY_REVOKED:
+                introspection = await provider.introspect_token(credentials.credentials)
+                if not introspection.get("active"):
+                    return None
+
+            return Principal(token_claims, provider.client_id, self.role_expander)
         except Exception as e:
             logger.warning(f"Optional auth failed: {e}")
             return None
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+Pluggable instrumentation hooks for the authentication hot path
+"""
+from typing import Optional, Dict, Any, List, Tuple
+from collections import defaultdict
+import time
+
+import httpx
+
+
+def failure_reason(exc: BaseException) -> str:
+    """
+    Map an exception to a low-cardinality failure reason label
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"http_{exc.response.status_code}"
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.TransportError):
+        return "connection"
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return f"http_{status_code}"
+    return type(exc).__name__
+
+
+class _Span:
+    """Times one operation and reports it to an Instrumentation"""
+
+    __slots__ = ("instrumentation", "operation", "start")
+
+    def __init__(self, instrumentation: "Instrumentation", operation: str):
+        self.instrumentation = instrumentation
+        self.operation = operation
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.instrumentation.inflight(self.operation, 1)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        instrumentation = self.instrumentation
+        instrumentation.inflight(self.operation, -1)
+        if exc is None:
+            instrumentation.observe(self.operation, duration, "success")
+        else:
+            instrumentation.failure(self.operation, failure_reason(exc))
+            instrumentation.observe(self.operation, duration, "failure")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Instrumentation:
+    """
+    Base class for instrumentation backends
+
+    Operations reported by the provider and KeycloakAuth are
+    ``verify_signature``, ``jwks_fetch``, ``introspection``, ``token``,
+    ``userinfo``, ``logout`` and ``authenticate``; caches are ``claims``
+    and ``introspection``. Tokens accepted without introspection while
+    Keycloak is unavailable are counted as ``degraded`` failures.
+    Subclasses override the hooks they need.
+    """
+
+    enabled = True
+
+    def span(self, operation: str):
+        """Context manager timing ``operation``"""
+        return _Span(self, operation)
+
+    def observe(self, operation: str, duration: float, outcome: str) -> None:
+        """Record the latency in seconds of a completed operation"""
+
+    def failure(self, operation: str, reason: str) -> None:
+        """Count a failed operation"""
+
+    def inflight(self, operation: str, delta: int) -> None:
+        """Adjust the number of in-flight operations"""
+
+    def cache_lookup(self, cache: str, hit: bool) -> None:
+        """Record a cache hit or miss"""
+
+
+class NullInstrumentation(Instrumentation):
+    """Default backend; every hook is a no-op and spans are a shared singleton"""
+
+    enabled = False
+
+    def span(self, operation: str):
+        return _NOOP_SPAN
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class StatsInstrumentation(Instrumentation):
+    """
+    In-memory backend keeping raw latencies and counters, useful for
+    benchmarks and debugging endpoints
+    """
+
+    def __init__(self, max_samples: int = 100000):
+        self.max_samples = max_samples
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.cache_hits: Dict[str, int] = defaultdict(int)
+        self.cache_misses: Dict[str, int] = defaultdict(int)
+
+    def observe(self, operation: str, duration: float, outcome: str) -> None:
+        samples = self.latencies[operation]
+        if len(samples) < self.max_samples:
+            samples.append(duration)
+
+    def failure(self, operation: str, reason: str) -> None:
+        self.failures[(operation, reason)] += 1
+
+    def inflight(self, operation: str, delta: int) -> None:
+        self.in_flight[operation] += delta
+
+    def cache_lookup(self, cache: str, hit: bool) -> None:
+        if hit:
+            self.cache_hits[cache] += 1
+        else:
+            self.cache_misses[cache] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Latency percentiles, cache hit ratios and failure counts"""
+        latencies = {}
+        for operation, samples in self.latencies.items():
+            ordered = sorted(samples)
+            count = len(ordered)
+            latencies[operation] = {
+                "count": count,
+                "p50": ordered[int(count * 0.50)] if count else 0.0,
+                "p95": ordered[min(int(count * 0.95), count - 1)] if count else 0.0,
+                "p99": ordered[min(int(count * 0.99), count - 1)] if count else 0.0,
+            }
+
+        hit_ratios = {}
+        for cache in set(self.cache_hits) | set(self.cache_misses):
+            lookups = self.cache_hits[cache] + self.cache_misses[cache]
+            hit_ratios[cache] = self.cache_hits[cache] / lookups if lookups else 0.0
+
+        return {
+            "latency": latencies,
+            "cache_hit_ratio": hit_ratios,
+            "failures": {f"{operation}:{reason}": count for (operation, reason), count in self.failures.items()},
+            "in_flight": dict(self.in_flight)
+        }
+
+
+class PrometheusInstrumentation(Instrumentation):
+    """
+    Prometheus backend (requires ``prometheus_client``)
+
+    Exposes ``<namespace>_operation_seconds`` (histogram),
+    ``<namespace>_failures_total``, ``<namespace>_in_flight`` and
+    ``<namespace>_cache_lookups_total``.
+    """
+
+    def __init__(self, namespace: str = "keycloak_auth", registry: Optional[Any] = None):
+        try:
+            from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+        except ImportError:
+            raise ImportError("PrometheusInstrumentation requires the prometheus_client package")
+
+        registry = registry if registry is not None else REGISTRY
+        self._latency = Histogram(
+            f"{namespace}_operation_seconds", "Latency of Keycloak auth operations",
+            ["operation", "outcome"], registry=registry,
+            buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+        )
+        self._failures = Counter(
+            f"{namespace}_failures_total", "Failed Keycloak auth operations",
+            ["operation", "reason"], registry=registry
+        )
+        self._in_flight = Gauge(
+            f"{namespace}_in_flight", "In-flight Keycloak auth operations",
+            ["operation"], registry=registry
+        )
+        self._cache = Counter(
+            f"{namespace}_cache_lookups_total", "Auth cache lookups",
+            ["cache", "result"], registry=registry
+        )
+
+    def observe(self, operation: str, duration: float, outcome: str) -> None:
+        self._latency.labels(operation, outcome).observe(duration)
+
+    def failure(self, operation: str, reason: str) -> None:
+        self._failures.labels(operation, reason).inc()
+
+    def inflight(self, operation: str, delta: int) -> None:
+        self._in_flight.labels(operation).inc(delta)
+
+    def cache_lookup(self, cache: str, hit: bool) -> None:
+        self._cache.labels(cache, "hit" if hit else "miss").inc()
+
+
+class _OpenTelemetrySpan:
+    __slots__ = ("instrumentation", "operation", "manager", "span")
+
+    def __init__(self, instrumentation: "OpenTelemetryInstrumentation", operation: str):
+        self.instrumentation = instrumentation
+        self.operation = operation
+
+    def __enter__(self) -> "_OpenTelemetrySpan":
+        self.manager = self.instrumentation.tracer.start_as_current_span(
+            f"keycloak.{self.operation}", record_exception=False, set_status_on_exception=False
+        )
+        self.span = self.manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.span.set_attribute("keycloak.failure_reason", failure_reason(exc))
+            self.span.set_status(self.instrumentation.error_status)
+        self.manager.__exit__(exc_type, exc, tb)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    OpenTelemetry backend (requires ``opentelemetry-api``)
+
+    Emits one span per operation named ``keycloak.<operation>`` and records
+    cache lookups as events on the current span.
+    """
+
+    def __init__(self, tracer: Optional[Any] = None):
+        try:
+            from opentelemetry import trace
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError:
+            raise ImportError("OpenTelemetryInstrumentation requires the opentelemetry-api package")
+
+        self._trace = trace
+        self.tracer = tracer if tracer is not None else trace.get_tracer("munistream.auth_provider")
+        self.error_status = Status(StatusCode.ERROR)
+
+    def span(self, operation: str):
+        return _OpenTelemetrySpan(self, operation)
+
+    def cache_lookup(self, cache: str, hit: bool) -> None:
+        self._trace.get_current_span().add_event(
+            "keycloak.cache_lookup", {"cache": cache, "hit": hit}
+        )
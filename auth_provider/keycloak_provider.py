@@ -1,14 +1,41 @@
 """
 Keycloak Authentication Provider for MuniStream Backend
 """
-from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+import hashlib
+import re
 import httpx
-from jose import jwt, JWTError
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.constants import ALGORITHMS
 import logging
+import time
+
+from .cache import CacheBackend, SignedCache, TieredCache, TTLCache, token_digest
+from .instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from .resilience import AdaptiveConcurrencyLimiter, CircuitBreaker, is_unavailable
+from .revocation import RevocationList
+from .snapshot import read_snapshot, write_snapshot
+from .service_account import ServiceAccountTokenManager
 
 logger = logging.getLogger(__name__)
 
+# Default signing algorithm for JWKs that do not carry an "alg" member
+_DEFAULT_ALGORITHMS = {
+    ("RSA", None): ALGORITHMS.RS256,
+    ("EC", "P-256"): ALGORITHMS.ES256,
+    ("EC", "P-384"): ALGORITHMS.ES384,
+    ("EC", "P-521"): ALGORITHMS.ES512,
+}
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+_BACKCHANNEL_LOGOUT_EVENT = "http://schemas.openid.net/event/backchannel-logout"
+
+# Asymmetric signature algorithms accepted for token verification
+_SIGNING_ALGORITHMS = (ALGORITHMS.RSA_DS | ALGORITHMS.EC_DS) & ALGORITHMS.SUPPORTED
+
 
 class KeycloakAuthProvider:
     """
@@ -21,7 +48,32 @@ class KeycloakAuthProvider:
         realm: str,
         client_id: str,
         client_secret: Optional[str] = None,
-        verify_ssl: bool = True
+        verify_ssl: bool = True,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        introspection_cache_size: int = 10000,
+        introspection_cache_ttl: float = 60.0,
+        introspection_negative_ttl: float = 5.0,
+        claims_cache_size: int = 10000,
+        leeway: int = 0,
+        jwks_cache_duration: float = 3600.0,
+        jwks_min_refresh_interval: float = 10.0,
+        refresh_replay_window: float = 5.0,
+        discovery: bool = False,
+        snapshot_path: Optional[str] = None,
+        snapshot_key: Optional[str] = None,
+        snapshot_max_age: Optional[float] = 86400.0,
+        instrumentation: Optional[Instrumentation] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        revocations: Optional[RevocationList] = None,
+        cache_backend: Optional[CacheBackend] = None,
+        revocation_backend: Optional[CacheBackend] = None
     ):
         """
         Initialize Keycloak authentication provider
@@ -32,47 +84,576 @@ class KeycloakAuthProvider:
             client_id: Client ID for backend service
             client_secret: Client secret for confidential clients
             verify_ssl: Whether to verify SSL certificates
+            timeout: Default read/write/pool timeout in seconds for Keycloak calls
+            connect_timeout: Timeout in seconds for establishing a connection
+            max_connections: Maximum number of concurrent connections in the pool
+            max_keepalive_connections: Maximum idle keep-alive connections kept open
+            keepalive_expiry: Seconds an idle keep-alive connection is kept open
+            http2: Enable HTTP/2 (requires the ``httpx[http2]`` extra)
+            introspection_cache_size: Maximum cached introspection results (0 disables)
+            introspection_cache_ttl: Seconds an active result is reused, capped at token ``exp``
+            introspection_negative_ttl: Seconds an inactive result is reused
+            claims_cache_size: Maximum cached verified token claims (0 disables)
+            leeway: Clock skew in seconds tolerated for ``exp``/``nbf``/``iat``
+            jwks_cache_duration: Seconds the JWKS is fresh when Keycloak sends no
+                max-age, and the upper bound on an advertised max-age
+            jwks_min_refresh_interval: Minimum seconds between forced JWKS refreshes
+                triggered by an unknown ``kid``
+            refresh_replay_window: Seconds a completed refresh grant is replayed to
+                duplicate requests for the same refresh token (0 disables)
+            discovery: Read endpoints from ``.well-known/openid-configuration``
+                during ``bootstrap`` instead of relying on the built-in paths
+            snapshot_path: File persisting discovery metadata and the JWKS so
+                new workers can validate tokens before reaching Keycloak
+            snapshot_key: Secret authenticating the snapshot and the entries
+                of shared caches with an HMAC, defaults to one derived from
+                ``client_secret``; without either the snapshot is only
+                checked for corruption and shared caches are refused
+            snapshot_max_age: Seconds after it was written a snapshot is still
+                loaded (None accepts any age); refreshes rewrite it
+            instrumentation: Metrics/tracing backend (no-op by default)
+            transport: Custom httpx transport, e.g. an in-process Keycloak
+                stand-in for tests and benchmarks
+            circuit_breaker: Breaker failing Keycloak calls fast while Keycloak
+                is unavailable (default: opens after 5 consecutive failures)
+            concurrency_limiter: Adaptive limit on concurrent Keycloak calls
+                (default: AIMD between 1 and ``max_connections``)
+            revocations: Revoked sessions/tokens, fed by ``logout`` and
+                back-channel logout tokens (default: shared through
+                ``revocation_backend``)
+            cache_backend: Cache shared between worker processes (e.g.
+                SharedMemoryCache or RedisCache) for the JWKS, introspection
+                results and verified claims, behind per-process caches;
+                entries are signed with the snapshot key
+            revocation_backend: Store sharing revocations between workers;
+                it must never evict entries before they expire (e.g.
+                ``RedisCache(noeviction=True)``). Defaults to
+                ``cache_backend`` if that one does not evict, otherwise
+                revocations stay in the worker that received them
         """
         self.server_url = server_url.rstrip('/')
         self.realm = realm
         self.client_id = client_id
         self.client_secret = client_secret
         self.verify_ssl = verify_ssl
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise ImportError("http2=True requires the h2 package (pip install 'httpx[http2]')")
+        self.http2 = http2
+        self.transport = transport
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
 
-        # Build endpoints
+        # Build endpoints; discover() may replace them with the advertised ones
         self.realm_url = f"{self.server_url}/realms/{realm}"
+        self.issuer = self.realm_url
+        self.discovery_url = f"{self.realm_url}/.well-known/openid-configuration"
+        self.authorization_endpoint = f"{self.realm_url}/protocol/openid-connect/auth"
         self.token_endpoint = f"{self.realm_url}/protocol/openid-connect/token"
         self.userinfo_endpoint = f"{self.realm_url}/protocol/openid-connect/userinfo"
         self.introspect_endpoint = f"{self.realm_url}/protocol/openid-connect/token/introspect"
         self.logout_endpoint = f"{self.realm_url}/protocol/openid-connect/logout"
         self.jwks_uri = f"{self.realm_url}/protocol/openid-connect/certs"
+        self.discovery_enabled = discovery
+        self.discovery: Optional[Dict[str, Any]] = None
+        self.snapshot_path = snapshot_path
+        self.snapshot_max_age = snapshot_max_age
+        secret = snapshot_key or client_secret
+        self._snapshot_key = (
+            hashlib.sha256(f"keycloak-snapshot:{secret}".encode("utf-8")).digest() if secret else None
+        )
+        self._bootstrap_task: Optional[asyncio.Task] = None
+
+        # Shared entries are signed so that write access to the shared store
+        # is not enough to plant claims, introspection results or keys
+        if (cache_backend is not None or revocation_backend is not None) and self._snapshot_key is None:
+            raise ValueError("Shared cache backends require a snapshot_key or client_secret to sign entries")
+        shared_backend = SignedCache(cache_backend, self._snapshot_key) if cache_backend is not None else None
 
         # Cache for JWKS
         self._jwks_cache = None
-        self._jwks_cache_time = None
-        self._jwks_cache_duration = timedelta(hours=1)
+        self._jwks_etag: Optional[str] = None
+        self._jwks_expires_at = 0.0
+        self._jwks_cache_duration = jwks_cache_duration
+        self._jwks_min_refresh_interval = jwks_min_refresh_interval
+        self._jwks_last_forced_refresh = float("-inf")
+        self._jwks_refresh_task: Optional[asyncio.Task] = None
+        self._jwks_background_task: Optional[asyncio.Task] = None
+        self._signing_keys: Dict[str, Tuple[Key, str]] = {}
+        self._jwks_fetched_at = 0.0
+        self.jwks_cache = shared_backend.namespace("jwks") if shared_backend is not None else None
+
+        # Introspection results keyed by token digest
+        self.introspection_cache = self._build_cache(shared_backend, "introspection", introspection_cache_size)
+        self.introspection_cache_ttl = introspection_cache_ttl
+        self.introspection_negative_ttl = introspection_negative_ttl
+
+        # Verified claims keyed by token digest, valid until exp + leeway
+        self.claims_cache = self._build_cache(shared_backend, "claims", claims_cache_size)
+        self.leeway = leeway
+
+        # Coalesced refresh-token grants keyed by refresh token digest
+        self._refresh_inflight: Dict[str, asyncio.Task] = {}
+        self._refresh_results = TTLCache(maxsize=10000)
+        self.refresh_replay_window = refresh_replay_window
+
+        # client_credentials token manager, created on first access
+        self._service_account: Optional[ServiceAccountTokenManager] = None
+
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+
+        # Fail fast instead of piling up requests while Keycloak is degraded
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.concurrency_limiter = concurrency_limiter or AdaptiveConcurrencyLimiter(
+            initial_limit=min(20, max_connections),
+            max_limit=max_connections
+        )
+
+        # Sessions and tokens revoked by logouts, checked by KeycloakAuth. An
+        # evicting store would silently forget revocations, so it is not used
+        if revocation_backend is None and cache_backend is not None and not cache_backend.evicts:
+            revocation_backend = cache_backend
+        if revocations is None:
+            revocations = RevocationList(
+                shared=(
+                    SignedCache(revocation_backend, self._snapshot_key).namespace("revocations")
+                    if revocation_backend is not None else None
+                )
+            )
+            if cache_backend is not None and revocation_backend is None:
+                logger.warning(
+                    "cache_backend may evict entries, so revocations are not shared between "
+                    "workers; pass a non-evicting revocation_backend to share them"
+                )
+        self.revocations = revocations
+
+        # Shared connection pool, created lazily on first use
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def _build_cache(backend: Optional[CacheBackend], name: str, maxsize: int) -> CacheBackend:
+        """Per-process cache, tiered in front of the shared backend if any"""
+        local = TTLCache(maxsize=maxsize)
+        if backend is None or maxsize <= 0:
+            return local
+        return TieredCache(local, backend.namespace(name))
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Shared keep-alive HTTP client used for all Keycloak calls
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                verify=self.verify_ssl,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self.transport
+            )
+        return self._client
+
+    async def _request(
+        self,
+        operation: str,
+        method: str,
+        url: str,
+        ok_statuses: Tuple[int, ...] = (),
+        **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Send a request to Keycloak through the shared client
+
+        Calls pass the circuit breaker and the adaptive concurrency limit;
+        transport errors, timeouts, 5xx and 429 responses count as failures.
+
+        Args:
+            operation: Instrumentation operation name
+            method: HTTP method
+            url: Request URL
+            ok_statuses: Non-2xx statuses returned instead of raised
+            **kwargs: Passed to ``httpx.AsyncClient.request``
+
+        Returns:
+            Response
+
+        Raises:
+            httpx.HTTPStatusError: For unexpected error statuses
+            KeycloakUnavailableError: If the circuit is open or the
+                concurrency limit is saturated
+        """
+        with self.instrumentation.span(operation):
+            self.circuit_breaker.before_call()
+            try:
+                await self.concurrency_limiter.acquire()
+            except BaseException:
+                self.circuit_breaker.after_call(None)
+                raise
+            start = time.monotonic()
+            failed: Optional[bool] = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                failed = response.status_code >= 500 or response.status_code == 429
+                if response.status_code not in ok_statuses:
+                    response.raise_for_status()
+                return response
+            except Exception as e:
+                if failed is None:
+                    failed = is_unavailable(e)
+                raise
+            finally:
+                self.concurrency_limiter.release(time.monotonic() - start, failed)
+                self.circuit_breaker.after_call(failed)
+
+    async def aclose(self) -> None:
+        """
+        Stop background tasks, close the shared HTTP client and release
+        pooled connections
+        """
+        self.stop_background_refresh()
+        if self._bootstrap_task is not None:
+            self._bootstrap_task.cancel()
+            self._bootstrap_task = None
+        if self._service_account is not None:
+            self._service_account.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "KeycloakAuthProvider":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def resolve(self, token: str) -> "KeycloakAuthProvider":
+        """
+        Get the provider responsible for a token; a single-realm provider
+        always returns itself (see KeycloakProviderRegistry)
+        """
+        return self
+
+    async def discover(self) -> Dict[str, Any]:
+        """
+        Load endpoints from the realm's OpenID Connect discovery document
+
+        Returns:
+            Discovery metadata
+        """
+        response = await self._request("discovery", "GET", self.discovery_url)
+        self._apply_discovery(response.json())
+        self.save_snapshot()
+        return self.discovery
+
+    def _apply_discovery(self, metadata: Dict[str, Any]) -> None:
+        self.discovery = metadata
+        self.issuer = metadata.get("issuer", self.issuer)
+        self.authorization_endpoint = metadata.get("authorization_endpoint", self.authorization_endpoint)
+        self.token_endpoint = metadata.get("token_endpoint", self.token_endpoint)
+        self.userinfo_endpoint = metadata.get("userinfo_endpoint", self.userinfo_endpoint)
+        self.introspect_endpoint = metadata.get("introspection_endpoint", self.introspect_endpoint)
+        self.logout_endpoint = metadata.get("end_session_endpoint", self.logout_endpoint)
+        self.jwks_uri = metadata.get("jwks_uri", self.jwks_uri)
+
+    async def bootstrap(self) -> None:
+        """
+        Prepare the provider at startup
+
+        If a valid snapshot exists it is loaded so tokens can be validated
+        immediately, and Keycloak is revalidated in the background.
+        Otherwise discovery (if enabled) and the JWKS fetch are awaited;
+        failures are logged and retried lazily on the first request.
+        """
+        if self.load_snapshot():
+            self._bootstrap_task = asyncio.ensure_future(self._revalidate())
+            return
+
+        try:
+            await self._revalidate()
+        except Exception as e:
+            logger.error(f"Keycloak bootstrap failed: {e}")
+
+    async def _revalidate(self) -> None:
+        try:
+            if self.discovery_enabled:
+                await self.discover()
+            await self.refresh_jwks()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._jwks_cache is None:
+                raise
+            logger.warning(f"Keycloak revalidation failed, using snapshot: {e}")
+
+    def load_snapshot(self) -> bool:
+        """
+        Load discovery metadata and JWKS from ``snapshot_path``
+
+        The loaded key set is marked stale so the next request triggers a
+        background revalidation.
+
+        Returns:
+            True if a valid snapshot for this realm was loaded
+        """
+        if not self.snapshot_path:
+            return False
+
+        content = read_snapshot(self.snapshot_path, self._snapshot_key, self.snapshot_max_age)
+        if content is None:
+            return False
+        if content.get("realm_url") != self.realm_url or not content.get("jwks"):
+            logger.warning(f"Ignoring Keycloak snapshot {self.snapshot_path}: different realm")
+            return False
+
+        if content.get("discovery"):
+            self._apply_discovery(content["discovery"])
+        self._signing_keys = self._build_key_index(content["jwks"])
+        self._jwks_cache = content["jwks"]
+        self._jwks_etag = content.get("jwks_etag")
+        self._jwks_expires_at = 0.0
+        logger.info(f"Loaded Keycloak snapshot from {self.snapshot_path}")
+        return True
+
+    def save_snapshot(self) -> None:
+        """
+        Persist discovery metadata and JWKS to ``snapshot_path``
+        """
+        if not self.snapshot_path or self._jwks_cache is None:
+            return
+
+        try:
+            write_snapshot(self.snapshot_path, {
+                "realm_url": self.realm_url,
+                "discovery": self.discovery,
+                "jwks": self._jwks_cache,
+                "jwks_etag": self._jwks_etag
+            }, self._snapshot_key)
+        except OSError as e:
+            logger.warning(f"Could not write Keycloak snapshot {self.snapshot_path}: {e}")
 
     async def get_jwks(self) -> Dict[str, Any]:
         """
         Get JSON Web Key Set from Keycloak
+
+        A stale key set is served immediately while a single background
+        refresh runs; callers only wait when no key set has been loaded yet.
         """
-        now = datetime.utcnow()
-        if (self._jwks_cache is None or
-            self._jwks_cache_time is None or
-            now - self._jwks_cache_time > self._jwks_cache_duration):
+        if self._jwks_cache is None:
+            await self.refresh_jwks()
+        elif time.monotonic() >= self._jwks_expires_at:
+            self._start_jwks_refresh()
 
-            async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-                response = await client.get(self.jwks_uri)
-                response.raise_for_status()
-                self._jwks_cache = response.json()
-                self._jwks_cache_time = now
+        return self._jwks_cache
 
+    async def refresh_jwks(self, kid: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetch the JWKS now, joining a refresh that is already in flight
+
+        Args:
+            kid: Key ID that must be in the new key set; a shared key set
+                without it is not adopted and Keycloak is asked instead
+
+        Returns:
+            JSON Web Key Set
+        """
+        fetched = await asyncio.shield(self._start_jwks_refresh(kid))
+        if kid is not None and kid not in self._signing_keys and not fetched:
+            # The joined refresh only adopted another worker's key set
+            await asyncio.shield(self._start_jwks_refresh(kid))
         return self._jwks_cache
 
+    def _start_jwks_refresh(self, kid: Optional[str] = None) -> asyncio.Task:
+        """Return the in-flight JWKS refresh, starting one if needed"""
+        task = self._jwks_refresh_task
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._fetch_jwks(kid))
+            task.add_done_callback(self._log_jwks_refresh_failure)
+            self._jwks_refresh_task = task
+        return task
+
+    def _log_jwks_refresh_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"JWKS refresh failed: {task.exception()}")
+
+    async def _fetch_jwks(self, kid: Optional[str] = None) -> bool:
+        """
+        Fetch the JWKS, honouring ETag and Cache-Control from Keycloak
+
+        With a shared cache backend, a key set fetched more recently by
+        another worker is adopted without contacting Keycloak, unless it
+        lacks ``kid``: that worker may have fetched it before a rotation.
+
+        Args:
+            kid: Key ID the refresh was forced for
+
+        Returns:
+            True if Keycloak was asked, False if a shared key set was adopted
+        """
+        if self.jwks_cache is not None and self._adopt_shared_jwks(kid):
+            return False
+
+        headers = {}
+        if self._jwks_etag and self._jwks_cache is not None:
+            headers["If-None-Match"] = self._jwks_etag
+
+        try:
+            response = await self._request(
+                "jwks_fetch", "GET", self.jwks_uri, ok_statuses=(304,), headers=headers
+            )
+        except Exception:
+            # Back off so stale-cache readers do not retry on every request
+            self._jwks_expires_at = time.monotonic() + self._jwks_min_refresh_interval
+            raise
+
+        if response.status_code != 304:
+            jwks = response.json()
+            self._signing_keys = self._build_key_index(jwks)
+            self._jwks_cache = jwks
+            self._jwks_etag = response.headers.get("ETag")
+        # Rewritten on 304 too, so the snapshot's age is that of the last check
+        self.save_snapshot()
+
+        # Never keep a key set longer than configured, so rotations are picked
+        # up even if Keycloak or a proxy advertises a long max-age
+        max_age = _MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+        duration = self._jwks_cache_duration
+        if max_age:
+            duration = min(int(max_age.group(1)), duration)
+        self._jwks_expires_at = time.monotonic() + duration
+        self._jwks_fetched_at = time.time()
+
+        if self.jwks_cache is not None:
+            self.jwks_cache.set(self.jwks_uri, {
+                "jwks": self._jwks_cache,
+                "etag": self._jwks_etag,
+                "fetched_at": self._jwks_fetched_at
+            }, self._jwks_fetched_at + duration)
+        return True
+
+    def _adopt_shared_jwks(self, kid: Optional[str] = None) -> bool:
+        """Load a key set newer than ours, holding ``kid`` if given, from the shared cache"""
+        entry = self.jwks_cache.get_entry(self.jwks_uri)
+        if entry is None:
+            return False
+        shared, expires_at = entry
+        if shared["fetched_at"] <= self._jwks_fetched_at:
+            return False
+        if kid is not None and not any(key.get("kid") == kid for key in shared["jwks"].get("keys", [])):
+            return False
+
+        self._signing_keys = self._build_key_index(shared["jwks"])
+        self._jwks_cache = shared["jwks"]
+        self._jwks_etag = shared["etag"]
+        self._jwks_fetched_at = shared["fetched_at"]
+        self._jwks_expires_at = time.monotonic() + (expires_at - time.time())
+        return True
+
+    def start_background_refresh(self) -> None:
+        """
+        Keep the JWKS fresh from a background task so requests never wait
+        on a key set fetch. Must be called from a running event loop.
+        """
+        task = self._jwks_background_task
+        if task is None or task.done():
+            self._jwks_background_task = asyncio.ensure_future(self._background_refresh())
+
+    def stop_background_refresh(self) -> None:
+        """Cancel the background JWKS refresh task"""
+        if self._jwks_background_task is not None:
+            self._jwks_background_task.cancel()
+            self._jwks_background_task = None
+
+    async def _background_refresh(self) -> None:
+        while True:
+            try:
+                await self.refresh_jwks()
+                delay = self._jwks_expires_at - time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already logged by the refresh task; retry soon
+                delay = self._jwks_min_refresh_interval
+            await asyncio.sleep(max(delay, self._jwks_min_refresh_interval))
+
+    @staticmethod
+    def _build_key_index(jwks: Dict[str, Any]) -> Dict[str, Tuple[Key, str]]:
+        """
+        Construct public key objects for every signing key in a JWKS
+
+        Args:
+            jwks: JSON Web Key Set
+
+        Returns:
+            Mapping of kid to (constructed key, pinned algorithm)
+        """
+        index = {}
+        for key_data in jwks.get("keys", []):
+            kid = key_data.get("kid")
+            if not kid or key_data.get("use", "sig") != "sig":
+                continue
+
+            kty = key_data.get("kty")
+            algorithm = key_data.get("alg") or _DEFAULT_ALGORITHMS.get(
+                (kty, key_data.get("crv"))
+            )
+            if algorithm not in _SIGNING_ALGORITHMS:
+                logger.warning(f"Skipping JWK {kid}: unsupported algorithm {algorithm}")
+                continue
+
+            try:
+                index[kid] = (jwk.construct(key_data, algorithm), algorithm)
+            except Exception as e:
+                logger.warning(f"Skipping JWK {kid}: {e}")
+
+        return index
+
+    async def get_signing_key(self, kid: str) -> Tuple[Key, str]:
+        """
+        Get the constructed public key and its algorithm for a key ID
+
+        Args:
+            kid: Key ID from the token header
+
+        Returns:
+            Tuple of (public key, algorithm)
+
+        Raises:
+            JWTError: If no signing key matches
+        """
+        await self.get_jwks()
+
+        signing_key = self._signing_keys.get(kid)
+        if signing_key is None:
+            # The key may have just been rotated; refetch, but rate-limited so
+            # tokens with bogus kids cannot hammer the certs endpoint
+            now = time.monotonic()
+            if now - self._jwks_last_forced_refresh >= self._jwks_min_refresh_interval:
+                self._jwks_last_forced_refresh = now
+                try:
+                    await self.refresh_jwks(kid)
+                except Exception as e:
+                    logger.warning(f"Forced JWKS refresh failed: {e}")
+                signing_key = self._signing_keys.get(kid)
+
+        if signing_key is None:
+            raise JWTError("Unable to find appropriate key")
+
+        return signing_key
+
     async def verify_token(self, token: str) -> Dict[str, Any]:
         """
         Verify and decode a JWT token
 
+        Successfully verified claims are cached by token digest until the
+        token expires, so repeated tokens skip signature verification. The
+        returned mapping is shared between callers and must not be mutated.
+
         Args:
             token: JWT access token
 
@@ -82,58 +663,132 @@ class KeycloakAuthProvider:
         Raises:
             JWTError: If token is invalid
         """
-        # Get JWKS for verification
-        jwks = await self.get_jwks()
+        cache_key = token_digest(token)
+        cached = self.claims_cache.get(cache_key)
+        self.instrumentation.cache_lookup("claims", cached is not None)
+        if cached is not None:
+            return cached
 
-        # Decode and verify token
+        # Decode and verify token with the key pinned to its JWK algorithm
         unverified_header = jwt.get_unverified_header(token)
+        key, algorithm = await self.get_signing_key(unverified_header.get("kid"))
 
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                break
-
-        if not rsa_key:
-            raise JWTError("Unable to find appropriate key")
+        with self.instrumentation.span("verify_signature"):
+            payload = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.client_id,
+                issuer=self.issuer,
+                options={"leeway": self.leeway}
+            )
+
+        if "exp" in payload:
+            self.claims_cache.set(cache_key, payload, payload["exp"] + self.leeway)
 
-        payload = jwt.decode(
-            token,
-            rsa_key,
-            algorithms=["RS256"],
+        return payload
+
+    async def verify_logout_token(self, logout_token: str) -> Dict[str, Any]:
+        """
+        Verify an OIDC back-channel logout token
+
+        Args:
+            logout_token: Logout token posted by Keycloak
+
+        Returns:
+            Decoded logout token claims
+
+        Raises:
+            JWTError: If the token is invalid or is not a logout token
+        """
+        unverified_header = jwt.get_unverified_header(logout_token)
+        key, algorithm = await self.get_signing_key(unverified_header.get("kid"))
+        claims = jwt.decode(
+            logout_token,
+            key,
+            algorithms=[algorithm],
             audience=self.client_id,
-            issuer=self.realm_url
+            issuer=self.issuer,
+            options={"leeway": self.leeway}
         )
 
-        return payload
+        if _BACKCHANNEL_LOGOUT_EVENT not in (claims.get("events") or {}):
+            raise JWTError("Missing back-channel logout event")
+        if "nonce" in claims:
+            raise JWTError("Logout token must not contain a nonce")
+        if not claims.get("sid") and not claims.get("sub"):
+            raise JWTError("Logout token has neither sid nor sub")
+        return claims
+
+    async def handle_logout_token(self, logout_token: str) -> Dict[str, Any]:
+        """
+        Verify a back-channel logout token and revoke its session, or every
+        token of its subject issued until now when it carries no ``sid``
+
+        Args:
+            logout_token: Logout token posted by Keycloak
+
+        Returns:
+            Decoded logout token claims
+
+        Raises:
+            JWTError: If the token is invalid
+        """
+        claims = await self.verify_logout_token(logout_token)
+        if claims.get("sid"):
+            self.revocations.revoke_session(claims["sid"])
+        else:
+            self.revocations.revoke_subject(claims["sub"], claims.get("iat"))
+        logger.info(f"Back-channel logout for {'session' if claims.get('sid') else 'subject'} "
+                    f"{claims.get('sid') or claims['sub']}")
+        return claims
 
     async def introspect_token(self, token: str) -> Dict[str, Any]:
         """
         Introspect a token to check if it's active
 
+        Results are cached by token digest. Active results are reused for at
+        most ``introspection_cache_ttl`` seconds and never past the token's
+        ``exp``; inactive results are reused for ``introspection_negative_ttl``.
+
         Args:
             token: Access token to introspect
 
         Returns:
             Token introspection response
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            response = await client.post(
-                self.introspect_endpoint,
-                data={
-                    "token": token,
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret
-                }
-            )
-            response.raise_for_status()
-            return response.json()
+        key = token_digest(token)
+        cached = self.introspection_cache.get(key)
+        self.instrumentation.cache_lookup("introspection", cached is not None)
+        if cached is not None:
+            return cached
+
+        result = await self._introspect_token(token)
+
+        now = time.time()
+        if result.get("active"):
+            expires_at = now + self.introspection_cache_ttl
+            if "exp" in result:
+                expires_at = min(expires_at, result["exp"])
+        else:
+            expires_at = now + self.introspection_negative_ttl
+        self.introspection_cache.set(key, result, expires_at)
+
+        return result
+
+    async def _introspect_token(self, token: str) -> Dict[str, Any]:
+        """Call the Keycloak introspection endpoint"""
+        response = await self._request(
+            "introspection",
+            "POST",
+            self.introspect_endpoint,
+            data={
+                "token": token,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret
+            }
+        )
+        return response.json()
 
     async def exchange_code_for_token(
         self,
@@ -165,24 +820,51 @@ class KeycloakAuthProvider:
         if code_verifier:
             data["code_verifier"] = code_verifier
 
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            response = await client.post(
-                self.token_endpoint,
-                data=data
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request(
+            "token",
+            "POST",
+            self.token_endpoint,
+            data=data
+        )
+        return response.json()
 
     async def refresh_token(self, refresh_token: str) -> Dict[str, Any]:
         """
         Refresh access token using refresh token
 
+        Concurrent calls with the same refresh token share a single grant,
+        and its result is replayed to duplicates arriving within
+        ``refresh_replay_window`` seconds. This keeps several browser tabs or
+        a retrying client from burning a rotated refresh token.
+
         Args:
             refresh_token: Refresh token
 
         Returns:
             New token response
         """
+        key = token_digest(refresh_token)
+        replayed = self._refresh_results.get(key)
+        if replayed is not None:
+            return replayed
+
+        task = self._refresh_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh_token(refresh_token))
+            self._refresh_inflight[key] = task
+            task.add_done_callback(lambda t: self._finish_refresh(key, t))
+
+        return await asyncio.shield(task)
+
+    def _finish_refresh(self, key: str, task: asyncio.Task) -> None:
+        """Drop a completed grant from the in-flight map and keep it for replay"""
+        self._refresh_inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._refresh_results.set(key, task.result(), time.time() + self.refresh_replay_window)
+
+    async def _refresh_token(self, refresh_token: str) -> Dict[str, Any]:
+        """Call the token endpoint with a refresh_token grant"""
         data = {
             "grant_type": "refresh_token",
             "refresh_token": refresh_token,
@@ -192,13 +874,49 @@ class KeycloakAuthProvider:
         if self.client_secret:
             data["client_secret"] = self.client_secret
 
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            response = await client.post(
-                self.token_endpoint,
-                data=data
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request(
+            "token",
+            "POST",
+            self.token_endpoint,
+            data=data
+        )
+        return response.json()
+
+    async def client_credentials_token(self, scope: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Obtain a service-account token with the client_credentials grant
+
+        Args:
+            scope: Optional space separated scopes
+
+        Returns:
+            Token response with access_token, expires_in, etc.
+        """
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }
+
+        if scope:
+            data["scope"] = scope
+
+        response = await self._request(
+            "token",
+            "POST",
+            self.token_endpoint,
+            data=data
+        )
+        return response.json()
+
+    @property
+    def service_account(self) -> ServiceAccountTokenManager:
+        """
+        Shared token manager for this client's service account
+        """
+        if self._service_account is None:
+            self._service_account = ServiceAccountTokenManager(self)
+        return self._service_account
 
     async def get_user_info(self, access_token: str) -> Dict[str, Any]:
         """
@@ -210,13 +928,13 @@ class KeycloakAuthProvider:
         Returns:
             User information
         """
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            response = await client.get(
-                self.userinfo_endpoint,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._request(
+            "userinfo",
+            "GET",
+            self.userinfo_endpoint,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        return response.json()
 
     async def logout(
         self,
@@ -241,12 +959,22 @@ class KeycloakAuthProvider:
         if redirect_uri:
             data["redirect_uri"] = redirect_uri
 
-        async with httpx.AsyncClient(verify=self.verify_ssl) as client:
-            response = await client.post(
-                self.logout_endpoint,
-                data=data
-            )
-            response.raise_for_status()
+        await self._request(
+            "logout",
+            "POST",
+            self.logout_endpoint,
+            data=data
+        )
+
+        # Keycloak refresh tokens are HMAC-signed with a realm secret, so the
+        # session id is read unverified once Keycloak has accepted the logout
+        try:
+            claims = jwt.get_unverified_claims(refresh_token)
+        except JWTError:
+            return
+        sid = claims.get("sid") or claims.get("session_state")
+        if sid:
+            self.revocations.revoke_session(sid)
 
     def get_authorization_url(
         self,
@@ -284,7 +1012,7 @@ class KeycloakAuthProvider:
             params["code_challenge_method"] = code_challenge_method
 
         query_string = "&".join(f"{k}={v}" for k, v in params.items())
-        return f"{self.realm_url}/protocol/openid-connect/auth?{query_string}"
+        return f"{self.authorization_endpoint}?{query_string}"
 
     def extract_roles(self, token_claims: Dict[str, Any]) -> List[str]:
         """
@@ -296,16 +1024,15 @@ class KeycloakAuthProvider:
         Returns:
             List of role names
         """
-        roles = []
+        roles = set()
 
         # Extract realm roles
         if "realm_access" in token_claims:
-            roles.extend(token_claims["realm_access"].get("roles", []))
+            roles.update(token_claims["realm_access"].get("roles", ()))
 
         # Extract client roles
         if "resource_access" in token_claims:
             if self.client_id in token_claims["resource_access"]:
-                client_roles = token_claims["resource_access"][self.client_id].get("roles", [])
-                roles.extend(client_roles)
+                roles.update(token_claims["resource_access"][self.client_id].get("roles", ()))
 
-        return list(set(roles))  # Remove duplicates
\ No newline at end of file
+        return list(roles)
\ No newline at end of file
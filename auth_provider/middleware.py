@@ -0,0 +1,127 @@
+"""
+ASGI middleware that authenticates requests once at the transport layer
+"""
+from typing import Optional, Iterable, Pattern
+import logging
+import re
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .fastapi_integration import KeycloakAuth
+
+logger = logging.getLogger(__name__)
+
+
+def compile_path_matcher(patterns: Iterable[str]) -> Optional[Pattern]:
+    """
+    Compile path patterns into a single regular expression
+
+    Patterns are exact paths, or prefixes when they end with ``*``
+    (e.g. ``/docs*``).
+
+    Args:
+        patterns: Path patterns
+
+    Returns:
+        Compiled pattern to use with ``fullmatch``, or None if no patterns
+    """
+    alternatives = []
+    for pattern in patterns:
+        if pattern.endswith("*"):
+            alternatives.append(re.escape(pattern[:-1]) + ".*")
+        else:
+            alternatives.append(re.escape(pattern))
+
+    if not alternatives:
+        return None
+    return re.compile("|".join(alternatives))
+
+
+class KeycloakAuthMiddleware:
+    """
+    Pure ASGI authentication middleware
+
+    Validates the bearer token once per HTTP request using ``auth`` and
+    stores the result in ``scope["state"]["user"]`` (``request.state.user``).
+    Requests to ``exclude_paths`` are passed through untouched. On
+    ``optional_paths`` a missing or invalid token leaves the user as None
+    instead of rejecting the request.
+
+    Routes read the result with ``get_principal`` / ``get_optional_principal``;
+    ``auth.get_current_user`` also reuses it instead of verifying again.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        auth: KeycloakAuth,
+        exclude_paths: Iterable[str] = (),
+        optional_paths: Iterable[str] = ()
+    ):
+        """
+        Args:
+            app: Wrapped ASGI application
+            auth: Authentication dependency whose policy is applied
+            exclude_paths: Paths that skip authentication entirely
+            optional_paths: Paths where authentication is optional
+        """
+        self.app = app
+        self.auth = auth
+        self._excluded = compile_path_matcher(exclude_paths)
+        self._optional = compile_path_matcher(optional_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if self._excluded is not None and self._excluded.fullmatch(path):
+            await self.app(scope, receive, send)
+            return
+
+        optional = self._optional is not None and self._optional.fullmatch(path) is not None
+        state = scope.setdefault("state", {})
+        state["auth"] = self.auth
+        state["user"] = None
+
+        token = self._get_bearer_token(scope)
+        if token is None:
+            if not optional:
+                await self._reject(scope, receive, send, HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Authorization header missing",
+                    headers={"WWW-Authenticate": "Bearer"},
+                ))
+                return
+        else:
+            try:
+                state["user"] = await self.auth.authenticate(token)
+            except HTTPException as e:
+                if not optional:
+                    await self._reject(scope, receive, send, e)
+                    return
+                logger.warning(f"Optional auth failed: {e.detail}")
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _get_bearer_token(scope: Scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and credentials:
+                    return credentials
+                return None
+        return None
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, error: HTTPException) -> None:
+        response = JSONResponse(
+            {"detail": error.detail},
+            status_code=error.status_code,
+            headers=error.headers
+        )
+        await response(scope, receive, send)
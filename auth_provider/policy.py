@@ -0,0 +1,267 @@
+"""
+Role policy engine compiling role expressions into bitmask checks
+"""
+from typing import Optional, Dict, Iterable, List, Tuple, FrozenSet
+import json
+import re
+
+from .principal import Principal
+
+# Separator between client ID and role name in client role references
+CLIENT_ROLE_SEPARATOR = ":"
+
+_TOKEN_PATTERN = re.compile(r"\s*(?:([()|&!])|([A-Za-z0-9_.\-]+(?::[A-Za-z0-9_.\-]+)?))")
+
+# A term in disjunctive normal form: (required mask, forbidden mask)
+Term = Tuple[int, int]
+
+
+class PolicyError(ValueError):
+    """Raised when a role policy expression is invalid"""
+
+
+class RoleIndex:
+    """
+    Assigns one bit to every known role
+
+    Realm roles (and roles of the backend's own client, which the principal
+    merges into its roles) use their plain name. Other client roles are
+    addressed as ``client:role``.
+    """
+
+    def __init__(self, roles: Iterable[str]):
+        """
+        Args:
+            roles: Role names, client roles as ``client:role``
+        """
+        self._bits: Dict[str, int] = {}
+        for role in roles:
+            if role not in self._bits:
+                self._bits[role] = 1 << len(self._bits)
+        self.has_client_roles = any(CLIENT_ROLE_SEPARATOR in role for role in self._bits)
+        self._mask_cache: Dict[FrozenSet[str], int] = {}
+
+    @classmethod
+    def from_realm_export(cls, path: str, client_id: Optional[str] = None) -> "RoleIndex":
+        """
+        Build an index from a Keycloak realm export (e.g. realms/munistream-realm.json)
+
+        Args:
+            path: Path to the realm JSON file
+            client_id: Backend client whose roles the principal merges into
+                its plain roles; they are indexed by plain name as well
+
+        Returns:
+            Role index with realm roles and ``client:role`` client roles
+        """
+        with open(path) as f:
+            realm = json.load(f)
+
+        roles = [role["name"] for role in realm.get("roles", {}).get("realm", [])]
+        for client, client_roles in realm.get("roles", {}).get("client", {}).items():
+            roles.extend(f"{client}{CLIENT_ROLE_SEPARATOR}{role['name']}" for role in client_roles)
+            if client == client_id:
+                roles.extend(role["name"] for role in client_roles)
+        return cls(roles)
+
+    @property
+    def roles(self) -> List[str]:
+        return list(self._bits)
+
+    def __contains__(self, role: str) -> bool:
+        return role in self._bits
+
+    def bit(self, role: str) -> int:
+        """
+        Get the bit for a role
+
+        Raises:
+            PolicyError: If the role is not in the index
+        """
+        try:
+            return self._bits[role]
+        except KeyError:
+            raise PolicyError(f"Unknown role: {role}")
+
+    def mask(self, principal: Principal) -> int:
+        """
+        Compute the role bitmask of a principal
+
+        Masks of plain role sets are memoised, so principals sharing the same
+        roles cost a single dict lookup. Roles unknown to the index are ignored.
+        """
+        roles = principal.roles
+        mask = self._mask_cache.get(roles)
+        if mask is None:
+            mask = 0
+            for role in roles:
+                mask |= self._bits.get(role, 0)
+            if len(self._mask_cache) >= 4096:
+                self._mask_cache.clear()
+            self._mask_cache[roles] = mask
+
+        if self.has_client_roles:
+            for client, client_roles in principal.client_roles.items():
+                for role in client_roles:
+                    mask |= self._bits.get(f"{client}{CLIENT_ROLE_SEPARATOR}{role}", 0)
+
+        return mask
+
+
+class CompiledPolicy:
+    """
+    Role expression compiled to disjunctive normal form over role bits
+
+    A principal satisfies the policy when, for any term, it holds every
+    required role and none of the forbidden ones.
+    """
+
+    __slots__ = ("expression", "index", "terms", "roles")
+
+    def __init__(self, expression: str, index: RoleIndex, terms: List[Term], roles: List[str]):
+        self.expression = expression
+        self.index = index
+        self.terms = tuple(terms)
+        self.roles = tuple(roles)
+
+    def evaluate_mask(self, mask: int) -> bool:
+        for required, forbidden in self.terms:
+            if mask & required == required and not mask & forbidden:
+                return True
+        return False
+
+    def evaluate(self, principal: Principal) -> bool:
+        """Check whether a principal satisfies the policy"""
+        return self.evaluate_mask(self.index.mask(principal))
+
+    def __repr__(self) -> str:
+        return f"CompiledPolicy({self.expression!r})"
+
+
+def compile_policy(expression: str, index: Optional[RoleIndex] = None) -> CompiledPolicy:
+    """
+    Compile a role expression
+
+    Supports role names, ``client:role`` references, ``!`` (not), ``&`` (and),
+    ``|`` (or) and parentheses, e.g. ``(approver | admin) & !suspended``.
+
+    Args:
+        expression: Role expression
+        index: Role index; when omitted an index of the roles referenced by the
+            expression is used and role names are not validated
+
+    Returns:
+        Compiled policy
+
+    Raises:
+        PolicyError: If the expression is malformed, references a role that is
+            not in ``index``, or can never be satisfied
+    """
+    tokens = _tokenize(expression)
+    if index is None:
+        index = RoleIndex(value for kind, value in tokens if kind == "role")
+
+    parser = _Parser(tokens, index)
+    tree = parser.parse()
+
+    terms = [term for term in _to_dnf(tree, False) if not term[0] & term[1]]
+    if not terms:
+        raise PolicyError(f"Policy can never be satisfied: {expression}")
+
+    roles = [value for kind, value in tokens if kind == "role"]
+    return CompiledPolicy(expression, index, terms, roles)
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            raise PolicyError(f"Invalid character at position {position} in policy: {expression}")
+        operator, role = match.groups()
+        tokens.append(("op", operator) if operator else ("role", role))
+        position = match.end()
+    if not tokens:
+        raise PolicyError("Empty policy expression")
+    return tokens
+
+
+# Parse tree nodes: ("role", bit) | ("not", node) | ("and", a, b) | ("or", a, b)
+Node = tuple
+
+
+class _Parser:
+    """Recursive descent parser; precedence is ! over & over |"""
+
+    def __init__(self, tokens: List[Tuple[str, str]], index: RoleIndex):
+        self.tokens = tokens
+        self.index = index
+        self.position = 0
+
+    def parse(self) -> Node:
+        node = self._or()
+        if self.position != len(self.tokens):
+            raise PolicyError(f"Unexpected token: {self.tokens[self.position][1]}")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        if self.position < len(self.tokens) and self.tokens[self.position][0] == "op":
+            return self.tokens[self.position][1]
+        return None
+
+    def _or(self) -> Node:
+        node = self._and()
+        while self._peek() == "|":
+            self.position += 1
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self) -> Node:
+        node = self._not()
+        while self._peek() == "&":
+            self.position += 1
+            node = ("and", node, self._not())
+        return node
+
+    def _not(self) -> Node:
+        if self._peek() == "!":
+            self.position += 1
+            return ("not", self._not())
+        return self._atom()
+
+    def _atom(self) -> Node:
+        if self.position >= len(self.tokens):
+            raise PolicyError("Unexpected end of policy expression")
+
+        kind, value = self.tokens[self.position]
+        self.position += 1
+        if kind == "role":
+            return ("role", self.index.bit(value))
+        if value == "(":
+            node = self._or()
+            if self._peek() != ")":
+                raise PolicyError("Missing closing parenthesis")
+            self.position += 1
+            return node
+        raise PolicyError(f"Unexpected token: {value}")
+
+
+def _to_dnf(node: Node, negate: bool) -> List[Term]:
+    kind = node[0]
+    if kind == "role":
+        return [(0, node[1])] if negate else [(node[1], 0)]
+    if kind == "not":
+        return _to_dnf(node[1], not negate)
+
+    left = _to_dnf(node[1], negate)
+    right = _to_dnf(node[2], negate)
+    # De Morgan: a negated "and" becomes an "or" and vice versa
+    if (kind == "or") != negate:
+        return left + right
+    return [
+        (l_required | r_required, l_forbidden | r_forbidden)
+        for l_required, l_forbidden in left
+        for r_required, r_forbidden in right
+    ]
@@ -0,0 +1,151 @@
+"""
+Authenticated principal built from verified token claims
+"""
+from typing import Optional, Dict, Any, FrozenSet, Iterator, Protocol
+from collections.abc import Mapping
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+# Separator between client ID and role name in expanded role names
+_CLIENT_ROLE_SEPARATOR = ":"
+
+
+class RoleExpander(Protocol):
+    """Expands token roles and groups to effective roles (see RoleHierarchyResolver)"""
+
+    def expand(self, roles: FrozenSet[str], groups: FrozenSet[str]) -> FrozenSet[str]:
+        ...
+
+
+# Keys exposed through dict-style access, mirroring the former user dict
+_KEYS = ("sub", "email", "username", "name", "roles", "email_verified", "token_claims")
+
+
+class Principal(Mapping):
+    """
+    Immutable, slotted view over verified token claims
+
+    Only references the claims mapping; roles are computed on first access
+    and then memoised. Supports read-only dict-style access
+    (``principal["username"]``, ``principal.get("roles")``) with the keys of
+    the user dict previously returned by ``get_current_user``.
+    """
+
+    __slots__ = ("token_claims", "client_id", "role_expander", "_realm_roles", "_client_roles", "_roles")
+
+    def __init__(
+        self,
+        token_claims: Dict[str, Any],
+        client_id: str,
+        role_expander: Optional[RoleExpander] = None
+    ):
+        """
+        Args:
+            token_claims: Verified token claims
+            client_id: Client whose roles are merged into ``roles``
+            role_expander: Optional composite-role and group expander
+        """
+        object.__setattr__(self, "token_claims", token_claims)
+        object.__setattr__(self, "client_id", client_id)
+        object.__setattr__(self, "role_expander", role_expander)
+        object.__setattr__(self, "_realm_roles", None)
+        object.__setattr__(self, "_client_roles", None)
+        object.__setattr__(self, "_roles", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Principal is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("Principal is immutable")
+
+    @property
+    def sub(self) -> Optional[str]:
+        return self.token_claims.get("sub")
+
+    @property
+    def email(self) -> Optional[str]:
+        return self.token_claims.get("email")
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.token_claims.get("preferred_username")
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.token_claims.get("name")
+
+    @property
+    def email_verified(self) -> bool:
+        return self.token_claims.get("email_verified", False)
+
+    @property
+    def realm_roles(self) -> FrozenSet[str]:
+        """Realm roles from ``realm_access`` (expanded if an expander is set), computed once"""
+        if self._realm_roles is None:
+            self._resolve_roles()
+        return self._realm_roles
+
+    @property
+    def roles(self) -> FrozenSet[str]:
+        """Realm roles plus roles of ``client_id``, computed once"""
+        roles = self._roles
+        if roles is None:
+            roles = self.realm_roles | self.client_roles.get(self.client_id, _EMPTY)
+            object.__setattr__(self, "_roles", roles)
+        return roles
+
+    @property
+    def client_roles(self) -> Dict[str, FrozenSet[str]]:
+        """Roles per client from ``resource_access`` (expanded if an expander is set), computed once"""
+        if self._client_roles is None:
+            self._resolve_roles()
+        return self._client_roles
+
+    def _resolve_roles(self) -> None:
+        claims = self.token_claims
+        realm_access = claims.get("realm_access")
+        realm_roles = frozenset(realm_access.get("roles", ())) if realm_access else _EMPTY
+        resource_access = claims.get("resource_access") or {}
+        client_roles = {
+            client: frozenset(access.get("roles", ()))
+            for client, access in resource_access.items()
+        }
+
+        if self.role_expander is not None:
+            names = set(realm_roles)
+            for client, roles in client_roles.items():
+                names.update(f"{client}{_CLIENT_ROLE_SEPARATOR}{role}" for role in roles)
+            expanded = self.role_expander.expand(
+                frozenset(names), frozenset(claims.get("groups", ()))
+            )
+
+            realm = set()
+            by_client: Dict[str, set] = {}
+            for name in expanded:
+                client, separator, role = name.partition(_CLIENT_ROLE_SEPARATOR)
+                if separator:
+                    by_client.setdefault(client, set()).add(role)
+                else:
+                    realm.add(name)
+            realm_roles = frozenset(realm)
+            client_roles = {client: frozenset(roles) for client, roles in by_client.items()}
+
+        object.__setattr__(self, "_realm_roles", realm_roles)
+        object.__setattr__(self, "_client_roles", client_roles)
+
+    def has_role(self, role: str) -> bool:
+        return role in self.roles
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_KEYS)
+
+    def __len__(self) -> int:
+        return len(_KEYS)
+
+    def __repr__(self) -> str:
+        return f"Principal(sub={self.sub!r}, username={self.username!r})"
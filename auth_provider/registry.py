@@ -0,0 +1,154 @@
+"""
+Multi-realm provider registry dispatching tokens on their issuer
+"""
+from typing import Optional, Dict, Any, Iterable, Mapping, Union
+import logging
+
+from jose import jwt, JWTError
+
+from .cache import token_digest
+from .keycloak_provider import KeycloakAuthProvider
+
+logger = logging.getLogger(__name__)
+
+# Token digests remembered by resolve() before the map is reset
+_RESOLVED_TOKENS_SIZE = 4096
+
+
+class KeycloakProviderRegistry:
+    """
+    Registry of per-realm KeycloakAuthProvider instances
+
+    Tokens are routed to the provider of their (unverified) ``iss`` claim;
+    the provider then verifies the signature and checks that ``iss`` matches
+    its realm. Providers are created lazily on the first token of each
+    allowed realm and keep their own connection pool and key caches.
+
+    A registry can be passed to KeycloakAuth / OptionalAuth wherever a single
+    provider is accepted.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        realms: Union[Iterable[str], Mapping[str, Dict[str, Any]]],
+        **provider_options: Any
+    ):
+        """
+        Args:
+            server_url: Keycloak server URL (e.g., http://localhost:8180)
+            realms: Allow-list of realm names, or a mapping of realm name to
+                provider arguments overriding ``provider_options`` for that
+                realm (e.g. its ``client_id`` and ``client_secret``)
+            **provider_options: Default KeycloakAuthProvider arguments
+                (``client_id``, ``client_secret``, cache sizes, ...)
+        """
+        self.server_url = server_url.rstrip('/')
+        if isinstance(realms, Mapping):
+            self._realm_options = {realm: dict(options) for realm, options in realms.items()}
+        else:
+            self._realm_options = {realm: {} for realm in realms}
+        self.provider_options = provider_options
+        self.instrumentation = provider_options.get("instrumentation")
+
+        self._issuer_prefix = f"{self.server_url}/realms/"
+        self._by_issuer: Dict[str, KeycloakAuthProvider] = {}
+        self._by_token: Dict[str, KeycloakAuthProvider] = {}
+        self._background_refresh = False
+
+    @property
+    def realms(self) -> Iterable[str]:
+        """Allowed realm names"""
+        return self._realm_options.keys()
+
+    @property
+    def providers(self) -> Iterable[KeycloakAuthProvider]:
+        """Providers created so far"""
+        return self._by_issuer.values()
+
+    def get_provider(self, realm: str) -> KeycloakAuthProvider:
+        """
+        Get (creating on first use) the provider for an allowed realm
+
+        Raises:
+            KeyError: If the realm is not in the allow-list
+        """
+        issuer = f"{self._issuer_prefix}{realm}"
+        provider = self._by_issuer.get(issuer)
+        if provider is None:
+            options = {**self.provider_options, **self._realm_options[realm]}
+            provider = KeycloakAuthProvider(server_url=self.server_url, realm=realm, **options)
+            self._by_issuer[issuer] = provider
+            logger.info(f"Registered Keycloak provider for realm {realm}")
+            if self._background_refresh:
+                provider.start_background_refresh()
+        return provider
+
+    def resolve(self, token: str) -> KeycloakAuthProvider:
+        """
+        Get the provider responsible for a token
+
+        Recently resolved tokens are remembered by digest, so repeated
+        tokens skip decoding their claims.
+
+        Args:
+            token: Encoded JWT
+
+        Returns:
+            Provider of the token's issuer
+
+        Raises:
+            JWTError: If the token is malformed or its issuer is not allowed
+        """
+        digest = token_digest(token)
+        provider = self._by_token.get(digest)
+        if provider is not None:
+            return provider
+
+        issuer = jwt.get_unverified_claims(token).get("iss")
+        provider = self._by_issuer.get(issuer)
+        if provider is None:
+            if not isinstance(issuer, str) or not issuer.startswith(self._issuer_prefix):
+                raise JWTError(f"Untrusted token issuer: {issuer}")
+            realm = issuer[len(self._issuer_prefix):]
+            if realm not in self._realm_options:
+                raise JWTError(f"Untrusted token issuer: {issuer}")
+            provider = self.get_provider(realm)
+
+        if len(self._by_token) >= _RESOLVED_TOKENS_SIZE:
+            self._by_token.clear()
+        self._by_token[digest] = provider
+        return provider
+
+    async def verify_token(self, token: str) -> Dict[str, Any]:
+        """Verify a token with the provider of its issuer"""
+        return await self.resolve(token).verify_token(token)
+
+    async def introspect_token(self, token: str) -> Dict[str, Any]:
+        """Introspect a token with the provider of its issuer"""
+        return await self.resolve(token).introspect_token(token)
+
+    async def handle_logout_token(self, logout_token: str) -> Dict[str, Any]:
+        """Apply a back-channel logout token with the provider of its issuer"""
+        return await self.resolve(logout_token).handle_logout_token(logout_token)
+
+    def start_background_refresh(self) -> None:
+        """
+        Keep JWKS fresh for every provider, including ones created later.
+        Must be called from a running event loop.
+        """
+        self._background_refresh = True
+        for provider in self._by_issuer.values():
+            provider.start_background_refresh()
+
+    async def aclose(self) -> None:
+        """Close every provider's HTTP client and background tasks"""
+        self._background_refresh = False
+        for provider in self._by_issuer.values():
+            await provider.aclose()
+
+    async def __aenter__(self) -> "KeycloakProviderRegistry":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
@@ -0,0 +1,254 @@
+"""
+Circuit breaker and adaptive concurrency limit for outbound Keycloak calls
+"""
+from typing import Optional, Deque
+from collections import deque
+import asyncio
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class KeycloakUnavailableError(Exception):
+    """A Keycloak call was rejected locally because Keycloak is failing or saturated"""
+
+
+class CircuitOpenError(KeycloakUnavailableError):
+    """The circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimitExceeded(KeycloakUnavailableError):
+    """No concurrency slot became free within the queue timeout"""
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """
+    Whether an exception means Keycloak is unavailable, as opposed to
+    rejecting the request itself (e.g. an invalid grant or an expired token)
+    """
+    if isinstance(exc, (KeycloakUnavailableError, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status_code = exc.response.status_code
+        return status_code >= 500 or status_code == 429
+    return False
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with half-open probing
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast with CircuitOpenError. Once ``recovery_timeout`` has
+    elapsed the circuit is half-open: up to ``half_open_max_calls`` probe
+    calls go through, and the first verdict closes or re-opens it.
+
+    Only unavailability (transport errors, timeouts, 5xx and 429) counts as
+    a failure; any other response proves Keycloak is answering.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before probing
+            half_open_max_calls: Concurrent probe calls while half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the circuit is probed again (0 unless open)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def before_call(self) -> None:
+        """
+        Admit a call or fail fast
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all
+                probe slots taken
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return
+        raise CircuitOpenError("Keycloak circuit breaker is open", self.retry_after)
+
+    def after_call(self, failed: Optional[bool]) -> None:
+        """
+        Record the outcome of an admitted call
+
+        Args:
+            failed: True if Keycloak was unavailable, False if it answered,
+                None if the call was abandoned (e.g. cancelled) without a verdict
+        """
+        if self._state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+        if failed is None:
+            return
+
+        if not failed:
+            if self._state != self.CLOSED:
+                logger.info("Keycloak circuit breaker closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            return
+
+        self._failures += 1
+        if self._state == self.HALF_OPEN or (
+            self._state == self.CLOSED and self._failures >= self.failure_threshold
+        ):
+            logger.warning(f"Keycloak circuit breaker opened after {self._failures} consecutive failures")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent outbound Keycloak calls
+
+    The limit grows by one per window of successful calls answered within
+    ``latency_threshold`` and shrinks by ``backoff_ratio`` on every failure
+    or slow call, so a degrading Keycloak gets less concurrent load instead
+    of a growing pile of pending requests. Calls over the limit wait up to
+    ``queue_timeout`` seconds for a slot and then fail fast with
+    ConcurrencyLimitExceeded.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        latency_threshold: float = 1.0,
+        backoff_ratio: float = 0.9,
+        queue_timeout: float = 1.0,
+        max_queue: int = 1000
+    ):
+        """
+        Args:
+            initial_limit: Starting concurrency limit
+            min_limit: Lower bound of the limit
+            max_limit: Upper bound of the limit (e.g. the connection pool size)
+            latency_threshold: Seconds above which a call counts as congested
+            backoff_ratio: Multiplicative decrease applied on congestion
+            queue_timeout: Seconds a call waits for a slot (0 rejects at once)
+            max_queue: Maximum number of waiting calls
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def limit(self) -> int:
+        """Current concurrency limit"""
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    async def acquire(self) -> None:
+        """
+        Take a concurrency slot, waiting up to ``queue_timeout`` seconds
+
+        Raises:
+            ConcurrencyLimitExceeded: If no slot became free in time
+        """
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        if self.queue_timeout <= 0 or len(self._waiters) >= self.max_queue:
+            raise ConcurrencyLimitExceeded(f"Keycloak concurrency limit of {self.limit} reached")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return
+            waiter.cancel()
+            raise ConcurrencyLimitExceeded(f"Keycloak concurrency limit of {self.limit} reached")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before cancellation
+                self._inflight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+            raise
+
+    def release(self, latency: float, failed: Optional[bool]) -> None:
+        """
+        Return a slot and adapt the limit
+
+        Args:
+            latency: Seconds the call took
+            failed: True if Keycloak was unavailable, False if it answered,
+                None if the call was abandoned without a verdict
+        """
+        saturated = self._inflight >= self.limit / 2
+        self._inflight -= 1
+
+        if failed or (failed is not None and latency > self.latency_threshold):
+            self._limit = max(self._limit * self.backoff_ratio, float(self.min_limit))
+        elif failed is False and saturated:
+            self._limit = min(self._limit + 1.0 / self._limit, float(self.max_limit))
+
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._inflight += 1
+            waiter.set_result(None)
@@ -0,0 +1,278 @@
+"""
+In-memory revocation list fed by logouts and back-channel logout tokens
+"""
+from typing import Optional, Dict, Any, List, Tuple
+from enum import Enum
+import hashlib
+import heapq
+import math
+import time
+
+from .cache import CacheBackend, TTLCache
+
+
+class RevocationStatus(str, Enum):
+    """
+    Result of a revocation lookup
+
+    NOT_REVOKED: no revocation is known for the token
+    REVOKED: the token's session, id or subject was revoked
+    POSSIBLY_REVOKED: the token matched a compacted Bloom filter and must be
+        confirmed with Keycloak (false positive rate ``bloom_error_rate``)
+    """
+    NOT_REVOKED = "not_revoked"
+    REVOKED = "revoked"
+    POSSIBLY_REVOKED = "possibly_revoked"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: Expected number of keys
+            error_rate: Target false positive probability at ``capacity``
+        """
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    Revoked sessions (``sid``), token ids (``jti``) and subjects (``sub``)
+
+    Entries are kept until the tokens they revoke expire: token ids until
+    their ``exp``, sessions and subjects for ``max_token_lifetime`` seconds
+    (the longest an access token issued before the logout can still be
+    valid). When more than ``max_entries`` session/token entries are held
+    they are compacted into a Bloom filter that lives until its newest entry
+    expires; filter hits are reported as POSSIBLY_REVOKED.
+
+    Lookups are O(1) and return immediately while nothing is revoked. The
+    list is per process, and back-channel logouts reach a single worker:
+    pass a ``shared`` backend so every worker in the cluster enforces them.
+    It must never drop entries before they expire (e.g.
+    ``RedisCache(noeviction=True)``), since an evicted revocation would be
+    accepted again. A lookup then reads the token's keys from the shared
+    backend in one batch. Revocations found there are kept locally, and
+    keys are not read again for ``shared_lookup_ttl`` seconds, which bounds
+    how late a worker sees another worker's revocation.
+    """
+
+    def __init__(
+        self,
+        max_token_lifetime: float = 3600.0,
+        max_entries: int = 100000,
+        bloom_error_rate: float = 0.001,
+        shared: Optional[CacheBackend] = None,
+        shared_lookup_ttl: float = 1.0
+    ):
+        """
+        Args:
+            max_token_lifetime: Upper bound in seconds of access token lifetime
+                (at least the realm's Access Token Lifespan)
+            max_entries: Exact entries kept before compacting into a Bloom filter
+            bloom_error_rate: False positive rate of compacted filters
+            shared: Backend shared with other workers; revocations are
+                written to it and looked up in it
+            shared_lookup_ttl: Seconds before a key read from ``shared`` is
+                read again (0 reads the backend on every check)
+
+        Raises:
+            ValueError: If ``shared`` may evict entries before they expire
+        """
+        if shared is not None and shared.evicts:
+            raise ValueError(
+                "RevocationList needs a shared backend that never evicts entries before "
+                "they expire, e.g. RedisCache(noeviction=True)"
+            )
+        self.max_token_lifetime = max_token_lifetime
+        self.max_entries = max_entries
+        self.bloom_error_rate = bloom_error_rate
+        self.shared = shared
+        self.shared_lookup_ttl = shared_lookup_ttl
+        self._entries: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._subjects: Dict[str, Tuple[float, float]] = {}
+        self._filters: List[Tuple[BloomFilter, float]] = []
+        self._shared_checked = TTLCache(maxsize=max_entries)
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._subjects)
+
+    def revoke_session(self, sid: str, expires_at: Optional[float] = None) -> None:
+        """
+        Revoke every token of a session
+
+        Args:
+            sid: Keycloak session id (``sid``/``session_state`` claim)
+            expires_at: Epoch seconds after which no token of the session
+                can be valid, defaults to now + ``max_token_lifetime``
+        """
+        self._add(f"sid:{sid}", expires_at)
+
+    def revoke_token(self, jti: str, expires_at: Optional[float] = None) -> None:
+        """
+        Revoke a single token
+
+        Args:
+            jti: Token id
+            expires_at: Token ``exp``, defaults to now + ``max_token_lifetime``
+        """
+        self._add(f"jti:{jti}", expires_at)
+
+    def revoke_subject(self, sub: str, revoked_at: Optional[float] = None) -> None:
+        """
+        Revoke every token of a user issued at or before ``revoked_at``
+
+        Args:
+            sub: User id
+            revoked_at: Epoch seconds of the revocation, defaults to now
+        """
+        revoked_at = revoked_at if revoked_at is not None else time.time()
+        revoked_at = self._remember_subject(sub, revoked_at)
+        if self.shared is not None:
+            self.shared.set(f"sub:{sub}", revoked_at, revoked_at + self.max_token_lifetime)
+
+    def check(self, token_claims: Dict[str, Any]) -> RevocationStatus:
+        """
+        Look up a verified token
+
+        Args:
+            token_claims: Decoded token claims
+
+        Returns:
+            Revocation status of the token
+        """
+        local = bool(self._entries or self._subjects or self._filters)
+        if not local and self.shared is None:
+            return RevocationStatus.NOT_REVOKED
+
+        keys = []
+        sid = token_claims.get("sid") or token_claims.get("session_state")
+        if sid:
+            keys.append(f"sid:{sid}")
+        jti = token_claims.get("jti")
+        if jti:
+            keys.append(f"jti:{jti}")
+
+        entries = self._entries
+        for key in keys:
+            if key in entries:
+                return RevocationStatus.REVOKED
+
+        if self._subjects:
+            revoked = self._subjects.get(token_claims.get("sub"))
+            if revoked is not None and token_claims.get("iat", 0) <= revoked[0]:
+                return RevocationStatus.REVOKED
+
+        if self.shared is not None and self._check_shared(token_claims, keys):
+            return RevocationStatus.REVOKED
+
+        for bloom, _ in self._filters:
+            for key in keys:
+                if key in bloom:
+                    return RevocationStatus.POSSIBLY_REVOKED
+
+        return RevocationStatus.NOT_REVOKED
+
+    def purge(self, now: Optional[float] = None) -> None:
+        """Drop entries and filters whose tokens have all expired"""
+        now = now if now is not None else time.time()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            if self._entries.get(key) == expires_at:
+                del self._entries[key]
+        if self._subjects:
+            self._subjects = {sub: entry for sub, entry in self._subjects.items() if entry[1] > now}
+        if self._filters:
+            self._filters = [(bloom, expires_at) for bloom, expires_at in self._filters if expires_at > now]
+
+    def _check_shared(self, token_claims: Dict[str, Any], keys: List[str]) -> bool:
+        """Look up the keys not checked recently in the shared backend, in one batch"""
+        sub = token_claims.get("sub")
+        lookups = keys + [f"sub:{sub}"] if sub else list(keys)
+        checked = self._shared_checked
+        lookups = [key for key in lookups if checked.get(key) is None]
+        if not lookups:
+            return False
+
+        recheck_at = time.time() + self.shared_lookup_ttl
+        revoked = False
+        for key, value in zip(lookups, self.shared.get_many(lookups)):
+            if value is None:
+                checked.set(key, True, recheck_at)
+            elif key.startswith("sub:"):
+                # Kept locally, so tokens issued before it are rejected in memory
+                revoked_at = self._remember_subject(sub, value)
+                revoked = revoked or token_claims.get("iat", 0) <= revoked_at
+                checked.set(key, True, recheck_at)
+            else:
+                expires_at = token_claims.get("exp") if key.startswith("jti:") else None
+                self._add(key, expires_at, share=False)
+                revoked = True
+        return revoked
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._expiry_heap.clear()
+        self._subjects.clear()
+        self._filters.clear()
+        self._shared_checked.clear()
+
+    def _remember_subject(self, sub: str, revoked_at: float) -> float:
+        """Record a subject revocation locally and return its effective time"""
+        now = time.time()
+        previous = self._subjects.get(sub)
+        if previous is not None:
+            revoked_at = max(revoked_at, previous[0])
+        self._subjects[sub] = (revoked_at, revoked_at + self.max_token_lifetime)
+        self.purge(now)
+        return revoked_at
+
+    def _add(self, key: str, expires_at: Optional[float], share: bool = True) -> None:
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + self.max_token_lifetime
+        if expires_at <= now:
+            return
+        if expires_at <= self._entries.get(key, 0.0):
+            return
+
+        self._entries[key] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, key))
+        if share and self.shared is not None:
+            self.shared.set(key, True, expires_at)
+        self.purge(now)
+        if len(self._entries) > self.max_entries:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Move every exact entry into a new Bloom filter"""
+        bloom = BloomFilter(len(self._entries), self.bloom_error_rate)
+        for key in self._entries:
+            bloom.add(key)
+        self._filters.append((bloom, max(self._entries.values())))
+        self._entries.clear()
+        self._expiry_heap.clear()
@@ -0,0 +1,307 @@
+"""
+Composite-role and group expansion for authorization decisions
+"""
+from typing import Optional, Dict, Any, Iterable, List, Set, FrozenSet, Tuple, TYPE_CHECKING
+import asyncio
+import json
+import logging
+import time
+
+from .policy import CLIENT_ROLE_SEPARATOR
+
+if TYPE_CHECKING:
+    from .keycloak_provider import KeycloakAuthProvider
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: FrozenSet[str] = frozenset()
+# Groups fetched per admin API request
+_PAGE_SIZE = 100
+
+
+def _client_role(client: str, role: str) -> str:
+    return f"{client}{CLIENT_ROLE_SEPARATOR}{role}"
+
+
+class RoleHierarchy:
+    """
+    Immutable snapshot of composite roles and group role mappings
+
+    Realm roles are named ``role`` and client roles ``client:role``, as in
+    the policy engine.
+
+    The transitive closure of every role and group is precomputed when the
+    snapshot is built, so expanding a set of roles is one lookup per role
+    (and the result for a given role set is memoised).
+    """
+
+    def __init__(
+        self,
+        composites: Dict[str, Iterable[str]],
+        group_roles: Optional[Dict[str, Iterable[str]]] = None
+    ):
+        """
+        Args:
+            composites: Role -> directly contained roles
+            group_roles: Group path or name -> roles granted by the group,
+                including roles inherited from parent groups
+        """
+        edges = {role: set(children) for role, children in composites.items()}
+        self._closure: Dict[str, FrozenSet[str]] = {}
+        for role in edges:
+            self._closure[role] = self._compute_closure(role, edges)
+
+        self._group_closure: Dict[str, FrozenSet[str]] = {}
+        for group, roles in (group_roles or {}).items():
+            expanded: Set[str] = set()
+            for role in roles:
+                expanded |= self._closure.get(role, frozenset((role,)))
+            self._group_closure[group] = frozenset(expanded)
+
+        self._memo: Dict[Tuple[FrozenSet[str], FrozenSet[str]], FrozenSet[str]] = {}
+
+    @staticmethod
+    def _compute_closure(role: str, edges: Dict[str, Set[str]]) -> FrozenSet[str]:
+        seen = {role}
+        stack = [role]
+        while stack:
+            for child in edges.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return frozenset(seen)
+
+    def expand(self, roles: FrozenSet[str], groups: FrozenSet[str] = _EMPTY) -> FrozenSet[str]:
+        """
+        Expand roles and group memberships to their transitive closure
+
+        Args:
+            roles: Realm roles and ``client:role`` client roles
+            groups: Group paths or names from the token
+
+        Returns:
+            All effective roles
+        """
+        key = (roles, groups)
+        expanded = self._memo.get(key)
+        if expanded is not None:
+            return expanded
+
+        result: Set[str] = set(roles)
+        for role in roles:
+            closure = self._closure.get(role)
+            if closure is not None:
+                result |= closure
+        for group in groups:
+            closure = self._group_closure.get(group)
+            if closure is not None:
+                result |= closure
+
+        expanded = frozenset(result)
+        if len(self._memo) >= 4096:
+            self._memo.clear()
+        self._memo[key] = expanded
+        return expanded
+
+    @classmethod
+    def from_realm_export(cls, path: str) -> "RoleHierarchy":
+        """
+        Build a hierarchy from a Keycloak realm export file
+
+        Args:
+            path: Path to the realm JSON (e.g. realms/munistream-realm.json)
+        """
+        with open(path) as f:
+            realm = json.load(f)
+
+        composites: Dict[str, List[str]] = {}
+        realm_roles = realm.get("roles", {})
+        for role in realm_roles.get("realm", []):
+            composites[role["name"]] = _composite_names(role.get("composites"))
+        for client, roles in realm_roles.get("client", {}).items():
+            for role in roles:
+                composites[_client_role(client, role["name"])] = _composite_names(role.get("composites"))
+
+        group_roles: Dict[str, List[str]] = {}
+        stack = [(group, "", []) for group in realm.get("groups", [])]
+        while stack:
+            group, parent_path, inherited = stack.pop()
+            path, roles = _group_entry(group, parent_path, inherited)
+            group_roles[path] = roles
+            stack.extend((subgroup, path, roles) for subgroup in group.get("subGroups", []))
+
+        return cls(composites, _with_unique_names(group_roles))
+
+
+def _composite_names(composites: Optional[Dict[str, Any]]) -> List[str]:
+    """Flatten a role's ``composites`` representation into role names"""
+    if not composites:
+        return []
+    names = list(composites.get("realm", []))
+    for client, roles in composites.get("client", {}).items():
+        names.extend(_client_role(client, role) for role in roles)
+    return names
+
+
+def _group_entry(group: Dict[str, Any], parent_path: str, inherited: List[str]) -> Tuple[str, List[str]]:
+    """Path of a group and its roles, including those inherited from parents"""
+    path = group.get("path") or f"{parent_path}/{group['name']}"
+    roles = inherited + list(group.get("realmRoles", []))
+    for client, client_roles in group.get("clientRoles", {}).items():
+        roles.extend(_client_role(client, role) for role in client_roles)
+    return path, roles
+
+
+def _with_unique_names(group_roles: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Also key groups by bare name, for ``groups`` claims without full paths,
+    when no other group has the same name
+    """
+    paths_by_name: Dict[str, List[str]] = {}
+    for path in group_roles:
+        paths_by_name.setdefault(path.rsplit("/", 1)[-1], []).append(path)
+
+    indexed = dict(group_roles)
+    for name, paths in paths_by_name.items():
+        if len(paths) == 1:
+            indexed.setdefault(name, group_roles[paths[0]])
+        else:
+            logger.warning(f"Group name {name} is ambiguous ({', '.join(paths)}); only full paths are expanded")
+    return indexed
+
+
+class RoleHierarchyResolver:
+    """
+    Keeps a RoleHierarchy loaded and refreshed every ``ttl`` seconds
+
+    The hierarchy is read from the Keycloak admin API using the provider's
+    service account (which needs the ``view-realm`` role of
+    ``realm-management``), or from a realm export file. Expansion is
+    synchronous and always uses the current snapshot; a stale snapshot
+    triggers a single background reload.
+    """
+
+    def __init__(
+        self,
+        provider: Optional["KeycloakAuthProvider"] = None,
+        realm_export: Optional[str] = None,
+        ttl: float = 300.0
+    ):
+        """
+        Args:
+            provider: Provider whose realm is loaded from the admin API
+            realm_export: Realm export file, used instead of the admin API
+            ttl: Seconds before the hierarchy is reloaded
+        """
+        if provider is None and realm_export is None:
+            raise ValueError("Either provider or realm_export is required")
+
+        self.provider = provider
+        self.realm_export = realm_export
+        self.ttl = ttl
+        self.hierarchy = RoleHierarchy({})
+        self._expires_at = 0.0
+        self._load_task: Optional[asyncio.Task] = None
+
+    async def load(self) -> RoleHierarchy:
+        """
+        Load the hierarchy now, joining a load already in flight
+        """
+        task = self._load_task
+        if task is None or task.done():
+            task = self._load_task = asyncio.ensure_future(self._load())
+            task.add_done_callback(self._log_load_failure)
+        await asyncio.shield(task)
+        return self.hierarchy
+
+    def _log_load_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Role hierarchy refresh failed: {task.exception()}")
+
+    async def _load(self) -> None:
+        try:
+            if self.realm_export is not None:
+                hierarchy = RoleHierarchy.from_realm_export(self.realm_export)
+            else:
+                hierarchy = await self._load_from_admin_api()
+        except Exception:
+            # Keep serving the previous snapshot, retry after a short delay
+            self._expires_at = time.monotonic() + min(self.ttl, 30.0)
+            raise
+
+        self.hierarchy = hierarchy
+        self._expires_at = time.monotonic() + self.ttl
+
+    async def _load_from_admin_api(self) -> RoleHierarchy:
+        provider = self.provider
+        admin_url = f"{provider.server_url}/admin/realms/{provider.realm}"
+        token = await provider.service_account.get_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def get(path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+            response = await provider._request(
+                "admin", "GET", f"{admin_url}{path}", headers=headers, params=params
+            )
+            return response.json()
+
+        clients = await get("/clients")
+        client_ids = {client["id"]: client["clientId"] for client in clients}
+
+        def role_name(role: Dict[str, Any]) -> str:
+            if role.get("clientRole"):
+                return _client_role(client_ids.get(role["containerId"], role["containerId"]), role["name"])
+            return role["name"]
+
+        composites: Dict[str, List[str]] = {}
+        for role in await get("/roles", {"briefRepresentation": "false"}):
+            if role.get("composite"):
+                children = await get(f"/roles-by-id/{role['id']}/composites")
+                composites[role["name"]] = [role_name(child) for child in children]
+
+        for client in clients:
+            client_roles = await get(f"/clients/{client['id']}/roles", {"briefRepresentation": "false"})
+            for role in client_roles:
+                if role.get("composite"):
+                    children = await get(f"/roles-by-id/{role['id']}/composites")
+                    composites[_client_role(client["clientId"], role["name"])] = [
+                        role_name(child) for child in children
+                    ]
+
+        async def get_all(path: str, params: Dict[str, Any]) -> List[Any]:
+            items: List[Any] = []
+            while True:
+                page = await get(path, dict(params, first=len(items), max=_PAGE_SIZE))
+                items.extend(page)
+                if len(page) < _PAGE_SIZE:
+                    return items
+
+        group_roles: Dict[str, List[str]] = {}
+        stack = [(group, "", []) for group in await get_all("/groups", {"briefRepresentation": "false"})]
+        while stack:
+            group, parent_path, inherited = stack.pop()
+            path, roles = _group_entry(group, parent_path, inherited)
+            group_roles[path] = roles
+            subgroups = group.get("subGroups") or []
+            if not subgroups and group.get("subGroupCount"):
+                # Keycloak 23+ no longer inlines subgroups
+                subgroups = await get_all(f"/groups/{group['id']}/children", {"briefRepresentation": "false"})
+            stack.extend((subgroup, path, roles) for subgroup in subgroups)
+
+        return RoleHierarchy(composites, _with_unique_names(group_roles))
+
+    def expand(self, roles: FrozenSet[str], groups: FrozenSet[str] = _EMPTY) -> FrozenSet[str]:
+        """
+        Expand roles with the current snapshot, reloading it in the
+        background when stale
+        """
+        if time.monotonic() >= self._expires_at:
+            task = self._load_task
+            if task is None or task.done():
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    self._load_task = asyncio.ensure_future(self._load())
+                    self._load_task.add_done_callback(self._log_load_failure)
+        return self.hierarchy.expand(roles, groups)
@@ -0,0 +1,177 @@
+"""
+Service-account (client_credentials) token management for backend-to-backend calls
+"""
+from typing import Optional, Dict, Any, AsyncGenerator, TYPE_CHECKING
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+if TYPE_CHECKING:
+    from .keycloak_provider import KeycloakAuthProvider
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceAccountTokenManager:
+    """
+    Obtains, caches and proactively renews a client_credentials access token
+
+    One manager is shared by all coroutines. Once started, a background task
+    renews the token ``renew_margin`` seconds (plus random jitter) before it
+    expires, so callers of ``get_token`` only wait on Keycloak for the very
+    first token or after renewal has been failing for the whole margin.
+    """
+
+    def __init__(
+        self,
+        provider: "KeycloakAuthProvider",
+        scope: Optional[str] = None,
+        renew_margin: float = 30.0,
+        jitter: float = 15.0,
+        retry_interval: float = 5.0
+    ):
+        """
+        Args:
+            provider: Keycloak provider used to perform the grant
+            scope: Optional space separated scopes to request
+            renew_margin: Seconds before expiry at which the token is renewed
+            jitter: Maximum random seconds added to the margin so that many
+                workers do not renew at the same instant
+            retry_interval: Seconds between renewal attempts after a failure
+        """
+        self.provider = provider
+        self.scope = scope
+        self.renew_margin = renew_margin
+        self.jitter = jitter
+        self.retry_interval = retry_interval
+
+        self._token: Optional[Dict[str, Any]] = None
+        self._expires_at = 0.0
+        self._renew_at = 0.0
+        self._fetch_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+
+    @property
+    def token_response(self) -> Optional[Dict[str, Any]]:
+        """Last token response from Keycloak, if any"""
+        return self._token
+
+    async def get_token(self) -> str:
+        """
+        Get a valid service-account access token
+
+        Returns:
+            Access token string
+        """
+        if self._token is None or time.monotonic() >= self._expires_at:
+            await self.renew()
+        elif time.monotonic() >= self._renew_at and self._background_task is None:
+            # No background renewal running; renew ahead of expiry without
+            # making this caller wait
+            self._start_fetch()
+        return self._token["access_token"]
+
+    async def renew(self) -> Dict[str, Any]:
+        """
+        Fetch a new token now, joining a renewal that is already in flight
+
+        Returns:
+            Token response
+        """
+        await asyncio.shield(self._start_fetch())
+        return self._token
+
+    def invalidate(self) -> None:
+        """Forget the cached token, e.g. after it was rejected with 401"""
+        self._token = None
+        self._expires_at = 0.0
+        self._renew_at = 0.0
+
+    def _start_fetch(self) -> asyncio.Task:
+        task = self._fetch_task
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._fetch())
+            task.add_done_callback(self._log_fetch_failure)
+            self._fetch_task = task
+        return task
+
+    def _log_fetch_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Service account token request failed: {task.exception()}")
+
+    async def _fetch(self) -> None:
+        token = await self.provider.client_credentials_token(scope=self.scope)
+
+        now = time.monotonic()
+        lifetime = float(token.get("expires_in", 60))
+        margin = min(self.renew_margin + random.uniform(0, self.jitter), lifetime / 2)
+
+        self._token = token
+        self._expires_at = now + lifetime
+        self._renew_at = now + lifetime - margin
+
+    def start(self) -> None:
+        """
+        Start background renewal. Must be called from a running event loop.
+        """
+        task = self._background_task
+        if task is None or task.done():
+            self._background_task = asyncio.ensure_future(self._renewal_loop())
+
+    def stop(self) -> None:
+        """Stop background renewal"""
+        if self._background_task is not None:
+            self._background_task.cancel()
+            self._background_task = None
+
+    async def _renewal_loop(self) -> None:
+        while True:
+            try:
+                await self.renew()
+                delay = self._renew_at - time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Already logged by the fetch task; keep using the current
+                # token while it is still valid
+                delay = self.retry_interval
+            await asyncio.sleep(max(delay, 0.0))
+
+    @property
+    def auth(self) -> "ServiceAccountAuth":
+        """httpx auth hook that adds the service-account bearer token"""
+        return ServiceAccountAuth(self)
+
+
+class ServiceAccountAuth(httpx.Auth):
+    """
+    httpx authentication hook for outbound internal calls
+
+    Example:
+        async with httpx.AsyncClient(auth=provider.service_account.auth) as client:
+            await client.get("http://workflow-service/api/v1/...")
+    """
+
+    def __init__(self, manager: ServiceAccountTokenManager):
+        self.manager = manager
+
+    def sync_auth_flow(self, request: httpx.Request):
+        raise RuntimeError("ServiceAccountAuth can only be used with httpx.AsyncClient")
+
+    async def async_auth_flow(
+        self,
+        request: httpx.Request
+    ) -> AsyncGenerator[httpx.Request, httpx.Response]:
+        token = await self.manager.get_token()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+
+        if response.status_code == 401:
+            # Token may have been revoked early; retry once with a fresh one
+            self.manager.invalidate()
+            token = await self.manager.get_token()
+            request.headers["Authorization"] = f"Bearer {token}"
+            yield request
@@ -0,0 +1,356 @@
+"""
+Cache backends shared between worker processes
+"""
+from typing import Optional, Dict, Any, List, Set, Tuple
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+from .cache import CacheBackend
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"KCAC"
+_LAYOUT_VERSION = 1
+_FILE_HEADER = struct.Struct("<4sIII")
+_FILE_HEADER_SIZE = 64
+# sequence, key hash, expires_at, payload length
+_SLOT_HEADER = struct.Struct("<I16sdI")
+_SEQUENCE = struct.Struct("<I")
+# Slot header fields after the sequence
+_SLOT_FIELDS = struct.Struct("<16sdI")
+_WAYS = 2
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class SharedMemoryCache(CacheBackend):
+    """
+    Host-wide cache in a memory-mapped file, shared by every worker process
+    that opens the same path with the same geometry
+
+    The file is a fixed table of ``slots`` slots of ``slot_size`` bytes,
+    2-way set associative: a key can live in one of two slots and replaces
+    the entry expiring first. Writers serialise per set with POSIX record
+    locks; readers take no lock and detect torn reads with a per-slot
+    sequence counter, treating them as misses. Values are stored as JSON
+    and values larger than a slot are not cached (logged once per key
+    namespace).
+
+    Put the file on a tmpfs (``/dev/shm`` on Linux) so it never touches
+    disk. Requires ``fcntl`` (POSIX).
+    """
+
+    def __init__(
+        self,
+        path: str = "/dev/shm/munistream-auth-cache",
+        slots: int = 4096,
+        slot_size: int = 8192
+    ):
+        """
+        Args:
+            path: Backing file, created on first use
+            slots: Number of slots (rounded up to an even number)
+            slot_size: Bytes per slot including a 32 byte header (the
+                default fits a JWKS with a few ``x5c`` chains)
+        """
+        try:
+            import fcntl
+        except ImportError:
+            raise ImportError("SharedMemoryCache requires a POSIX platform (fcntl)")
+
+        self._fcntl = fcntl
+        self.path = path
+        self.slots = slots + slots % _WAYS
+        self.slot_size = slot_size
+        self._sets = self.slots // _WAYS
+        self._max_payload = slot_size - _SLOT_HEADER.size
+        size = _FILE_HEADER_SIZE + self.slots * slot_size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = _FILE_HEADER.pack(_MAGIC, _LAYOUT_VERSION, self.slots, slot_size)
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, _FILE_HEADER.size, 0) != header:
+                if os.fstat(self._fd).st_size:
+                    logger.warning(f"Reinitialising shared cache {path} with a new layout")
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+        self._oversized_namespaces: Set[str] = set()
+
+    @staticmethod
+    def _hash(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _set_offset(self, key_hash: bytes) -> int:
+        index = int.from_bytes(key_hash[:8], "little") % self._sets
+        return _FILE_HEADER_SIZE + index * _WAYS * self.slot_size
+
+    def _read(self, offset: int, key_hash: bytes) -> Optional[Tuple[bytes, float]]:
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        if sequence & 1:
+            return None
+        slot_hash, expires_at, length = _SLOT_FIELDS.unpack_from(self._map, offset + _SEQUENCE.size)
+        start = offset + _SLOT_HEADER.size
+        payload = self._map[start:start + min(length, self._max_payload)]
+        # Everything read between two equal even sequences belongs to one write
+        if _SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+            return None
+        if slot_hash != key_hash or length > self._max_payload:
+            return None
+        return payload, expires_at
+
+    def _write(self, offset: int, key_hash: bytes, payload: bytes, expires_at: float) -> None:
+        """Write a slot; the caller holds the set lock"""
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        _SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF | 1)
+        _SLOT_FIELDS.pack_into(self._map, offset + _SEQUENCE.size, key_hash, expires_at, len(payload))
+        start = offset + _SLOT_HEADER.size
+        self._map[start:start + len(payload)] = payload
+        # Publish: readers only accept the slot once the sequence is even again
+        _SEQUENCE.pack_into(self._map, offset, (sequence + 2) & 0xFFFFFFFE)
+
+    def _lock(self, offset: int, length: int, operation: int) -> None:
+        self._fcntl.lockf(self._fd, operation, length, offset, os.SEEK_SET)
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        key_hash = self._hash(key)
+        offset = self._set_offset(key_hash)
+        now = time.time()
+        for way in range(_WAYS):
+            entry = self._read(offset + way * self.slot_size, key_hash)
+            if entry is not None and entry[1] > now:
+                try:
+                    value = json.loads(entry[0])
+                except ValueError:
+                    continue
+                self.hits += 1
+                return value, entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        now = time.time()
+        if expires_at <= now:
+            return
+        payload = _encode(value)
+        if len(payload) > self._max_payload:
+            self.oversized += 1
+            namespace = key.split(":", 1)[0]
+            if namespace not in self._oversized_namespaces:
+                self._oversized_namespaces.add(namespace)
+                logger.warning(
+                    f"Shared cache entry {key} ({len(payload)} bytes) exceeds slot_size "
+                    f"{self.slot_size} and is not cached; raise slot_size"
+                )
+            return
+
+        key_hash = self._hash(key)
+        offset = self._set_offset(key_hash)
+        self._lock(offset, _WAYS * self.slot_size, self._fcntl.LOCK_EX)
+        try:
+            target = None
+            earliest = float("inf")
+            for way in range(_WAYS):
+                slot = offset + way * self.slot_size
+                _, slot_hash, slot_expires, length = _SLOT_HEADER.unpack_from(self._map, slot)
+                if slot_hash == key_hash:
+                    target, earliest = slot, float("-inf")
+                    break
+                if slot_expires < earliest:
+                    target, earliest = slot, slot_expires
+            if earliest > now:
+                self.evictions += 1
+            self._write(target, key_hash, payload, expires_at)
+        finally:
+            self._lock(offset, _WAYS * self.slot_size, self._fcntl.LOCK_UN)
+
+    def delete(self, key: str) -> None:
+        key_hash = self._hash(key)
+        offset = self._set_offset(key_hash)
+        self._lock(offset, _WAYS * self.slot_size, self._fcntl.LOCK_EX)
+        try:
+            for way in range(_WAYS):
+                slot = offset + way * self.slot_size
+                if _SLOT_HEADER.unpack_from(self._map, slot)[1] == key_hash:
+                    self._write(slot, bytes(16), b"", 0.0)
+        finally:
+            self._lock(offset, _WAYS * self.slot_size, self._fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        """Expire every entry of every process sharing the file"""
+        length = self.slots * self.slot_size
+        self._lock(_FILE_HEADER_SIZE, length, self._fcntl.LOCK_EX)
+        try:
+            for slot in range(_FILE_HEADER_SIZE, _FILE_HEADER_SIZE + length, self.slot_size):
+                if _SLOT_HEADER.unpack_from(self._map, slot)[2]:
+                    self._write(slot, bytes(16), b"", 0.0)
+        finally:
+            self._lock(_FILE_HEADER_SIZE, length, self._fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        now = time.time()
+        return sum(
+            1 for slot in range(_FILE_HEADER_SIZE, len(self._map), self.slot_size)
+            if _SLOT_HEADER.unpack_from(self._map, slot)[2] > now
+        )
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Counters of this process and current host-wide size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "slots": self.slots,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "oversized": self.oversized,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+class RedisCache(CacheBackend):
+    """
+    Redis backend (requires ``redis`` unless a client is passed)
+
+    Accepts any client with the synchronous redis-py ``get``/``mget``/
+    ``set``/``delete``/``scan_iter`` methods. Calls block the event loop for
+    one round trip, so put it behind a TieredCache (the provider does) and
+    use a client with short socket timeouts; connection errors are logged
+    and treated as misses.
+
+    Entries carry a TTL, so under the usual ``allkeys-*``/``volatile-*``
+    memory policies Redis may evict them early. Pass ``noeviction=True``
+    only for an instance (or database of one) running with
+    ``maxmemory-policy noeviction``, as required to share revocations.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        client: Optional[Any] = None,
+        prefix: str = "munistream-auth:",
+        noeviction: bool = False
+    ):
+        """
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+            client: Existing redis-py compatible client, used instead of ``url``
+            prefix: Prefix of every key written by this cache
+            noeviction: The server never evicts keys before their TTL
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("RedisCache requires the redis package")
+            client = redis.Redis.from_url(
+                url or "redis://localhost:6379/0", socket_timeout=0.05, socket_connect_timeout=0.05
+            )
+
+        self.client = client
+        self.prefix = prefix
+        self.evicts = not noeviction
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache read failed: {e}")
+            raw = None
+        return self._decode(raw, time.time())
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Read several keys with a single MGET"""
+        if not keys:
+            return []
+        try:
+            raws = self.client.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache read failed: {e}")
+            raws = [None] * len(keys)
+
+        now = time.time()
+        values = []
+        for raw in raws:
+            entry = self._decode(raw, now)
+            values.append(entry[0] if entry is not None else None)
+        return values
+
+    def _decode(self, raw: Optional[bytes], now: float) -> Optional[Tuple[Any, float]]:
+        if raw is not None:
+            try:
+                value, expires_at = json.loads(raw)
+            except ValueError:
+                value, expires_at = None, 0.0
+            if expires_at > now:
+                self.hits += 1
+                return value, expires_at
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        try:
+            self.client.set(self.prefix + key, _encode([value, expires_at]), px=ttl_ms)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache write failed: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache delete failed: {e}")
+
+    def clear(self) -> None:
+        self.clear_prefix("")
+
+    def clear_prefix(self, prefix: str) -> None:
+        """Delete every key of this cache starting with ``prefix``"""
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.prefix}{prefix}*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Redis cache clear failed: {e}")
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,117 @@
+"""
+On-disk snapshot of OIDC discovery metadata and JWKS for fast cold starts
+"""
+from typing import Optional, Dict, Any
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3
+
+
+def _checksum(created_at: Any, content: Dict[str, Any], key: Optional[bytes]) -> str:
+    signed = {"created_at": created_at, "content": content}
+    canonical = json.dumps(signed, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    if key is None:
+        return hashlib.sha256(canonical).hexdigest()
+    return hmac.new(key, canonical, hashlib.sha256).hexdigest()
+
+
+def _algorithm(key: Optional[bytes]) -> str:
+    return "sha256" if key is None else "hmac-sha256"
+
+
+def write_snapshot(path: str, content: Dict[str, Any], key: Optional[bytes] = None) -> None:
+    """
+    Atomically write a snapshot with an integrity checksum
+
+    The checksum covers the content and the creation time, so readers can
+    reject snapshots older than they are willing to trust. The file is created with mode 0600; keep its directory writable only by
+    the service user.
+
+    Args:
+        path: Snapshot file path
+        content: JSON-serialisable snapshot content
+        key: HMAC key authenticating the content; without it the checksum
+            only detects corruption
+    """
+    created_at = time.time()
+    document = {
+        "version": SNAPSHOT_VERSION,
+        "algorithm": _algorithm(key),
+        "created_at": created_at,
+        "checksum": _checksum(created_at, content, key),
+        "content": content
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".keycloak-snapshot-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(
+    path: str,
+    key: Optional[bytes] = None,
+    max_age: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Read a snapshot, rejecting missing, corrupt, truncated or expired files,
+    and tampered files when a key is given
+
+    Args:
+        path: Snapshot file path
+        key: HMAC key the snapshot was written with; without it anyone able
+            to write the file can replace the trusted signing keys
+        max_age: Seconds after its creation a snapshot is still trusted
+            (None accepts any age)
+
+    Returns:
+        Snapshot content, or None if it cannot be trusted
+    """
+    try:
+        with open(path) as f:
+            document = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable Keycloak snapshot {path}: {e}")
+        return None
+
+    if not isinstance(document, dict) or document.get("version") != SNAPSHOT_VERSION:
+        logger.warning(f"Ignoring Keycloak snapshot {path}: unsupported version")
+        return None
+
+    if document.get("algorithm") != _algorithm(key):
+        logger.warning(f"Ignoring Keycloak snapshot {path}: not written with the configured key")
+        return None
+
+    content = document.get("content")
+    created_at = document.get("created_at")
+    checksum = document.get("checksum")
+    if not isinstance(content, dict) or not isinstance(checksum, str) or not hmac.compare_digest(
+        checksum, _checksum(created_at, content, key)
+    ):
+        logger.warning(f"Ignoring Keycloak snapshot {path}: checksum mismatch")
+        return None
+
+    if not isinstance(created_at, (int, float)):
+        logger.warning(f"Ignoring Keycloak snapshot {path}: missing creation time")
+        return None
+    if max_age is not None and time.time() - created_at > max_age:
+        logger.warning(f"Ignoring Keycloak snapshot {path}: older than {max_age:g} seconds")
+        return None
+
+    return content
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the token verification and authorization hot path.
+
+Mints RS256/ES256 tokens and serves JWKS and introspection from the
+in-process Keycloak emulator (tools/keycloak_emulator.py) and measures:
+
+- micro benchmarks of verify_token (cold and cached), extract_roles,
+  Principal role computation and compiled role policies
+- end-to-end latency and throughput of example_app routes at several
+  concurrency levels
+
+Results are written as JSON so runs can be compared across commits:
+
+    python benchmarks/bench_auth.py --output before.json
+    git checkout feature && python benchmarks/bench_auth.py --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Callable, Awaitable
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+KEYCLOAK_URL = "http://keycloak.bench"
+REALM = "munistream"
+CLIENT_ID = "munistream-backend"
+CLIENT_SECRET = "changeme-backend-secret-in-production"
+ISSUER = f"{KEYCLOAK_URL}/realms/{REALM}"
+
+# example_app builds its provider from the environment at import time
+os.environ.setdefault("KEYCLOAK_URL", KEYCLOAK_URL)
+os.environ.setdefault("KEYCLOAK_REALM", REALM)
+os.environ.setdefault("KEYCLOAK_CLIENT_ID", CLIENT_ID)
+
+from auth_provider import KeycloakAuthProvider, Principal, RoleIndex, compile_policy  # noqa: E402
+from tools.keycloak_emulator import KeycloakEmulator  # noqa: E402
+
+
+class TokenFactory:
+    """Mints RS256 and ES256 access tokens from the emulated realm"""
+
+    def __init__(self, emulator: KeycloakEmulator):
+        self.realm = emulator.load_realm_export(os.path.join(ROOT, "realms", "munistream-realm.json"))
+        self.user_id = self.realm.create_user({
+            "username": "bench",
+            "email": "bench@munistream.local",
+            "firstName": "Bench",
+            "emailVerified": True
+        })
+        self.realm.role_mappings[self.user_id].update(("admin", "citizen"))
+
+    def mint(self, algorithm: str = "RS256") -> str:
+        tokens = self.realm.issue_tokens(
+            ISSUER, self.user_id, "munistream-citizen", algorithm=algorithm
+        )
+        return tokens["access_token"]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "mean": statistics.fmean(ordered) * 1000,
+        "p50": ordered[int(count * 0.50)] * 1000,
+        "p95": ordered[min(int(count * 0.95), count - 1)] * 1000,
+        "p99": ordered[min(int(count * 0.99), count - 1)] * 1000,
+    }
+
+
+def bench_sync(name: str, func: Callable[[], Any], iterations: int) -> Dict[str, Any]:
+    for _ in range(min(iterations, 100)):
+        func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    return {"name": name, "iterations": iterations, "ns_per_op": elapsed / iterations * 1e9}
+
+
+async def bench_async(name: str, func: Callable[[], Awaitable[Any]], iterations: int) -> Dict[str, Any]:
+    for _ in range(min(iterations, 100)):
+        await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    elapsed = time.perf_counter() - start
+    return {"name": name, "iterations": iterations, "ns_per_op": elapsed / iterations * 1e9}
+
+
+async def run_micro(emulator: KeycloakEmulator, tokens: TokenFactory, iterations: int) -> List[Dict[str, Any]]:
+    results = []
+    provider = KeycloakAuthProvider(
+        KEYCLOAK_URL, REALM, CLIENT_ID, client_secret=CLIENT_SECRET, transport=emulator.transport()
+    )
+    try:
+        for algorithm in ("RS256", "ES256"):
+            token = tokens.mint(algorithm)
+
+            async def verify_cold(token: str = token) -> None:
+                provider.claims_cache.clear()
+                await provider.verify_token(token)
+
+            async def verify_cached(token: str = token) -> None:
+                await provider.verify_token(token)
+
+            results.append(await bench_async(f"verify_token.{algorithm}.cold", verify_cold, iterations // 10))
+            results.append(await bench_async(f"verify_token.{algorithm}.cached", verify_cached, iterations))
+
+        claims = await provider.verify_token(tokens.mint())
+    finally:
+        await provider.aclose()
+
+    results.append(bench_sync("extract_roles", lambda: provider.extract_roles(claims), iterations))
+    results.append(bench_sync("principal.roles", lambda: Principal(claims, CLIENT_ID).roles, iterations))
+
+    index = RoleIndex.from_realm_export(os.path.join(ROOT, "realms", "munistream-realm.json"))
+    policy = compile_policy("(approver | admin) & !viewer", index)
+    principal = Principal(claims, CLIENT_ID)
+    results.append(bench_sync("policy.evaluate", lambda: policy.evaluate(principal), iterations))
+    return results
+
+
+async def run_http(
+    emulator: KeycloakEmulator,
+    tokens: TokenFactory,
+    concurrency_levels: List[int],
+    requests_per_level: int,
+    latency: float
+) -> List[Dict[str, Any]]:
+    from auth_provider import example_app
+
+    provider = example_app.keycloak_provider
+    provider.transport = emulator.transport()
+    await provider.aclose()
+    if latency:
+        emulator.set_fault(latency=latency)
+
+    results = []
+    token = tokens.mint()
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=example_app.app)
+
+    async with example_app.app.router.lifespan_context(example_app.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in ("/api/v1/user/profile", "/api/v1/admin/users"):
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+
+                for concurrency in concurrency_levels:
+                    per_worker = max(requests_per_level // concurrency, 1)
+                    latencies: List[float] = []
+
+                    async def worker() -> None:
+                        for _ in range(per_worker):
+                            start = time.perf_counter()
+                            response = await client.get(path, headers=headers)
+                            latencies.append(time.perf_counter() - start)
+                            if response.status_code != 200:
+                                raise RuntimeError(f"{path} returned {response.status_code}")
+
+                    start = time.perf_counter()
+                    await asyncio.gather(*(worker() for _ in range(concurrency)))
+                    elapsed = time.perf_counter() - start
+
+                    results.append({
+                        "name": f"http{path}",
+                        "concurrency": concurrency,
+                        "requests": len(latencies),
+                        "throughput_rps": len(latencies) / elapsed,
+                        "latency_ms": summarize(latencies)
+                    })
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the relative change of every benchmark present in both runs"""
+    def key(result: Dict[str, Any]) -> str:
+        return f"{result['name']}@{result.get('concurrency', '-')}"
+
+    def value(result: Dict[str, Any]) -> float:
+        return result["ns_per_op"] if "ns_per_op" in result else result["latency_ms"]["p50"]
+
+    previous = {key(result): result for result in baseline["results"]}
+    print(f"\nComparison against {baseline['meta']['revision']} (lower is better)")
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        change = (value(result) - value(before)) / value(before) * 100
+        print(f"  {key(result):55} {value(before):12.1f} -> {value(result):12.1f} ({change:+.1f}%)")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the auth provider hot path")
+    parser.add_argument("--iterations", type=int, default=20000, help="Iterations per micro benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="HTTP requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma separated concurrency levels")
+    parser.add_argument("--keycloak-latency", type=float, default=0.002,
+                        help="Simulated Keycloak latency in seconds")
+    parser.add_argument("--skip-http", action="store_true", help="Only run micro benchmarks")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    emulator = KeycloakEmulator(base_url=KEYCLOAK_URL, algorithms=("RS256", "ES256"), seed=0)
+    tokens = TokenFactory(emulator)
+    results = await run_micro(emulator, tokens, args.iterations)
+    if not args.skip_http:
+        levels = [int(level) for level in args.concurrency.split(",")]
+        results += await run_http(emulator, tokens, levels, args.requests, args.keycloak_latency)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "keycloak_latency": args.keycloak_latency,
+            "keycloak_requests": emulator.requests
+        },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,283 @@
+"""
+Shared fixtures: an in-process Keycloak emulator serving the MuniStream
+realm export, and providers talking to it through httpx.ASGITransport.
+"""
+
+import fnmatch
+import importlib.util
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from jose import jwt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from auth_provider import KeycloakAuthProvider, cache, keycloak_provider, revocation, shared_cache  # noqa: E402
+from tools.keycloak_emulator import EmulatedRealm, KeycloakEmulator  # noqa: E402
+
+KEYCLOAK_URL = "http://keycloak.test"
+REALM = "munistream"
+CLIENT_ID = "munistream-backend"
+CLIENT_SECRET = "changeme-backend-secret-in-production"
+ISSUER = f"{KEYCLOAK_URL}/realms/{REALM}"
+REALM_EXPORT = os.path.join(ROOT, "realms", "munistream-realm.json")
+BACKCHANNEL_LOGOUT_EVENT = "http://schemas.openid.net/event/backchannel-logout"
+
+
+class Clock:
+    """Stand-in for the ``time`` module with an adjustable wall clock"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def time(self) -> float:
+        return time.time() + self.offset
+
+    def monotonic(self) -> float:
+        return time.monotonic() + self.offset
+
+    def advance(self, seconds: float) -> None:
+        self.offset += seconds
+
+
+class FakeRedis:
+    """Dict-backed stand-in for a redis-py client, counting round trips"""
+
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+        self.ttls: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+
+    def _count(self, command: str) -> None:
+        self.calls[command] = self.calls.get(command, 0) + 1
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._count("get")
+        return self.data.get(key)
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        self._count("mget")
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, px: int) -> None:
+        self._count("set")
+        self.data[key] = value
+        self.ttls[key] = px
+
+    def delete(self, *keys: str) -> None:
+        self._count("delete")
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match: str):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+
+class TokenFactory:
+    """Mints tokens for a user of an emulated realm"""
+
+    def __init__(self, realm: EmulatedRealm):
+        self.realm = realm
+        self.user_id = realm.create_user({
+            "username": "alice",
+            "email": "alice@munistream.local",
+            "firstName": "Alice",
+            "emailVerified": True
+        })
+        realm.role_mappings[self.user_id].update(("citizen", "reviewer"))
+
+    def issue(self, session: bool = False) -> Dict[str, Any]:
+        """Token endpoint response, with a session and refresh token if requested"""
+        session_id = self.realm.start_session(self.user_id, CLIENT_ID) if session else None
+        return self.realm.issue_tokens(ISSUER, self.user_id, CLIENT_ID, session_id=session_id)
+
+    def access_token(self, session: bool = False, **overrides: Any) -> str:
+        """Access token, re-signed with ``overrides`` applied to its claims"""
+        token = self.issue(session)["access_token"]
+        if not overrides:
+            return token
+        claims = jwt.get_unverified_claims(token)
+        claims.update(overrides)
+        return self.realm.sign(claims)
+
+    def logout_token(self, sid: Optional[str] = None, sub: Optional[str] = None) -> str:
+        """OIDC back-channel logout token for a session or a subject"""
+        now = int(time.time())
+        claims = {
+            "iss": ISSUER,
+            "aud": CLIENT_ID,
+            "iat": now,
+            "exp": now + 60,
+            "jti": str(uuid.uuid4()),
+            "events": {BACKCHANNEL_LOGOUT_EVENT: {}}
+        }
+        if sid:
+            claims["sid"] = sid
+        if sub:
+            claims["sub"] = sub
+        return self.realm.sign(claims)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the caches and the provider, advanced by the test"""
+    clock = Clock()
+    for module in (cache, keycloak_provider, revocation, shared_cache):
+        monkeypatch.setattr(module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def emulator():
+    emulator = KeycloakEmulator(KEYCLOAK_URL)
+    emulator.load_realm_export(REALM_EXPORT)
+    return emulator
+
+
+@pytest.fixture
+def realm(emulator):
+    return emulator.realm(REALM)
+
+
+@pytest.fixture
+def tokens(realm):
+    return TokenFactory(realm)
+
+
+@pytest.fixture
+async def make_provider(emulator):
+    """Build providers on the emulator transport, closed after the test"""
+    providers = []
+
+    def make(**kwargs: Any) -> KeycloakAuthProvider:
+        provider = KeycloakAuthProvider(
+            KEYCLOAK_URL, REALM, CLIENT_ID,
+            client_secret=CLIENT_SECRET,
+            transport=emulator.transport(),
+            **kwargs
+        )
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        await provider.aclose()
+
+
+@pytest.fixture
+def provider(make_provider):
+    return make_provider()
+
+
+class EmulatorServer:
+    """
+    Live HTTP server for clients that cannot take an httpx transport (the
+    requests-based python-keycloak), serving the current test's emulator
+    and recording the (method, path) of every request
+    """
+
+    def __init__(self):
+        import uvicorn
+
+        self.emulator: Optional[KeycloakEmulator] = None
+        self.paths: List[Tuple[str, str]] = []
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(
+            self.app, host="127.0.0.1", port=port, interface="asgi3", log_level="warning"
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    async def app(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.paths.append((scope["method"], scope["path"]))
+        await self.emulator.app(scope, receive, send)
+
+    def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+    def count(self, method: str, suffix: str) -> int:
+        """Requests whose path ends with ``suffix``"""
+        return sum(1 for m, path in self.paths if m == method and path.endswith(suffix))
+
+
+@pytest.fixture(scope="session")
+def emulator_server():
+    pytest.importorskip("uvicorn")
+    server = EmulatorServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def live_emulator(emulator, emulator_server):
+    """The test's emulator behind ``emulator_server``"""
+    emulator_server.emulator = emulator
+    emulator_server.paths.clear()
+    return emulator_server
+
+
+@pytest.fixture(scope="session")
+def migrate():
+    """scripts/migrate-users.py as a module"""
+    for requirement in ("keycloak", "dotenv", "pymongo", "mongomock"):
+        pytest.importorskip(requirement)
+    spec = importlib.util.spec_from_file_location("migrate_users", os.path.join(ROOT, "scripts", "migrate-users.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def mongo(migrate):
+    import mongomock
+
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def make_migrator(migrate, mongo, live_emulator, tmp_path, monkeypatch):
+    """UserMigrator on mongomock and the live emulator, closed after the test"""
+    monkeypatch.setattr(migrate, "KEYCLOAK_URL", live_emulator.url)
+    monkeypatch.setattr(migrate, "MongoClient", lambda uri: mongo)
+    migrators = []
+
+    def make(**kwargs: Any):
+        kwargs.setdefault("rate_limit", 0)
+        kwargs.setdefault("state_file", str(tmp_path / "state.json"))
+        migrator = migrate.UserMigrator(**kwargs)
+        migrators.append(migrator)
+        return migrator
+
+    yield make
+    for migrator in migrators:
+        migrator.executor.shutdown(wait=True)
@@ -0,0 +1,119 @@
+"""
+Back-channel logout: Keycloak posts a logout token and the session's
+access tokens are rejected from then on, without introspection
+"""
+
+import time
+from typing import Optional
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+
+from auth_provider import KeycloakAuth, OptionalAuth, Principal, RedisCache, SharedMemoryCache, TokenValidation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(provider):
+    auth = KeycloakAuth(provider, TokenValidation.LOCAL)
+    optional_auth = OptionalAuth(provider)
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(user: Principal = Depends(auth.get_current_user)):
+        return {"sub": user.sub}
+
+    @app.get("/greeting")
+    async def greeting(user: Optional[Principal] = Depends(optional_auth.get_optional_user)):
+        return {"sub": user.sub if user else None}
+
+    app.post("/backchannel-logout")(auth.backchannel_logout)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        yield client
+
+
+def bearer(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def test_session_logout_rejects_its_tokens(client, emulator, tokens):
+    token = tokens.access_token(session=True)
+    other = tokens.access_token(session=True)
+    assert (await client.get("/me", headers=bearer(token))).status_code == 200
+
+    sid = tokens.realm.decode(token)["sid"]
+    response = await client.post("/backchannel-logout", data={"logout_token": tokens.logout_token(sid=sid)})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-store"
+
+    response = await client.get("/me", headers=bearer(token))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+    assert (await client.get("/greeting", headers=bearer(token))).json() == {"sub": None}
+
+    # Other sessions of the user are unaffected, and nothing was introspected
+    assert (await client.get("/me", headers=bearer(other))).status_code == 200
+    assert emulator.requests["introspection"] == 0
+
+
+async def test_subject_logout_rejects_tokens_issued_before_it(client, tokens):
+    token = tokens.access_token(iat=int(time.time()) - 10)
+
+    response = await client.post("/backchannel-logout", data={"logout_token": tokens.logout_token(sub=tokens.user_id)})
+    assert response.status_code == 200
+
+    assert (await client.get("/me", headers=bearer(token))).status_code == 401
+    fresh = tokens.access_token(iat=int(time.time()) + 1)
+    assert (await client.get("/me", headers=bearer(fresh))).status_code == 200
+
+
+@pytest.mark.parametrize("form", [
+    {},
+    {"logout_token": "not-a-jwt"},
+])
+async def test_invalid_logout_requests_are_rejected(client, form):
+    response = await client.post("/backchannel-logout", data=form)
+    assert response.status_code == 400
+
+
+async def test_body_that_is_not_utf8_is_rejected(client):
+    response = await client.post(
+        "/backchannel-logout",
+        content=b"logout_token=\xff\xfe",
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    assert response.status_code == 400
+
+
+async def test_access_token_is_not_a_logout_token(client, tokens):
+    response = await client.post("/backchannel-logout", data={"logout_token": tokens.access_token(session=True)})
+    assert response.status_code == 400
+
+
+async def test_logout_received_by_one_worker_is_enforced_by_the_others(make_provider, tokens, redis, clock):
+    backend = RedisCache(client=redis, noeviction=True)
+    workers = [make_provider(revocation_backend=backend) for _ in range(2)]
+    auth = [KeycloakAuth(worker, TokenValidation.LOCAL) for worker in workers]
+    token = tokens.access_token(session=True)
+    assert (await auth[1].authenticate(token)).sub == tokens.user_id
+
+    sid = tokens.realm.decode(token)["sid"]
+    await workers[0].handle_logout_token(tokens.logout_token(sid=sid))
+
+    # The second worker's earlier lookup is only trusted for shared_lookup_ttl
+    clock.advance(workers[1].revocations.shared_lookup_ttl + 0.1)
+    with pytest.raises(HTTPException) as error:
+        await auth[1].authenticate(token)
+    assert error.value.detail == "Token has been revoked"
+
+
+async def test_evicting_cache_backend_does_not_share_revocations(make_provider, tmp_path, redis):
+    assert make_provider(cache_backend=SharedMemoryCache(str(tmp_path / "cache"), slots=16)).revocations.shared is None
+    assert make_provider(cache_backend=RedisCache(client=redis)).revocations.shared is None
+    assert make_provider(cache_backend=RedisCache(client=redis, noeviction=True)).revocations.shared is not None
+
+    with pytest.raises(ValueError, match="never evicts"):
+        make_provider(revocation_backend=RedisCache(client=redis))
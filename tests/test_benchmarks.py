@@ -0,0 +1,39 @@
+"""
+Smoke test for the benchmark suite: a short micro benchmark run writes a
+JSON report that a second run can compare against.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+BENCH = os.path.join(ROOT, "benchmarks", "bench_auth.py")
+
+
+def run_bench(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, BENCH, "--iterations", "20", "--skip-http", *args],
+        cwd=ROOT, capture_output=True, text=True, timeout=120, check=True
+    )
+
+
+def test_micro_benchmarks_write_and_compare_reports(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    run_bench("--output", str(baseline))
+
+    report = json.loads(baseline.read_text())
+    names = {result["name"] for result in report["results"]}
+    assert {
+        "verify_token.RS256.cold", "verify_token.RS256.cached",
+        "verify_token.ES256.cold", "verify_token.ES256.cached",
+        "extract_roles", "principal.roles", "policy.evaluate"
+    } <= names
+    assert all(result["ns_per_op"] > 0 for result in report["results"])
+    assert report["meta"]["keycloak_requests"]["jwks_fetch"] >= 1
+
+    compared = run_bench("--output", str(tmp_path / "current.json"), "--compare", str(baseline))
+    assert f"Comparison against {report['meta']['revision']}" in compared.stdout
+    assert "policy.evaluate@-" in compared.stdout
@@ -0,0 +1,227 @@
+"""
+Shared cache backends, the tiered cache in front of them and signed entries
+"""
+
+import json
+
+import pytest
+
+from auth_provider import KeycloakAuthProvider, RedisCache, SharedMemoryCache, SignedCache, TieredCache, TTLCache
+from auth_provider.shared_cache import _SEQUENCE
+from conftest import CLIENT_ID, KEYCLOAK_URL, REALM
+
+KEY = b"k" * 32
+
+
+@pytest.fixture
+def shm(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path / "cache"), slots=16, slot_size=256)
+    yield cache
+    cache.close()
+
+
+def test_shared_memory_round_trip(shm, clock):
+    now = clock.time()
+    shm.set("jwks:a", {"keys": [1, 2]}, now + 60)
+    shm.set("jwks:a", {"keys": [3]}, now + 60)
+
+    assert shm.get_entry("jwks:a") == ({"keys": [3]}, now + 60)
+    assert shm.get("jwks:missing") is None
+    assert len(shm) == 1
+
+    clock.advance(61)
+    assert shm.get("jwks:a") is None
+    assert len(shm) == 0
+
+
+def test_shared_memory_is_shared_between_instances(shm, clock):
+    other = SharedMemoryCache(shm.path, slots=16, slot_size=256)
+    try:
+        other.set("claims:a", {"sub": "alice"}, clock.time() + 60)
+        assert shm.get("claims:a") == {"sub": "alice"}
+
+        shm.delete("claims:a")
+        assert other.get("claims:a") is None
+
+        other.set("claims:b", 1, clock.time() + 60)
+        shm.clear()
+        assert other.get("claims:b") is None
+    finally:
+        other.close()
+
+
+def test_shared_memory_with_new_geometry_starts_empty(shm, clock):
+    shm.set("claims:a", 1, clock.time() + 60)
+    resized = SharedMemoryCache(shm.path, slots=32, slot_size=256)
+    try:
+        assert resized.get("claims:a") is None
+    finally:
+        resized.close()
+
+
+def test_shared_memory_evicts_the_entry_expiring_first(tmp_path, clock):
+    cache = SharedMemoryCache(str(tmp_path / "cache"), slots=2, slot_size=256)
+    now = clock.time()
+    cache.set("a", "a", now + 30)
+    cache.set("b", "b", now + 60)
+    cache.set("c", "c", now + 90)
+
+    assert [cache.get(key) for key in "abc"] == [None, "b", "c"]
+    assert cache.stats["evictions"] == 1
+    cache.close()
+
+
+def test_shared_memory_skips_oversized_values(shm, clock):
+    shm.set("jwks:big", "x" * 1024, clock.time() + 60)
+
+    assert shm.get("jwks:big") is None
+    assert shm.stats["oversized"] == 1
+
+
+def test_shared_memory_treats_a_torn_slot_as_a_miss(tmp_path, clock):
+    cache = SharedMemoryCache(str(tmp_path / "cache"), slots=2, slot_size=256)
+    cache.set("a", "a", clock.time() + 60)
+    assert cache.get("a") == "a"
+
+    # A writer is in the middle of both slots of the set (odd sequences)
+    offset = cache._set_offset(cache._hash("a"))
+    for slot in offset, offset + cache.slot_size:
+        _SEQUENCE.pack_into(cache._map, slot, _SEQUENCE.unpack_from(cache._map, slot)[0] | 1)
+    assert cache.get("a") is None
+    cache.close()
+
+
+def test_tiered_cache_copies_shared_hits_locally(shm, clock):
+    expires_at = clock.time() + 60
+    writer = TieredCache(TTLCache(), shm)
+    reader = TieredCache(TTLCache(), shm)
+    writer.set("claims:a", {"sub": "alice"}, expires_at)
+
+    assert reader.get_entry("claims:a") == ({"sub": "alice"}, expires_at)
+    shm.clear()
+    # Served from process memory until it expires
+    assert reader.get("claims:a") == {"sub": "alice"}
+    assert reader.local.get_entry("claims:a") == ({"sub": "alice"}, expires_at)
+
+    writer.delete("claims:a")
+    assert writer.get("claims:a") is None
+
+
+def test_tiered_cache_evicts_like_its_shared_backend(shm, redis):
+    assert TieredCache(TTLCache(), shm).evicts
+    assert not TieredCache(TTLCache(), RedisCache(client=redis, noeviction=True)).evicts
+
+
+def test_redis_cache_round_trip(redis, clock):
+    cache = RedisCache(client=redis)
+    now = clock.time()
+    cache.set("introspection:a", {"active": True}, now + 2)
+    cache.set("introspection:b", {"active": False}, now + 60)
+
+    assert redis.ttls["munistream-auth:introspection:a"] == pytest.approx(2000, abs=50)
+    assert cache.get_many(["introspection:a", "introspection:b", "introspection:c"]) == [
+        {"active": True}, {"active": False}, None
+    ]
+    assert redis.calls["mget"] == 1
+
+    clock.advance(3)
+    assert cache.get("introspection:a") is None
+
+
+def test_redis_cache_clears_one_namespace(redis, clock):
+    cache = RedisCache(client=redis)
+    claims, jwks = cache.namespace("claims"), cache.namespace("jwks")
+    claims.set("a", 1, clock.time() + 60)
+    jwks.set("a", 2, clock.time() + 60)
+
+    claims.clear()
+    assert claims.get("a") is None
+    assert jwks.get("a") == 2
+
+
+def test_redis_cache_treats_errors_as_misses(redis, clock):
+    cache = RedisCache(client=redis)
+    redis.data["munistream-auth:bad"] = b"not json"
+    assert cache.get("bad") is None
+
+    redis.get = redis.mget = None
+    assert cache.get("a") is None
+    assert cache.get_many(["a", "b"]) == [None, None]
+    assert cache.stats["errors"] == 2
+
+
+@pytest.mark.parametrize("backend", ["shm", "redis"])
+def test_signed_cache_round_trip(backend, request, clock):
+    shared = request.getfixturevalue(backend)
+    if backend == "redis":
+        shared = RedisCache(client=shared)
+    cache = SignedCache(shared, KEY)
+    now = clock.time()
+    cache.set("claims:a", {"sub": "alice"}, now + 60)
+
+    assert cache.get_entry("claims:a") == ({"sub": "alice"}, now + 60)
+    assert cache.get_many(["claims:a", "claims:b"]) == [{"sub": "alice"}, None]
+    assert cache.stats["rejected"] == 0
+
+
+def test_signed_cache_drops_forged_entries(shm, clock):
+    cache = SignedCache(shm, KEY)
+    expires_at = clock.time() + 60
+    cache.set("claims:a", {"sub": "alice"}, expires_at)
+    value, signed_expiry, mac = shm.get("claims:a")
+
+    # Planted value, extended expiry, entry moved to another key, foreign key
+    shm.set("claims:a", [{"sub": "admin"}, signed_expiry, mac], expires_at)
+    assert cache.get("claims:a") is None
+    assert shm.get("claims:a") is None
+
+    shm.set("claims:a", [value, signed_expiry + 3600, mac], expires_at + 3600)
+    assert cache.get("claims:a") is None
+
+    shm.set("claims:b", [value, signed_expiry, mac], expires_at)
+    assert cache.get_many(["claims:b"]) == [None]
+
+    SignedCache(shm, b"x" * 32).set("claims:c", value, expires_at)
+    assert cache.get("claims:c") is None
+
+    shm.set("claims:d", {"sub": "admin"}, expires_at)
+    assert cache.get("claims:d") is None
+    assert cache.stats["rejected"] == 5
+
+
+def test_signed_cache_is_checked_through_namespaces_and_tiers(redis, clock):
+    shared = SignedCache(RedisCache(client=redis), KEY)
+    claims = TieredCache(TTLCache(), shared.namespace("claims"))
+    claims.set("a", {"sub": "alice"}, clock.time() + 60)
+
+    key = "munistream-auth:claims:a"
+    value, expires_at, mac = json.loads(redis.data[key])[0]
+    redis.data[key] = json.dumps([[{"sub": "admin"}, expires_at, mac], expires_at]).encode()
+    assert TieredCache(TTLCache(), shared.namespace("claims")).get("a") is None
+    assert key not in redis.data
+
+    claims.set("b", 1, clock.time() + 60)
+    claims.clear()
+    assert redis.data == {}
+
+
+@pytest.mark.anyio
+async def test_provider_signs_shared_entries(make_provider, tokens, redis):
+    backend = RedisCache(client=redis, noeviction=True)
+    provider = make_provider(cache_backend=backend)
+    await provider.verify_token(tokens.access_token())
+
+    assert isinstance(provider.claims_cache.shared.backend, SignedCache)
+    assert isinstance(provider.revocations.shared.backend, SignedCache)
+    (key,) = [key for key in redis.data if key.startswith("munistream-auth:claims:")]
+    value, expires_at, mac = json.loads(redis.data[key])[0]
+    assert value["sub"] == tokens.user_id and len(mac) == 64
+
+
+def test_shared_backend_requires_a_signing_key(redis):
+    with pytest.raises(ValueError):
+        KeycloakAuthProvider(KEYCLOAK_URL, REALM, CLIENT_ID, cache_backend=RedisCache(client=redis))
+    with pytest.raises(ValueError):
+        KeycloakAuthProvider(
+            KEYCLOAK_URL, REALM, CLIENT_ID, revocation_backend=RedisCache(client=redis, noeviction=True)
+        )
@@ -0,0 +1,30 @@
+"""
+Verified claims cached by token digest until exp + leeway
+"""
+
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_verified_claims_are_cached_until_exp(provider, tokens, clock):
+    token = tokens.access_token()
+
+    claims = await provider.verify_token(token)
+    assert await provider.verify_token(token) is claims
+    assert provider.claims_cache.stats["hits"] == 1
+
+    clock.advance(claims["exp"] - time.time() + 1)
+    assert await provider.verify_token(token) == claims
+    assert provider.claims_cache.stats["expirations"] == 1
+
+
+async def test_claims_are_kept_for_the_leeway(make_provider, tokens, clock):
+    provider = make_provider(leeway=30)
+    token = tokens.access_token()
+
+    claims = await provider.verify_token(token)
+    clock.advance(claims["exp"] - time.time() + 10)
+    assert await provider.verify_token(token) is claims
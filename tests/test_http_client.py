@@ -0,0 +1,49 @@
+"""
+Shared Keycloak connection pool: one keep-alive client per provider,
+closed by aclose/async with, and HTTP/2 checked at construction.
+"""
+
+import sys
+
+import pytest
+
+from auth_provider import KeycloakAuthProvider
+from conftest import CLIENT_ID, KEYCLOAK_URL, REALM
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_calls_share_one_client(provider, tokens):
+    client = provider.client
+    token = tokens.access_token()
+
+    await provider.get_jwks()
+    await provider.introspect_token(token)
+    await provider.get_user_info(token)
+
+    assert provider.client is client
+    assert not client.is_closed
+
+
+async def test_aclose_closes_the_pool_and_a_new_one_is_created_lazily(provider):
+    client = provider.client
+    await provider.aclose()
+
+    assert client.is_closed
+    assert provider.client is not client
+    await provider.get_jwks()
+
+
+async def test_async_context_manager_closes_the_pool(emulator):
+    async with KeycloakAuthProvider(KEYCLOAK_URL, REALM, CLIENT_ID, transport=emulator.transport()) as provider:
+        await provider.get_jwks()
+        client = provider.client
+
+    assert client.is_closed
+
+
+def test_http2_without_h2_fails_at_construction(monkeypatch):
+    monkeypatch.setitem(sys.modules, "h2", None)
+
+    with pytest.raises(ImportError, match="h2"):
+        KeycloakAuthProvider(KEYCLOAK_URL, REALM, CLIENT_ID, http2=True)
@@ -0,0 +1,115 @@
+"""
+Instrumentation hooks reported by the provider and KeycloakAuth
+"""
+
+import httpx
+import pytest
+
+from auth_provider import (
+    KeycloakAuth,
+    NullInstrumentation,
+    OpenTelemetryInstrumentation,
+    PrometheusInstrumentation,
+    StatsInstrumentation,
+    TokenValidation
+)
+from auth_provider.instrumentation import failure_reason
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def stats():
+    return StatsInstrumentation()
+
+
+async def test_hot_path_operations_and_cache_lookups(make_provider, tokens, stats):
+    provider = make_provider(instrumentation=stats)
+    auth = KeycloakAuth(provider, TokenValidation.INTROSPECT)
+    token = tokens.access_token()
+
+    await auth.authenticate(token)
+    await auth.authenticate(token)
+
+    summary = stats.summary()
+    assert summary["latency"]["authenticate"]["count"] == 2
+    assert summary["latency"]["verify_signature"]["count"] == 1
+    assert summary["latency"]["jwks_fetch"]["count"] == 1
+    assert summary["latency"]["introspection"]["count"] == 1
+    assert summary["cache_hit_ratio"] == {"claims": 0.5, "introspection": 0.5}
+    assert summary["failures"] == {}
+    assert set(summary["in_flight"].values()) == {0}
+
+
+async def test_failures_are_labelled_by_reason(make_provider, emulator, tokens, stats):
+    provider = make_provider(instrumentation=stats)
+    auth = KeycloakAuth(provider, TokenValidation.INTROSPECT)
+    await provider.get_jwks()
+
+    emulator.set_fault("introspection", error_rate=1.0, error_status=502)
+    with pytest.raises(Exception):
+        await auth.authenticate(tokens.access_token())
+    with pytest.raises(Exception):
+        await auth.authenticate(tokens.access_token(aud="another-client"))
+
+    # The HTTPException raised by authenticate carries the status it answers
+    assert stats.summary()["failures"] == {
+        "introspection:http_502": 1,
+        "token_validation:http_502": 1,
+        "authenticate:http_503": 1,
+        "verify_signature:JWTClaimsError": 1,
+        "token_validation:JWTClaimsError": 1,
+        "authenticate:http_401": 1
+    }
+
+
+def test_failure_reasons():
+    request = httpx.Request("GET", "http://keycloak.test")
+
+    assert failure_reason(httpx.HTTPStatusError("", request=request, response=httpx.Response(503))) == "http_503"
+    assert failure_reason(httpx.ReadTimeout("", request=request)) == "timeout"
+    assert failure_reason(httpx.ConnectError("", request=request)) == "connection"
+    assert failure_reason(ValueError()) == "ValueError"
+
+
+def test_null_instrumentation_spans_are_shared():
+    null = NullInstrumentation()
+
+    assert not null.enabled
+    assert null.span("a") is null.span("b")
+
+
+def test_stats_keep_at_most_max_samples():
+    stats = StatsInstrumentation(max_samples=3)
+    for _ in range(5):
+        with stats.span("verify_signature"):
+            pass
+
+    assert stats.summary()["latency"]["verify_signature"]["count"] == 3
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    registry = prometheus_client.CollectorRegistry()
+    instrumentation = PrometheusInstrumentation(registry=registry)
+
+    with instrumentation.span("jwks_fetch"):
+        pass
+    instrumentation.cache_lookup("claims", True)
+
+    assert registry.get_sample_value(
+        "keycloak_auth_operation_seconds_count", {"operation": "jwks_fetch", "outcome": "success"}
+    ) == 1
+    assert registry.get_sample_value(
+        "keycloak_auth_cache_lookups_total", {"cache": "claims", "result": "hit"}
+    ) == 1
+
+
+def test_opentelemetry_spans():
+    pytest.importorskip("opentelemetry.trace")
+    instrumentation = OpenTelemetryInstrumentation()
+
+    with pytest.raises(ValueError):
+        with instrumentation.span("introspection"):
+            raise ValueError("boom")
+    instrumentation.cache_lookup("introspection", False)
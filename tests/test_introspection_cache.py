@@ -0,0 +1,52 @@
+"""
+Introspection results cached by token digest, for the configured TTLs and
+never past the token's exp
+"""
+
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_introspection_results_expire(make_provider, emulator, realm, tokens, clock):
+    provider = make_provider(introspection_cache_ttl=30, introspection_negative_ttl=5)
+    token = tokens.access_token(session=True)
+
+    assert (await provider.introspect_token(token))["active"]
+    assert (await provider.introspect_token(token))["active"]
+    assert emulator.requests["introspection"] == 1
+
+    # Active results are reused for introspection_cache_ttl at most
+    realm.sessions.clear()
+    clock.advance(31)
+    assert not (await provider.introspect_token(token))["active"]
+    assert emulator.requests["introspection"] == 2
+
+    # Inactive results for introspection_negative_ttl
+    clock.advance(4)
+    assert not (await provider.introspect_token(token))["active"]
+    assert emulator.requests["introspection"] == 2
+    clock.advance(2)
+    await provider.introspect_token(token)
+    assert emulator.requests["introspection"] == 3
+
+
+async def test_active_introspection_is_not_cached_past_exp(make_provider, emulator, tokens, clock):
+    provider = make_provider(introspection_cache_ttl=3600)
+    token = tokens.access_token()
+
+    result = await provider.introspect_token(token)
+    clock.advance(result["exp"] - time.time() + 1)
+    await provider.introspect_token(token)
+    assert emulator.requests["introspection"] == 2
+
+
+async def test_introspection_cache_can_be_disabled(make_provider, emulator, tokens):
+    provider = make_provider(introspection_cache_size=0)
+    token = tokens.access_token()
+
+    await provider.introspect_token(token)
+    await provider.introspect_token(token)
+    assert emulator.requests["introspection"] == 2
@@ -0,0 +1,119 @@
+"""
+Single-flight, stale-while-revalidate JWKS refresh honouring Cache-Control
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from jose import JWTError
+
+from auth_provider import KeycloakAuthProvider, SharedMemoryCache
+from conftest import CLIENT_ID, ISSUER, KEYCLOAK_URL, REALM
+from tools.keycloak_emulator import EmulatedRealm
+
+pytestmark = pytest.mark.anyio
+
+
+def certs_transport(realm, cache_control, requests):
+    """Serve the realm's JWKS with the given Cache-Control, counting fetches"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json=realm.jwks, headers={"Cache-Control": cache_control})
+    return httpx.MockTransport(handler)
+
+
+async def refreshed(provider: KeycloakAuthProvider) -> None:
+    """Wait for the refresh get_jwks started in the background"""
+    await provider._jwks_refresh_task
+
+
+async def test_concurrent_verifications_share_one_jwks_fetch(provider, emulator, tokens):
+    results = await asyncio.gather(*(provider.verify_token(tokens.access_token()) for _ in range(20)))
+
+    assert len(results) == 20
+    assert emulator.requests["jwks_fetch"] == 1
+
+
+async def test_unknown_kid_forces_one_rate_limited_refresh(provider, emulator, tokens):
+    await provider.verify_token(tokens.access_token())
+    assert emulator.requests["jwks_fetch"] == 1
+
+    # Keycloak rotates its keys: the new kid triggers a refresh
+    rotated = emulator.add_realm(EmulatedRealm(REALM))
+    user_id = rotated.create_user({"username": "bob"})
+    token = rotated.issue_tokens(ISSUER, user_id, CLIENT_ID, audience=[CLIENT_ID])["access_token"]
+    assert (await provider.verify_token(token))["sub"] == user_id
+    assert emulator.requests["jwks_fetch"] == 2
+
+    # Unknown kids within jwks_min_refresh_interval do not refetch
+    stranger = EmulatedRealm(REALM)
+    stranger_id = stranger.create_user({"username": "mallory"})
+    forged = stranger.issue_tokens(ISSUER, stranger_id, CLIENT_ID, audience=[CLIENT_ID])["access_token"]
+    for _ in range(3):
+        with pytest.raises(JWTError):
+            await provider.verify_token(forged)
+    assert emulator.requests["jwks_fetch"] == 2
+
+
+async def test_stale_key_set_is_served_while_one_refresh_runs(make_provider, emulator, clock):
+    provider = make_provider(jwks_cache_duration=60)
+    jwks = await provider.get_jwks()
+
+    clock.advance(61)
+    assert await asyncio.gather(*(provider.get_jwks() for _ in range(5))) == [jwks] * 5
+    await refreshed(provider)
+
+    # The emulator answers the conditional request with 304
+    assert emulator.requests["jwks_fetch"] == 2
+    assert provider._jwks_cache is jwks
+
+
+async def test_max_age_is_capped_by_jwks_cache_duration(realm, clock):
+    requests = []
+    provider = KeycloakAuthProvider(
+        KEYCLOAK_URL, REALM, CLIENT_ID, jwks_cache_duration=60,
+        transport=certs_transport(realm, "public, max-age=86400", requests)
+    )
+    async with provider:
+        await provider.get_jwks()
+        clock.advance(59)
+        await provider.get_jwks()
+        assert len(requests) == 1
+
+        clock.advance(2)
+        await provider.get_jwks()
+        await refreshed(provider)
+        assert len(requests) == 2
+
+
+async def test_shorter_max_age_is_honoured(realm, clock):
+    requests = []
+    provider = KeycloakAuthProvider(
+        KEYCLOAK_URL, REALM, CLIENT_ID, jwks_cache_duration=3600,
+        transport=certs_transport(realm, "max-age=30", requests)
+    )
+    async with provider:
+        await provider.get_jwks()
+        clock.advance(31)
+        await provider.get_jwks()
+        await refreshed(provider)
+        assert len(requests) == 2
+
+
+async def test_forced_refresh_skips_a_shared_key_set_without_the_kid(make_provider, emulator, clock, tmp_path):
+    backend = SharedMemoryCache(str(tmp_path / "cache"), slots=16)
+    first, second = make_provider(cache_backend=backend), make_provider(cache_backend=backend)
+    await second.get_jwks()
+    await first.get_jwks()
+    assert emulator.requests["jwks_fetch"] == 1
+
+    # The first worker publishes a newer key set, then Keycloak rotates
+    clock.advance(10)
+    await first.refresh_jwks()
+    rotated = emulator.add_realm(EmulatedRealm(REALM))
+    user_id = rotated.create_user({"username": "bob"})
+    token = rotated.issue_tokens(ISSUER, user_id, CLIENT_ID, audience=[CLIENT_ID])["access_token"]
+
+    assert (await second.verify_token(token))["sub"] == user_id
+    assert emulator.requests["jwks_fetch"] == 3
@@ -0,0 +1,127 @@
+"""
+KeycloakAuthMiddleware authenticating once per request at the ASGI layer
+"""
+
+from typing import Optional
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+from auth_provider import (
+    KeycloakAuth,
+    KeycloakAuthMiddleware,
+    Principal,
+    TokenValidation,
+    get_optional_principal,
+    get_principal
+)
+from auth_provider.middleware import compile_path_matcher
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def auth(provider):
+    return KeycloakAuth(provider, TokenValidation.LOCAL)
+
+
+@pytest.fixture
+def authentications(auth, monkeypatch):
+    """Tokens passed to auth.authenticate"""
+    seen = []
+    authenticate = auth.authenticate
+
+    async def counting(token: str) -> Principal:
+        seen.append(token)
+        return await authenticate(token)
+
+    monkeypatch.setattr(auth, "authenticate", counting)
+    return seen
+
+
+@pytest.fixture
+async def client(auth):
+    app = FastAPI()
+    app.add_middleware(
+        KeycloakAuthMiddleware,
+        auth=auth,
+        exclude_paths=["/health", "/docs*"],
+        optional_paths=["/public*"]
+    )
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/me")
+    async def me(user: Principal = Depends(get_principal)):
+        return {"sub": user.sub}
+
+    @app.get("/legacy")
+    async def legacy(user: Principal = Depends(auth.get_current_user)):
+        return {"sub": user.sub}
+
+    @app.get("/public/greeting")
+    async def greeting(user: Optional[Principal] = Depends(get_optional_principal)):
+        return {"sub": user.sub if user else None}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+        yield client
+
+
+def bearer(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def test_authenticated_request(client, tokens, authentications):
+    response = await client.get("/me", headers=bearer(tokens.access_token()))
+
+    assert response.status_code == 200
+    assert response.json() == {"sub": tokens.user_id}
+    assert len(authentications) == 1
+
+
+async def test_missing_or_invalid_token_is_rejected(client, tokens):
+    response = await client.get("/me")
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+    assert response.json() == {"detail": "Authorization header missing"}
+
+    response = await client.get("/me", headers={"Authorization": f"Basic {tokens.access_token()}"})
+    assert response.status_code == 401
+
+    response = await client.get("/me", headers=bearer(tokens.access_token(aud="another-client")))
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid authentication token"}
+
+
+async def test_excluded_paths_skip_authentication(client, authentications):
+    assert (await client.get("/health", headers=bearer("garbage"))).status_code == 200
+    assert (await client.get("/docs/unknown")).status_code == 404
+    assert authentications == []
+
+
+async def test_optional_paths_tolerate_missing_and_invalid_tokens(client, tokens):
+    assert (await client.get("/public/greeting")).json() == {"sub": None}
+    assert (await client.get("/public/greeting", headers=bearer("garbage"))).json() == {"sub": None}
+
+    response = await client.get("/public/greeting", headers=bearer(tokens.access_token()))
+    assert response.json() == {"sub": tokens.user_id}
+
+
+async def test_route_dependency_reuses_the_middleware_result(client, tokens, authentications):
+    response = await client.get("/legacy", headers=bearer(tokens.access_token()))
+
+    assert response.json() == {"sub": tokens.user_id}
+    assert len(authentications) == 1
+
+
+def test_path_patterns():
+    matcher = compile_path_matcher(["/health", "/docs*", "/a.b"])
+
+    assert matcher.fullmatch("/health")
+    assert not matcher.fullmatch("/health/deep")
+    assert matcher.fullmatch("/docs") and matcher.fullmatch("/docs/swagger")
+    assert not matcher.fullmatch("/axb")
+    assert compile_path_matcher([]) is None
@@ -0,0 +1,118 @@
+"""
+partialImport batches of scripts/migrate-users.py
+"""
+
+import sys
+
+import pytest
+
+from conftest import REALM
+
+PARTIAL_IMPORT = f"/admin/realms/{REALM}/partialImport"
+
+
+def customer(i, **fields):
+    return dict({
+        "email": f"citizen{i}@munistream.local",
+        "full_name": f"Citizen Number{i}",
+        "status": "active",
+        "email_verified": True
+    }, **fields)
+
+
+def test_batch_is_created_with_one_request(make_migrator, mongo, realm, live_emulator):
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(4)] + [customer(4, is_business=True)])
+    migrator = make_migrator(workers=1)
+
+    migrator.migrate_customers()
+
+    assert live_emulator.count("POST", PARTIAL_IMPORT) == 1
+    assert live_emulator.count("POST", f"/admin/realms/{REALM}/users") == 0
+    assert migrator.stats["customers_created"] == migrator.stats["customers_processed"] == 5
+
+    source = mongo["munistream"].customers.find_one({"is_business": True})
+    user = realm.find_user(username=source["email"])
+    assert user["attributes"]["original_id"] == [str(source["_id"])]
+    assert realm.role_mappings[user["id"]] == {"verified_citizen", "business_entity"}
+    assert realm.passwords[user["id"]] == "ChangeMe123!"
+
+
+def test_each_mongo_batch_is_one_import(make_migrator, mongo, migrate, live_emulator, monkeypatch):
+    monkeypatch.setattr(migrate, "BATCH_SIZE", 2)
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(5)])
+
+    make_migrator(workers=1).migrate_customers()
+
+    assert live_emulator.count("POST", PARTIAL_IMPORT) == 3
+
+
+def test_skipped_users_are_updated_one_by_one(make_migrator, mongo, realm, live_emulator):
+    existing = realm.create_user({"username": "citizen0@munistream.local", "email": "citizen0@munistream.local"})
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(3)])
+    migrator = make_migrator(workers=1, if_exists="SKIP")
+
+    migrator.migrate_customers()
+
+    assert live_emulator.count("POST", PARTIAL_IMPORT) == 1
+    assert live_emulator.count("PUT", f"/users/{existing}") == 1
+    assert realm.users[existing]["firstName"] == "Citizen"
+    assert "verified_citizen" in realm.role_mappings[existing]
+    assert migrator.stats["customers_created"] == 2
+    assert migrator.stats["customers_updated"] == 1
+
+
+def test_overwrite_replaces_existing_users(make_migrator, mongo, realm):
+    existing = realm.create_user({"username": "citizen0@munistream.local", "email": "citizen0@munistream.local"})
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(2)])
+    migrator = make_migrator(workers=1, if_exists="OVERWRITE")
+
+    migrator.migrate_customers()
+
+    assert existing not in realm.users
+    assert realm.find_user(username="citizen0@munistream.local")["firstName"] == "Citizen"
+    assert migrator.stats["customers_created"] == 1
+    assert migrator.stats["customers_updated"] == 1
+
+
+def test_failed_import_falls_back_to_the_per_user_path(make_migrator, mongo, realm, live_emulator):
+    realm.create_user({"username": "citizen0@munistream.local", "email": "citizen0@munistream.local"})
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(3)])
+    migrator = make_migrator(workers=1, if_exists="FAIL")
+
+    migrator.migrate_customers()
+
+    # The 409 of the import changed nothing; every customer went one by one
+    assert live_emulator.count("POST", PARTIAL_IMPORT) == 1
+    assert live_emulator.count("POST", f"/admin/realms/{REALM}/users") == 2
+    assert migrator.stats["customers_created"] == 2
+    assert migrator.stats["customers_updated"] == 1
+    assert migrator.stats["customers_failed"] == 0
+
+
+def test_duplicates_within_a_batch_take_the_per_user_path(make_migrator, mongo, realm):
+    mongo["munistream"].customers.insert_many([customer(0), customer(0, full_name="Citizen Renamed")])
+    migrator = make_migrator(workers=1)
+
+    migrator.migrate_customers()
+
+    assert realm.find_user(username="citizen0@munistream.local")["lastName"] == "Renamed"
+    assert migrator.stats["customers_created"] == 1
+    assert migrator.stats["customers_updated"] == 1
+
+
+@pytest.mark.parametrize("argv, expected", [
+    ([], "SKIP"),
+    (["--if-exists", "overwrite"], "OVERWRITE")
+])
+def test_if_exists_option(migrate, monkeypatch, argv, expected):
+    monkeypatch.setattr(sys, "argv", ["migrate-users.py"] + argv)
+    assert migrate.parse_args().if_exists == expected
+
+
+def test_invalid_if_exists_from_the_environment_is_rejected(migrate, monkeypatch, capsys):
+    monkeypatch.setattr(migrate, "IF_EXISTS", "REPLACE")
+    monkeypatch.setattr(sys, "argv", ["migrate-users.py"])
+
+    with pytest.raises(SystemExit):
+        migrate.parse_args()
+    assert "MIGRATION_IF_EXISTS must be one of SKIP, OVERWRITE, FAIL" in capsys.readouterr().err
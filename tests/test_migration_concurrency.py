@@ -0,0 +1,142 @@
+"""
+Concurrent batches and admin API rate limiting of scripts/migrate-users.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from conftest import REALM
+
+
+class FakeTime:
+    """Stand-in for the ``time`` module whose sleep advances the clock"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def customers(count):
+    return [
+        {
+            "email": f"citizen{i}@munistream.local",
+            "full_name": f"Citizen Number{i}",
+            "status": "active",
+            "email_verified": False
+        }
+        for i in range(count)
+    ]
+
+
+def test_rate_limiter_spaces_requests_after_the_burst(migrate, monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(migrate, "time", fake_time)
+    limiter = migrate.RateLimiter(rate=10, burst=2)
+
+    for _ in range(5):
+        limiter.acquire()
+
+    assert fake_time.now == pytest.approx(0.3)
+    assert len(fake_time.slept) == 3
+
+
+def test_rate_limiter_refills_while_idle(migrate, monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(migrate, "time", fake_time)
+    limiter = migrate.RateLimiter(rate=10, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    fake_time.now += 1
+    limiter.acquire()
+    limiter.acquire()
+    assert fake_time.slept == []
+
+
+def test_zero_rate_never_waits(migrate, monkeypatch):
+    fake_time = FakeTime()
+    monkeypatch.setattr(migrate, "time", fake_time)
+    limiter = migrate.RateLimiter(rate=0)
+
+    for _ in range(100):
+        limiter.acquire()
+    assert fake_time.slept == []
+
+
+def test_rate_limited_admin_takes_a_token_per_call(migrate):
+    class Limiter:
+        acquired = 0
+
+        def acquire(self):
+            self.acquired += 1
+
+    class Admin:
+        realm_name = "munistream"
+
+        def get_users(self, query):
+            return [query]
+
+    limiter = Limiter()
+    admin = migrate.RateLimitedAdmin(Admin(), limiter)
+
+    assert admin.realm_name == "munistream"
+    assert admin.get_users({"max": 1}) == [{"max": 1}]
+    assert admin.get_users({}) == [{}]
+    assert limiter.acquired == 2
+
+
+def test_batch_runs_users_concurrently(make_migrator):
+    migrator = make_migrator(workers=4)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def migrate_customer(customer):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return customer["_id"] != 3
+
+    failed = migrator._run_batch(migrate_customer, [{"_id": i} for i in range(8)])
+
+    assert failed == [3]
+    assert peak[0] == 4
+
+
+def test_concurrent_migration_creates_every_customer(make_migrator, mongo, emulator):
+    mongo["munistream"].customers.insert_many(customers(12))
+    migrator = make_migrator(workers=4, bulk_import=False)
+
+    migrator.migrate_customers()
+
+    realm = emulator.realm(REALM)
+    migrated = {user["username"] for user in realm.users.values()}
+    assert {f"citizen{i}@munistream.local" for i in range(12)} <= migrated
+    assert migrator.stats["customers_created"] == migrator.stats["customers_processed"] == 12
+    assert migrator.stats["customers_failed"] == 0
+    # Role assignment is not lost to concurrent workers
+    citizens = [user_id for user_id, user in realm.users.items() if user["username"].startswith("citizen")]
+    assert all("citizen" in realm.role_mappings[user_id] for user_id in citizens)
+
+
+def test_admin_calls_go_through_the_rate_limiter(make_migrator, mongo, monkeypatch):
+    mongo["munistream"].customers.insert_many(customers(3))
+    migrator = make_migrator(workers=2, bulk_import=False, rate_limit=1000)
+    acquired = []
+    monkeypatch.setattr(migrator.rate_limiter, "acquire", lambda: acquired.append(True))
+
+    migrator.migrate_customers()
+
+    assert migrator.stats["customers_created"] == 3
+    # Lookups, creation, password and roles of each customer
+    assert len(acquired) >= 3 * 4
@@ -0,0 +1,107 @@
+"""
+Realm role cache and grouped role assignment in scripts/migrate-users.py
+"""
+
+import logging
+
+import pytest
+
+from conftest import REALM
+
+ADMIN = f"/admin/realms/{REALM}"
+
+
+def customer(i, **fields):
+    return dict({
+        "email": f"citizen{i}@munistream.local",
+        "full_name": f"Citizen Number{i}",
+        "status": "active",
+        "email_verified": True,
+        "is_business": True
+    }, **fields)
+
+
+def role_assignments(live_emulator) -> int:
+    return live_emulator.count("POST", "/role-mappings/realm")
+
+
+@pytest.fixture
+def admin_calls(migrate, monkeypatch):
+    """Calls of KeycloakAdmin methods by name (python-keycloak may send several requests per call)"""
+    calls = {}
+    for name in ("get_realm_roles", "get_realm_role", "get_realm_role_members", "get_realm_roles_of_user"):
+        method = getattr(migrate.KeycloakAdmin, name)
+
+        def spy(self, *args, _name=name, _method=method, **kwargs):
+            calls[_name] = calls.get(_name, 0) + 1
+            return _method(self, *args, **kwargs)
+
+        monkeypatch.setattr(migrate.KeycloakAdmin, name, spy)
+    return calls
+
+
+def test_realm_roles_are_fetched_once_and_assigned_in_one_call(
+    make_migrator, mongo, emulator, live_emulator, admin_calls
+):
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(4)])
+    migrator = make_migrator(workers=2, bulk_import=False)
+
+    migrator.migrate_customers()
+
+    assert admin_calls == {"get_realm_roles": 1}
+    assert role_assignments(live_emulator) == 4
+    realm = emulator.realm(REALM)
+    user = realm.find_user(username="citizen0@munistream.local")
+    assert realm.role_mappings[user["id"]] == {"verified_citizen", "business_entity"}
+
+
+def test_held_roles_are_not_assigned_again(make_migrator, mongo, emulator, live_emulator, admin_calls):
+    realm = emulator.realm(REALM)
+    user_id = realm.create_user({"username": "citizen0@munistream.local", "email": "citizen0@munistream.local"})
+    realm.role_mappings[user_id].add("verified_citizen")
+    mongo["munistream"].customers.insert_many([customer(0), customer(1, is_business=False)])
+    migrator = make_migrator(workers=1, bulk_import=False)
+
+    migrator.migrate_customers()
+
+    # Only the missing business_entity role is sent for the existing user
+    assert admin_calls["get_realm_roles_of_user"] == 1
+    assert role_assignments(live_emulator) == 2
+    assert realm.role_mappings[user_id] == {"verified_citizen", "business_entity"}
+
+    live_emulator.paths.clear()
+    make_migrator(workers=1, bulk_import=False).migrate_customers()
+    assert role_assignments(live_emulator) == 0
+
+
+def test_indexed_runs_diff_against_role_members(
+    make_migrator, mongo, migrate, live_emulator, admin_calls, monkeypatch
+):
+    monkeypatch.setattr(migrate, "INDEX_THRESHOLD", 1)
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(3)])
+    make_migrator(workers=1, bulk_import=False).migrate_customers()
+
+    live_emulator.paths.clear()
+    admin_calls.clear()
+    make_migrator(workers=1, bulk_import=False).migrate_customers()
+
+    assert admin_calls == {"get_realm_roles": 1, "get_realm_role_members": len(migrate.MAPPED_ROLES)}
+    assert role_assignments(live_emulator) == 0
+
+
+def test_missing_realm_role_is_reported_once(make_migrator, mongo, emulator, live_emulator, caplog):
+    realm = emulator.realm(REALM)
+    del realm.roles["business_entity"]
+    mongo["munistream"].customers.insert_many([customer(i) for i in range(3)])
+    migrator = make_migrator(workers=1)
+
+    with caplog.at_level(logging.WARNING):
+        migrator.migrate_customers()
+
+    warnings = [record for record in caplog.records if "business_entity does not exist" in record.getMessage()]
+    assert len(warnings) == 1
+    # The import still succeeds with the roles that exist
+    assert live_emulator.count("POST", f"{ADMIN}/partialImport") == 1
+    assert migrator.stats["customers_created"] == 3
+    user = realm.find_user(username="citizen2@munistream.local")
+    assert realm.role_mappings[user["id"]] == {"verified_citizen"}
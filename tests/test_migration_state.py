@@ -0,0 +1,128 @@
+"""
+Checkpoints, resume and delta runs of scripts/migrate-users.py
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+from bson import ObjectId  # noqa: E402
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo["munistream"]
+
+
+@pytest.fixture
+def migrator_for(make_migrator, migrate, monkeypatch):
+    """Build migrators in a mode, with batches of two documents"""
+    monkeypatch.setattr(migrate, "BATCH_SIZE", 2)
+    return lambda mode: make_migrator(workers=1, mode=mode)
+
+
+class Recorder:
+    """process_batch stand-in recording migrated _ids"""
+
+    def __init__(self, fail=(), crash_after=None):
+        self.ids = []
+        self.fail = set(fail)
+        self.crash_after = crash_after
+
+    def __call__(self, batch):
+        if self.crash_after is not None and len(self.ids) >= self.crash_after:
+            raise RuntimeError("Keycloak went away")
+        self.ids.extend(document["_id"] for document in batch)
+        return [document["_id"] for document in batch if document["_id"] in self.fail]
+
+
+def insert(db, count, updated_at):
+    ids = [ObjectId() for _ in range(count)]
+    db.users.insert_many([{"_id": _id, "username": f"user{_id}", "updated_at": updated_at} for _id in ids])
+    return ids
+
+
+def test_state_round_trips_object_ids_and_datetimes(migrate, tmp_path):
+    path = str(tmp_path / "state.json")
+    state = migrate.MigrationState(path)
+    checkpoint = state.collection("users")
+    checkpoint.update(last_id=ObjectId(), started_at=datetime(2024, 5, 1, 12, 30), query={"_id": {"$in": [ObjectId()]}})
+    state.save()
+
+    assert migrate.MigrationState(path).collection("users") == checkpoint
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_resume_continues_after_the_last_checkpoint(migrator_for, db):
+    ids = insert(db, 5, datetime.utcnow())
+
+    crashed = Recorder(crash_after=2)
+    with pytest.raises(RuntimeError):
+        migrator_for("full")._migrate_collection("users", crashed)
+    assert crashed.ids == ids[:2]
+
+    resumed = Recorder()
+    migrator_for("resume")._migrate_collection("users", resumed)
+    assert resumed.ids == ids[2:]
+
+    # A completed run leaves nothing to resume
+    again = Recorder()
+    migrator_for("resume")._migrate_collection("users", again)
+    assert again.ids == []
+
+
+def test_delta_migrates_changed_new_and_failed_documents(migrator_for, db):
+    long_ago = datetime.utcnow() - timedelta(days=1)
+    ids = insert(db, 4, long_ago)
+    migrator_for("full")._migrate_collection("users", Recorder(fail=[ids[1]]))
+
+    changed = ids[2]
+    db.users.update_one({"_id": changed}, {"$set": {"updated_at": datetime.utcnow()}})
+    added = insert(db, 1, long_ago)
+    # MongoDB datetimes have millisecond precision: start the delta run in
+    # a later millisecond than the change, or the next delta includes it too
+    time.sleep(0.002)
+
+    delta = Recorder()
+    migrator_for("delta")._migrate_collection("users", delta)
+    assert delta.ids == [ids[1], changed] + added
+
+    # The retried failure succeeded, so the next delta is empty
+    empty = Recorder()
+    migrator_for("delta")._migrate_collection("users", empty)
+    assert empty.ids == []
+
+
+def test_delta_without_a_completed_run_migrates_everything(migrator_for, db):
+    ids = insert(db, 3, datetime.utcnow())
+
+    delta = Recorder()
+    migrator_for("delta")._migrate_collection("users", delta)
+    assert delta.ids == ids
+
+
+def test_small_delta_does_not_index_the_realm(migrator_for, db, migrate, monkeypatch):
+    monkeypatch.setattr(migrate, "INDEX_THRESHOLD", 3)
+    indexed = []
+    monkeypatch.setattr(migrate.UserMigrator, "load_existing_users", lambda self: indexed.append(True))
+
+    insert(db, 2, datetime.utcnow())
+    migrator_for("full")._migrate_collection("users", Recorder())
+    assert indexed == []
+
+    insert(db, 3, datetime.utcnow())
+    migrator_for("full")._migrate_collection("users", Recorder())
+    assert indexed == [True]
+
+
+def test_invalid_mode_from_the_environment_is_rejected(migrate, monkeypatch, capsys):
+    monkeypatch.setattr(migrate, "MODE", "incremental")
+    monkeypatch.setattr(sys, "argv", ["migrate-users.py"])
+
+    with pytest.raises(SystemExit):
+        migrate.parse_args()
+    assert "MIGRATION_MODE must be one of full, resume, delta" in capsys.readouterr().err
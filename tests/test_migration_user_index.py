@@ -0,0 +1,128 @@
+"""
+Index of existing Keycloak users in scripts/migrate-users.py
+"""
+
+import pytest
+
+from conftest import REALM
+
+USERS = f"/admin/realms/{REALM}/users"
+
+
+def admin_user(i, **fields):
+    return dict({
+        "username": f"clerk{i}",
+        "email": f"clerk{i}@munistream.gob",
+        "full_name": f"Clerk Number{i}",
+        "status": "active",
+        "role": "reviewer",
+        "department": "permits"
+    }, **fields)
+
+
+def test_index_finds_by_original_id_then_username_then_email(migrate):
+    index = migrate.UserIndex()
+    alice = {"id": "1", "username": "Alice", "email": "alice@munistream.local", "attributes": {"original_id": ["a1"]}}
+    bob = {"id": "2", "username": "bob", "email": "BOB@munistream.local"}
+    index.add(alice)
+    index.add(bob)
+
+    assert index.find("a1", username="bob") is alice
+    assert index.find("unknown", username="ALICE") is alice
+    assert index.find(email="bob@munistream.local") is bob
+    assert index.find("unknown", username="carol", email="carol@munistream.local") is None
+    assert len(index) == 2
+
+
+def test_reindexed_user_drops_its_old_email(migrate):
+    index = migrate.UserIndex()
+    index.add({"id": "1", "username": "alice", "email": "old@munistream.local"})
+    index.add({"id": "1", "username": "alice", "email": "new@munistream.local"})
+
+    assert index.find(email="old@munistream.local") is None
+    assert index.find(email="new@munistream.local")["id"] == "1"
+
+    index.add_roles("1", ["citizen"])
+    index.add_roles("1", ["reviewer"])
+    assert index.roles_of("1") == {"citizen", "reviewer"}
+    assert index.roles_of("2") == set()
+
+
+def test_up_to_date_ignores_volatile_and_empty_attributes(migrate):
+    existing = {
+        "username": "alice", "email": "alice@munistream.local", "firstName": "Alice", "lastName": "",
+        "enabled": True, "emailVerified": True,
+        "attributes": {"phone": ["555"], "migration_date": ["2024-01-01"]}
+    }
+    migrated = dict(existing, username="ALICE", attributes={"phone": "555", "department": "", "migration_date": "now"})
+
+    assert migrate._is_up_to_date(existing, migrated)
+    assert not migrate._is_up_to_date(existing, dict(migrated, firstName="Alicia"))
+    assert not migrate._is_up_to_date(existing, dict(migrated, attributes={"phone": "556"}))
+
+
+def test_existing_users_are_loaded_page_by_page(make_migrator, emulator, live_emulator):
+    realm = emulator.realm(REALM)
+    for i in range(5):
+        user_id = realm.create_user({"username": f"existing{i}", "attributes": {"original_id": [f"id{i}"]}})
+        realm.role_mappings[user_id].add("citizen")
+    migrator = make_migrator()
+
+    migrator.load_existing_users(page_size=2)
+
+    # The realm export brings users of its own
+    assert len(migrator.user_index) == len(realm.users)
+    assert live_emulator.count("GET", USERS) == len(realm.users) // 2 + 1
+    user = migrator.user_index.find("id3")
+    assert user["username"] == "existing3"
+    assert migrator.user_index.roles_of(user["id"]) == {"citizen"}
+
+
+def test_large_runs_look_users_up_in_the_index(make_migrator, mongo, migrate, emulator, live_emulator, monkeypatch):
+    monkeypatch.setattr(migrate, "INDEX_THRESHOLD", 3)
+    users = mongo["munistream"].users
+    users.insert_many([admin_user(i) for i in range(4)])
+    make_migrator(workers=1, bulk_import=False).migrate_admin_users()
+
+    live_emulator.paths.clear()
+    users.update_one({"username": "clerk1"}, {"$set": {"department": "licenses"}})
+    migrator = make_migrator(workers=1, bulk_import=False)
+    migrator.migrate_admin_users()
+
+    # One page of users, no per-user searches, and only the changed user written
+    assert live_emulator.count("GET", USERS) == 1
+    assert live_emulator.count("PUT", "") == 1
+    assert migrator.stats["users_updated"] == 1
+    assert migrator.stats["users_unchanged"] == 3
+    assert emulator.realm(REALM).find_user(username="clerk1")["attributes"]["department"] == ["licenses"]
+
+
+def test_small_runs_search_by_original_id(make_migrator, mongo, emulator, live_emulator):
+    mongo["munistream"].users.insert_one(admin_user(0))
+    make_migrator(workers=1, bulk_import=False).migrate_admin_users()
+
+    # Renamed in MongoDB: found through original_id, not created twice
+    mongo["munistream"].users.update_one({"username": "clerk0"}, {"$set": {"username": "clerk-zero"}})
+    migrator = make_migrator(workers=1, bulk_import=False)
+    migrator.migrate_admin_users()
+
+    assert migrator.user_index is None
+    assert migrator.stats["users_updated"] == 1
+    assert len([user for user in emulator.realm(REALM).users.values() if user["username"].startswith("clerk")]) == 1
+
+
+@pytest.mark.parametrize("if_exists", ["SKIP", "FAIL"])
+def test_indexed_users_are_not_sent_to_partial_import(make_migrator, mongo, migrate, live_emulator, monkeypatch, if_exists):
+    monkeypatch.setattr(migrate, "INDEX_THRESHOLD", 1)
+    mongo["munistream"].users.insert_one(admin_user(0))
+    make_migrator(workers=1).migrate_admin_users()
+
+    mongo["munistream"].users.insert_one(admin_user(1))
+    live_emulator.paths.clear()
+    migrator = make_migrator(workers=1, if_exists=if_exists)
+    migrator.migrate_admin_users()
+
+    assert live_emulator.count("POST", f"/admin/realms/{REALM}/partialImport") == 1
+    assert migrator.stats["users_created"] == 1
+    assert migrator.stats["users_unchanged"] == 1
+    assert migrator.stats["users_failed"] == 0
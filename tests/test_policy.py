@@ -0,0 +1,113 @@
+"""
+Role expression compilation and evaluation
+"""
+
+import json
+
+import pytest
+
+from auth_provider import PolicyError, Principal, RoleIndex, compile_policy
+
+from conftest import CLIENT_ID, REALM_EXPORT
+
+
+def principal(*roles: str, **client_roles) -> Principal:
+    return Principal({
+        "sub": "user",
+        "realm_access": {"roles": list(roles)},
+        "resource_access": {client: {"roles": list(names)} for client, names in client_roles.items()}
+    }, CLIENT_ID)
+
+
+@pytest.mark.parametrize("expression, roles, allowed", [
+    ("admin", ("admin",), True),
+    ("admin", ("citizen",), False),
+    ("admin | manager", ("manager",), True),
+    ("admin & manager", ("manager",), False),
+    # ! binds tighter than &, which binds tighter than |
+    ("admin | manager & reviewer", ("admin",), True),
+    ("admin | manager & reviewer", ("manager",), False),
+    ("(admin | manager) & reviewer", ("admin",), False),
+    ("(admin | manager) & reviewer", ("admin", "reviewer"), True),
+    ("!citizen & viewer", ("viewer",), True),
+    ("!citizen & viewer", ("viewer", "citizen"), False),
+    ("!!admin", ("admin",), True),
+    ("!(admin | manager)", ("citizen",), True),
+    ("!(admin | manager)", ("manager",), False),
+    ("  admin  ", ("admin",), True),
+])
+def test_evaluation(expression, roles, allowed):
+    assert compile_policy(expression).evaluate(principal(*roles)) is allowed
+
+
+def test_client_roles_are_addressed_with_their_client():
+    policy = compile_policy("reports:export | admin")
+
+    assert policy.evaluate(principal(reports=["export"]))
+    assert not policy.evaluate(principal("export"))
+    assert not policy.evaluate(principal(billing=["export"]))
+
+
+def test_backend_client_roles_merge_into_plain_roles():
+    assert compile_policy("auditor").evaluate(principal(**{CLIENT_ID: ["auditor"]}))
+
+
+@pytest.mark.parametrize("expression", [
+    "",
+    "   ",
+    "admin &",
+    "& admin",
+    "(admin",
+    "admin)",
+    "admin manager",
+    "admin || manager",
+    "admin, manager",
+])
+def test_malformed_expressions_are_rejected(expression):
+    with pytest.raises(PolicyError):
+        compile_policy(expression)
+
+
+@pytest.mark.parametrize("expression", ["admin & !admin", "(admin | manager) & !admin & !manager"])
+def test_unsatisfiable_policies_are_rejected(expression):
+    with pytest.raises(PolicyError, match="never be satisfied"):
+        compile_policy(expression)
+
+
+def test_roles_are_validated_against_the_index():
+    index = RoleIndex.from_realm_export(REALM_EXPORT)
+
+    assert compile_policy("admin | citizen", index).evaluate(principal("citizen"))
+    with pytest.raises(PolicyError, match="Unknown role: adminn"):
+        compile_policy("adminn", index)
+
+
+def test_roles_unknown_to_the_index_are_ignored_in_masks():
+    policy = compile_policy("admin", RoleIndex(["admin", "citizen"]))
+
+    assert not policy.evaluate(principal("superuser"))
+    assert policy.evaluate(principal("superuser", "admin"))
+
+
+def test_backend_client_roles_are_indexed_by_plain_name(tmp_path):
+    export = tmp_path / "realm.json"
+    export.write_text(json.dumps({
+        "roles": {
+            "realm": [{"name": "admin"}],
+            "client": {
+                CLIENT_ID: [{"name": "auditor"}],
+                "reports": [{"name": "export"}]
+            }
+        }
+    }))
+
+    index = RoleIndex.from_realm_export(str(export), client_id=CLIENT_ID)
+    assert set(index.roles) == {"admin", f"{CLIENT_ID}:auditor", "auditor", "reports:export"}
+    assert compile_policy("auditor", index).evaluate(principal(**{CLIENT_ID: ["auditor"]}))
+    assert compile_policy(f"{CLIENT_ID}:auditor", index).evaluate(principal(**{CLIENT_ID: ["auditor"]}))
+    with pytest.raises(PolicyError, match="Unknown role: export"):
+        compile_policy("export", index)
+
+    # Without the client id only the client:role names are known
+    with pytest.raises(PolicyError, match="Unknown role: auditor"):
+        compile_policy("auditor", RoleIndex.from_realm_export(str(export)))
@@ -0,0 +1,94 @@
+"""
+Principal: immutable, slotted view over verified claims with lazily
+computed roles and the former user dict's keys
+"""
+
+import pytest
+
+from auth_provider import Principal
+from conftest import CLIENT_ID
+
+CLAIMS = {
+    "sub": "user-1",
+    "email": "alice@munistream.local",
+    "preferred_username": "alice",
+    "name": "Alice Doe",
+    "email_verified": True,
+    "realm_access": {"roles": ["citizen"]},
+    "resource_access": {
+        CLIENT_ID: {"roles": ["reviewer"]},
+        "munistream-frontend": {"roles": ["viewer"]}
+    },
+    "groups": ["/staff"]
+}
+
+
+class Expander:
+    """Adds the roles granted through /staff and counts expansions"""
+
+    def __init__(self):
+        self.calls = []
+
+    def expand(self, roles, groups):
+        self.calls.append((roles, groups))
+        extra = {"employee", f"{CLIENT_ID}:approver"} if "/staff" in groups else set()
+        return roles | extra
+
+
+def test_claims_and_roles():
+    principal = Principal(CLAIMS, CLIENT_ID)
+
+    assert (principal.sub, principal.username, principal.email) == ("user-1", "alice", "alice@munistream.local")
+    assert principal.realm_roles == {"citizen"}
+    assert principal.client_roles == {CLIENT_ID: {"reviewer"}, "munistream-frontend": {"viewer"}}
+    assert principal.roles == {"citizen", "reviewer"}
+    assert principal.has_role("reviewer") and not principal.has_role("viewer")
+
+
+def test_dict_style_access_mirrors_the_user_dict():
+    principal = Principal(CLAIMS, CLIENT_ID)
+
+    assert dict(principal) == {
+        "sub": "user-1",
+        "email": "alice@munistream.local",
+        "username": "alice",
+        "name": "Alice Doe",
+        "roles": frozenset({"citizen", "reviewer"}),
+        "email_verified": True,
+        "token_claims": CLAIMS
+    }
+    assert principal.get("groups") is None
+    with pytest.raises(KeyError):
+        principal["exp"]
+
+
+def test_missing_claims():
+    principal = Principal({"sub": "user-2", "resource_access": None}, CLIENT_ID)
+
+    assert principal.roles == frozenset()
+    assert principal.client_roles == {}
+    assert principal.email_verified is False
+
+
+def test_is_immutable_and_slotted():
+    principal = Principal(CLAIMS, CLIENT_ID)
+
+    with pytest.raises(AttributeError):
+        principal.sub = "other"
+    with pytest.raises(AttributeError):
+        del principal.client_id
+    assert not hasattr(principal, "__dict__")
+
+
+def test_roles_are_expanded_once():
+    expander = Expander()
+    principal = Principal(CLAIMS, CLIENT_ID, expander)
+
+    assert principal.roles == {"citizen", "employee", "reviewer", "approver"}
+    assert principal.client_roles["munistream-frontend"] == {"viewer"}
+    assert principal.roles is principal.roles
+    assert len(expander.calls) == 1
+
+    roles, groups = expander.calls[0]
+    assert roles == {"citizen", f"{CLIENT_ID}:reviewer", "munistream-frontend:viewer"}
+    assert groups == {"/staff"}
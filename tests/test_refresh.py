@@ -0,0 +1,59 @@
+"""
+Refresh-token grants coalesced per refresh token and replayed within
+refresh_replay_window
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_refreshes_share_one_grant(provider, emulator, tokens):
+    refresh_token = tokens.issue(session=True)["refresh_token"]
+
+    results = await asyncio.gather(*(provider.refresh_token(refresh_token) for _ in range(10)))
+
+    assert emulator.requests["token"] == 1
+    assert all(result is results[0] for result in results)
+
+    # Duplicates within refresh_replay_window get the same response
+    assert await provider.refresh_token(refresh_token) is results[0]
+    assert emulator.requests["token"] == 1
+
+
+async def test_replay_ends_with_the_window(make_provider, emulator, tokens, clock):
+    provider = make_provider(refresh_replay_window=5)
+    refresh_token = tokens.issue(session=True)["refresh_token"]
+
+    first = await provider.refresh_token(refresh_token)
+    clock.advance(6)
+    second = await provider.refresh_token(refresh_token)
+
+    assert emulator.requests["token"] == 2
+    assert second is not first
+
+
+async def test_refresh_is_not_replayed_without_a_window(make_provider, emulator, tokens):
+    provider = make_provider(refresh_replay_window=0)
+    refresh_token = tokens.issue(session=True)["refresh_token"]
+
+    first = await provider.refresh_token(refresh_token)
+    second = await provider.refresh_token(refresh_token)
+
+    assert emulator.requests["token"] == 2
+    assert first["access_token"] != second["access_token"]
+
+
+async def test_failed_grants_are_not_replayed(provider, emulator, tokens):
+    refresh_token = tokens.issue(session=True)["refresh_token"]
+
+    emulator.set_fault("token", error_rate=1.0, error_status=503)
+    with pytest.raises(httpx.HTTPStatusError):
+        await provider.refresh_token(refresh_token)
+
+    emulator.clear_faults()
+    assert "access_token" in await provider.refresh_token(refresh_token)
+    assert emulator.requests["token"] == 2
@@ -0,0 +1,104 @@
+"""
+Multi-realm registry dispatching tokens to per-realm providers by issuer
+"""
+
+import pytest
+from jose import JWTError
+
+from auth_provider import KeycloakAuth, KeycloakProviderRegistry, TokenValidation, registry as registry_module
+from conftest import CLIENT_ID, CLIENT_SECRET, ISSUER, KEYCLOAK_URL, REALM
+from tools.keycloak_emulator import EmulatedRealm
+
+pytestmark = pytest.mark.anyio
+
+OPERATORS = "operators"
+OPERATORS_CLIENT = "operators-backend"
+
+
+@pytest.fixture
+def operators(emulator):
+    realm = emulator.add_realm(EmulatedRealm(OPERATORS))
+    realm.add_client(OPERATORS_CLIENT, secret="operators-secret")
+    return realm
+
+
+@pytest.fixture
+async def registry(emulator, operators):
+    registry = KeycloakProviderRegistry(
+        KEYCLOAK_URL,
+        {REALM: {}, OPERATORS: {"client_id": OPERATORS_CLIENT, "client_secret": "operators-secret"}},
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        transport=emulator.transport()
+    )
+    yield registry
+    await registry.aclose()
+
+
+def operator_token(realm: EmulatedRealm) -> str:
+    user_id = realm.create_user({"username": "olivia"})
+    return realm.issue_tokens(
+        f"{KEYCLOAK_URL}/realms/{OPERATORS}", user_id, OPERATORS_CLIENT
+    )["access_token"]
+
+
+async def test_tokens_are_dispatched_to_their_realm(registry, tokens, operators):
+    assert list(registry.providers) == []
+
+    citizen = await registry.verify_token(tokens.access_token())
+    operator = await registry.verify_token(operator_token(operators))
+
+    assert citizen["iss"] == ISSUER
+    assert operator["iss"] == f"{KEYCLOAK_URL}/realms/{OPERATORS}"
+    assert {(p.realm, p.client_id) for p in registry.providers} == {
+        (REALM, CLIENT_ID), (OPERATORS, OPERATORS_CLIENT)
+    }
+
+
+async def test_untrusted_issuers_are_rejected(registry, emulator, tokens):
+    other = emulator.add_realm(EmulatedRealm("other"))
+    user_id = other.create_user({"username": "eve"})
+    candidates = [
+        other.issue_tokens(f"{KEYCLOAK_URL}/realms/other", user_id, CLIENT_ID)["access_token"],
+        tokens.access_token(iss="http://evil.test/realms/munistream"),
+        tokens.access_token(iss=None),
+        "not-a-jwt"
+    ]
+
+    for token in candidates:
+        with pytest.raises(JWTError):
+            registry.resolve(token)
+    assert list(registry.providers) == []
+
+
+async def test_resolved_tokens_skip_decoding(registry, tokens, monkeypatch):
+    decoded = []
+    get_unverified_claims = registry_module.jwt.get_unverified_claims
+
+    def counting(token):
+        decoded.append(token)
+        return get_unverified_claims(token)
+
+    monkeypatch.setattr(registry_module.jwt, "get_unverified_claims", counting)
+    token = tokens.access_token()
+
+    provider = registry.resolve(token)
+    assert registry.resolve(token) is provider
+    assert len(decoded) == 1
+
+
+async def test_resolved_tokens_are_bounded(registry, tokens, monkeypatch):
+    monkeypatch.setattr(registry_module, "_RESOLVED_TOKENS_SIZE", 2)
+
+    for _ in range(5):
+        registry.resolve(tokens.access_token())
+    assert len(registry._by_token) <= 2
+
+
+async def test_keycloak_auth_accepts_a_registry(registry, tokens, operators):
+    auth = KeycloakAuth(registry, TokenValidation.LOCAL)
+
+    assert (await auth.authenticate(tokens.access_token())).sub == tokens.user_id
+    principal = await auth.authenticate(operator_token(operators))
+    assert principal.username == "olivia"
+    assert principal.client_id == OPERATORS_CLIENT
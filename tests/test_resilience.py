@@ -0,0 +1,118 @@
+"""
+Circuit breaker states and degraded-mode acceptance against an unavailable
+emulated Keycloak
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from auth_provider import CircuitBreaker, CircuitOpenError, KeycloakAuth, TokenValidation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+
+
+async def test_breaker_opens_fails_fast_and_recovers(make_provider, emulator, tokens, breaker):
+    provider = make_provider(circuit_breaker=breaker)
+    token = tokens.access_token()
+    emulator.set_fault("introspection", error_rate=1.0)
+
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await provider.introspect_token(token)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: calls fail without reaching Keycloak
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await provider.introspect_token(token)
+    assert 0 < excinfo.value.retry_after <= 0.05
+    assert emulator.requests["introspection"] == 2
+
+    # Half-open: one probe goes through and closes the circuit
+    await asyncio.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    emulator.clear_faults()
+    assert (await provider.introspect_token(token))["active"]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_failed_probe_reopens_the_breaker(make_provider, emulator, tokens, breaker):
+    provider = make_provider(circuit_breaker=breaker)
+    emulator.set_fault("introspection", error_rate=1.0)
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            await provider.introspect_token(tokens.access_token())
+
+    await asyncio.sleep(0.06)
+    with pytest.raises(httpx.HTTPStatusError):
+        await provider.introspect_token(tokens.access_token())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert emulator.requests["introspection"] == 3
+
+
+async def test_client_errors_do_not_open_the_breaker(make_provider, emulator, tokens, breaker):
+    provider = make_provider(circuit_breaker=breaker)
+    emulator.set_fault("introspection", error_rate=1.0, error_status=400)
+
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await provider.introspect_token(tokens.access_token())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_unavailable_introspection_answers_503(make_provider, emulator, tokens, breaker):
+    auth = KeycloakAuth(make_provider(circuit_breaker=breaker), TokenValidation.INTROSPECT)
+    emulator.set_fault("introspection", error_rate=1.0)
+
+    for _ in range(3):
+        with pytest.raises(HTTPException) as excinfo:
+            await auth.authenticate(tokens.access_token())
+        assert excinfo.value.status_code == 503
+        assert "Retry-After" in excinfo.value.headers
+
+
+async def test_degraded_mode_accepts_recent_verified_tokens(make_provider, emulator, tokens, breaker):
+    auth = KeycloakAuth(
+        make_provider(circuit_breaker=breaker),
+        TokenValidation.INTROSPECT,
+        degraded_mode=True,
+        degraded_max_token_age=60
+    )
+    emulator.set_fault("introspection", error_rate=1.0)
+
+    # Accepted while introspection fails and once the circuit is open
+    for _ in range(3):
+        principal = await auth.authenticate(tokens.access_token())
+        assert principal.sub == tokens.user_id
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Tokens older than degraded_max_token_age still need introspection
+    old = tokens.access_token(iat=int(time.time()) - 120)
+    with pytest.raises(HTTPException) as excinfo:
+        await auth.authenticate(old)
+    assert excinfo.value.status_code == 503
+
+    # So do tokens issued before a revocation notice
+    token = tokens.access_token()
+    auth.mark_revocation()
+    with pytest.raises(HTTPException) as excinfo:
+        await auth.authenticate(token)
+    assert excinfo.value.status_code == 503
+
+
+async def test_degraded_mode_still_rejects_inactive_tokens(make_provider, realm, tokens):
+    auth = KeycloakAuth(make_provider(), TokenValidation.INTROSPECT, degraded_mode=True)
+    token = tokens.access_token(session=True)
+    realm.sessions.clear()
+
+    with pytest.raises(HTTPException) as excinfo:
+        await auth.authenticate(token)
+    assert excinfo.value.status_code == 401
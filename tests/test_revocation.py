@@ -0,0 +1,108 @@
+"""
+RevocationList: exact entries, Bloom filter compaction, and revocations
+shared between workers through a non-evicting backend
+"""
+
+import time
+
+import pytest
+
+from auth_provider import RedisCache, RevocationList, RevocationStatus, SharedMemoryCache, TTLCache
+
+NOW = int(time.time())
+
+
+def claims(sid="s1", jti="j1", sub="u1", iat=NOW):
+    return {"sid": sid, "jti": jti, "sub": sub, "iat": iat, "exp": iat + 300}
+
+
+@pytest.fixture
+def workers(redis):
+    """Two workers' revocation lists sharing one Redis"""
+    backend = RedisCache(client=redis, noeviction=True).namespace("revocations")
+    return RevocationList(shared=backend), RevocationList(shared=backend)
+
+
+def test_sessions_tokens_and_subjects(clock):
+    revocations = RevocationList(max_token_lifetime=600)
+    assert revocations.check(claims()) is RevocationStatus.NOT_REVOKED
+
+    revocations.revoke_session("s1")
+    revocations.revoke_token("j2", expires_at=NOW + 60)
+    revocations.revoke_subject("u3", revoked_at=NOW)
+
+    assert revocations.check(claims(sid="s1", jti="x")) is RevocationStatus.REVOKED
+    assert revocations.check(claims(sid="x", jti="j2")) is RevocationStatus.REVOKED
+    assert revocations.check(claims(sid="x", jti="x", sub="u3")) is RevocationStatus.REVOKED
+    assert revocations.check(claims(sid="x", jti="x", sub="u3", iat=NOW + 1)) is RevocationStatus.NOT_REVOKED
+
+    # Entries are dropped once the tokens they cover have expired
+    clock.advance(601)
+    revocations.purge()
+    assert len(revocations) == 0
+
+
+def test_compaction_into_a_bloom_filter():
+    revocations = RevocationList(max_entries=10)
+    for i in range(11):
+        revocations.revoke_session(f"s{i}")
+
+    assert len(revocations) == 0
+    assert all(revocations.check(claims(sid=f"s{i}")) is RevocationStatus.POSSIBLY_REVOKED for i in range(11))
+    assert revocations.check(claims(sid="never-revoked", jti="x")) is RevocationStatus.NOT_REVOKED
+
+
+def test_evicting_shared_backends_are_refused(redis, tmp_path):
+    for backend in (TTLCache(), SharedMemoryCache(str(tmp_path / "cache"), slots=16), RedisCache(client=redis)):
+        with pytest.raises(ValueError, match="never evicts"):
+            RevocationList(shared=backend.namespace("revocations"))
+
+
+def test_revocations_reach_other_workers(workers, redis):
+    first, second = workers
+    first.revoke_session("s1")
+    first.revoke_subject("u2", revoked_at=NOW)
+
+    assert second.check(claims(sid="s1", jti="x")) is RevocationStatus.REVOKED
+    assert second.check(claims(sid="x", jti="y", sub="u2")) is RevocationStatus.REVOKED
+    assert redis.calls["mget"] == 2
+
+
+def test_shared_lookups_are_batched_and_cached_locally(workers, redis, clock):
+    first, second = workers
+    token = claims()
+
+    # One MGET for sid, jti and sub, then nothing for shared_lookup_ttl
+    assert second.check(token) is RevocationStatus.NOT_REVOKED
+    assert redis.calls == {"mget": 1}
+    assert second.check(token) is RevocationStatus.NOT_REVOKED
+    assert redis.calls == {"mget": 1}
+
+    first.revoke_session("s1")
+    assert second.check(token) is RevocationStatus.NOT_REVOKED
+    clock.advance(second.shared_lookup_ttl + 0.1)
+    assert second.check(token) is RevocationStatus.REVOKED
+
+    # Found revocations are kept in memory
+    assert second.check(token) is RevocationStatus.REVOKED
+    assert redis.calls["mget"] == 2
+
+
+def test_shared_subject_revocations_are_kept_in_memory(workers, redis):
+    first, second = workers
+    first.revoke_subject("u1", revoked_at=NOW)
+
+    assert second.check(claims(sid="a", jti="a", iat=NOW - 10)) is RevocationStatus.REVOKED
+    assert second.check(claims(sid="b", jti="b", iat=NOW - 5)) is RevocationStatus.REVOKED
+    assert second.check(claims(sid="c", jti="c", iat=NOW + 5)) is RevocationStatus.NOT_REVOKED
+    # The second token is rejected in memory; the third reads only sid and jti
+    assert redis.calls["mget"] == 2
+
+
+def test_revocations_are_written_with_their_expiry(workers, redis):
+    first, _ = workers
+    first.revoke_token("j1", expires_at=time.time() + 30)
+
+    [(key, ttl)] = redis.ttls.items()
+    assert key.endswith("revocations:jti:j1")
+    assert 29000 <= ttl <= 30000
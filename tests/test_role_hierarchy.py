@@ -0,0 +1,109 @@
+"""
+Composite-role and group expansion, from a realm export or the admin API
+"""
+
+import json
+
+import pytest
+
+from auth_provider import KeycloakAuthProvider, RoleHierarchy, RoleHierarchyResolver, role_hierarchy
+from conftest import CLIENT_ID, CLIENT_SECRET, KEYCLOAK_URL, REALM
+from tools.keycloak_emulator import KeycloakEmulator
+
+pytestmark = pytest.mark.anyio
+
+REALM_WITH_GROUPS = {
+    "realm": REALM,
+    "roles": {
+        "realm": [
+            {"name": "admin", "composites": {"realm": ["manager"]}},
+            {"name": "manager", "composites": {"realm": ["reviewer", "approver"]}},
+            {"name": "reviewer"},
+            {"name": "approver"},
+            {"name": "citizen"}
+        ]
+    },
+    "clients": [{"clientId": CLIENT_ID, "secret": CLIENT_SECRET, "serviceAccountsEnabled": True}],
+    "groups": [
+        {"name": "staff", "realmRoles": ["reviewer"], "subGroups": [
+            {"name": "leads", "realmRoles": ["approver"]}
+        ]},
+        {"name": "citizens", "realmRoles": ["citizen"], "subGroups": [
+            {"name": "leads", "realmRoles": []}
+        ]}
+    ]
+}
+
+
+@pytest.fixture
+def realm_export(tmp_path):
+    path = tmp_path / "realm.json"
+    path.write_text(json.dumps(REALM_WITH_GROUPS))
+    return str(path)
+
+
+@pytest.fixture
+async def admin_provider(realm_export):
+    emulator = KeycloakEmulator(KEYCLOAK_URL)
+    emulator.load_realm_export(realm_export)
+    provider = KeycloakAuthProvider(
+        KEYCLOAK_URL, REALM, CLIENT_ID, client_secret=CLIENT_SECRET, transport=emulator.transport()
+    )
+    yield emulator, provider
+    await provider.aclose()
+
+
+def check_expansions(hierarchy: RoleHierarchy) -> None:
+    assert hierarchy.expand(frozenset({"admin"})) == {"admin", "manager", "reviewer", "approver"}
+    assert hierarchy.expand(frozenset(), frozenset({"/staff/leads"})) == {"reviewer", "approver"}
+    # Unique bare names are expanded, ambiguous ones only by full path
+    assert hierarchy.expand(frozenset(), frozenset({"staff"})) == {"reviewer"}
+    assert hierarchy.expand(frozenset(), frozenset({"leads"})) == frozenset()
+    assert hierarchy.expand(frozenset({"citizen"}), frozenset({"/citizens/leads"})) == {"citizen"}
+
+
+def test_closure_handles_cycles_and_client_roles():
+    hierarchy = RoleHierarchy(
+        {"a": ["b"], "b": ["c", "reports:export"], "c": ["a"]},
+        {"/auditors": ["reports:read"]}
+    )
+
+    assert hierarchy.expand(frozenset({"a"})) == {"a", "b", "c", "reports:export"}
+    assert hierarchy.expand(frozenset({"unknown"}), frozenset({"/auditors", "/nobody"})) == {
+        "unknown", "reports:read"
+    }
+
+    roles = frozenset({"c"})
+    assert hierarchy.expand(roles) is hierarchy.expand(roles)
+
+
+def test_hierarchy_from_realm_export(realm_export):
+    check_expansions(RoleHierarchy.from_realm_export(realm_export))
+
+
+async def test_resolver_loads_from_the_admin_api(admin_provider):
+    # The emulator only lists subgroups through /groups/{id}/children
+    resolver = RoleHierarchyResolver(admin_provider[1])
+
+    check_expansions(await resolver.load())
+
+
+async def test_resolver_reloads_a_stale_hierarchy_in_the_background(admin_provider, clock, monkeypatch):
+    monkeypatch.setattr(role_hierarchy, "time", clock)
+    emulator, provider = admin_provider
+    resolver = RoleHierarchyResolver(provider, ttl=60)
+    await resolver.load()
+
+    realm = emulator.realm(REALM)
+    realm.add_role("citizen", composites={"realm": ["verified_citizen"]})
+    assert resolver.expand(frozenset({"citizen"})) == {"citizen"}
+
+    clock.advance(61)
+    assert resolver.expand(frozenset({"citizen"})) == {"citizen"}
+    await resolver._load_task
+    assert resolver.expand(frozenset({"citizen"})) == {"citizen", "verified_citizen"}
+
+
+def test_resolver_requires_a_source():
+    with pytest.raises(ValueError):
+        RoleHierarchyResolver()
@@ -0,0 +1,76 @@
+"""
+client_credentials token shared by all callers and renewed ahead of expiry
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from auth_provider import ServiceAccountTokenManager, service_account
+from conftest import CLIENT_ID
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def manager(provider, clock, monkeypatch):
+    monkeypatch.setattr(service_account, "time", clock)
+    return ServiceAccountTokenManager(provider, renew_margin=30, jitter=0)
+
+
+async def test_concurrent_callers_share_one_grant(manager, emulator, realm):
+    tokens = await asyncio.gather(*(manager.get_token() for _ in range(10)))
+
+    assert len(set(tokens)) == 1
+    assert emulator.requests["token"] == 1
+    assert realm.decode(tokens[0])["azp"] == CLIENT_ID
+
+
+async def test_token_is_renewed_ahead_of_expiry_without_waiting(manager, emulator, realm, clock):
+    first = await manager.get_token()
+
+    # Inside the renewal margin: the current token is returned and one
+    # renewal starts in the background
+    clock.advance(realm.access_token_lifespan - 29)
+    assert await manager.get_token() == first
+    assert await manager.get_token() == first
+    await manager._fetch_task
+    assert emulator.requests["token"] == 2
+    assert await manager.get_token() != first
+
+
+async def test_expired_token_is_fetched_before_returning(manager, emulator, realm, clock):
+    first = await manager.get_token()
+
+    clock.advance(realm.access_token_lifespan + 1)
+    assert await manager.get_token() != first
+    assert emulator.requests["token"] == 2
+
+
+async def test_background_renewal(manager, emulator):
+    manager.start()
+    try:
+        for _ in range(100):
+            if manager.token_response is not None:
+                break
+            await asyncio.sleep(0.01)
+        assert manager.token_response is not None
+        assert emulator.requests["token"] == 1
+    finally:
+        manager.stop()
+
+
+async def test_auth_hook_retries_once_with_a_new_token_after_401(manager, emulator):
+    seen = []
+
+    def downstream(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers["Authorization"])
+        return httpx.Response(401 if len(seen) == 1 else 200)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(downstream), auth=manager.auth) as client:
+        response = await client.get("http://workflow-service/api/v1/instances")
+
+    assert response.status_code == 200
+    assert len(seen) == 2 and seen[0] != seen[1]
+    assert emulator.requests["token"] == 2
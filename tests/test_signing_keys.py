@@ -0,0 +1,76 @@
+"""
+Signing keys constructed once per JWKS and looked up by kid, each pinned
+to its JWK algorithm
+"""
+
+import pytest
+from jose import JWTError, jwt
+
+from auth_provider import KeycloakAuthProvider
+from conftest import CLIENT_ID, CLIENT_SECRET, ISSUER, KEYCLOAK_URL, REALM, REALM_EXPORT
+from tools.keycloak_emulator import KeycloakEmulator
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def multi_key():
+    """Realm signing with both an RSA and an EC key, and a provider for it"""
+    emulator = KeycloakEmulator(KEYCLOAK_URL, algorithms=("RS256", "ES256"))
+    realm = emulator.load_realm_export(REALM_EXPORT)
+    provider = KeycloakAuthProvider(
+        KEYCLOAK_URL, REALM, CLIENT_ID, client_secret=CLIENT_SECRET, transport=emulator.transport()
+    )
+    yield emulator, realm, provider
+    await provider.aclose()
+
+
+def issue(realm, algorithm):
+    user_id = realm.create_user({"username": f"user-{algorithm.lower()}"})
+    return realm.issue_tokens(ISSUER, user_id, CLIENT_ID, algorithm=algorithm)["access_token"]
+
+
+async def test_tokens_of_every_key_verify_against_one_fetch(multi_key):
+    emulator, realm, provider = multi_key
+
+    for algorithm in ("RS256", "ES256"):
+        assert (await provider.verify_token(issue(realm, algorithm)))["iss"] == ISSUER
+
+    assert emulator.requests["jwks_fetch"] == 1
+    assert {kid: alg for kid, (_, alg) in provider._signing_keys.items()} == {
+        kid: algorithm for algorithm, (kid, _, _) in realm.keys.items()
+    }
+
+
+async def test_token_algorithm_must_match_the_pinned_one(multi_key):
+    _, realm, provider = multi_key
+    rsa_kid = realm.keys["RS256"][0]
+    claims = jwt.get_unverified_claims(issue(realm, "RS256"))
+
+    # An HMAC token naming the RSA key
+    forged = jwt.encode(claims, "secret", algorithm="HS256", headers={"kid": rsa_kid})
+    with pytest.raises(JWTError):
+        await provider.verify_token(forged)
+
+    # A token signed by the EC key but carrying the RSA kid
+    es_kid, es_private, _ = realm.keys["ES256"]
+    swapped = jwt.encode(claims, es_private, algorithm="ES256", headers={"kid": rsa_kid})
+    with pytest.raises(JWTError):
+        await provider.verify_token(swapped)
+
+
+def test_key_index_skips_unusable_keys(realm):
+    rsa_jwk = dict(realm.jwks["keys"][0])
+    without_alg = {k: v for k, v in rsa_jwk.items() if k != "alg"}
+    without_alg["kid"] = "no-alg"
+
+    index = KeycloakAuthProvider._build_key_index({"keys": [
+        rsa_jwk,
+        without_alg,
+        dict(rsa_jwk, kid="encryption", use="enc"),
+        {k: v for k, v in rsa_jwk.items() if k != "kid"},
+        {"kid": "symmetric", "kty": "oct", "k": "c2VjcmV0", "alg": "HS256"}
+    ]})
+
+    assert set(index) == {rsa_jwk["kid"], "no-alg"}
+    assert index["no-alg"][1] == "RS256"
@@ -0,0 +1,116 @@
+"""
+Discovery/JWKS snapshot: authenticated with an HMAC, trusted for a
+limited time, and loaded by new workers before Keycloak answers
+"""
+
+import json
+
+import pytest
+
+from auth_provider import snapshot
+from auth_provider.snapshot import read_snapshot, write_snapshot
+
+pytestmark = pytest.mark.anyio
+
+KEY = b"k" * 32
+CONTENT = {"realm_url": "http://keycloak.test/realms/munistream", "jwks": {"keys": [{"kid": "a"}]}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "snapshot.json")
+
+
+@pytest.fixture
+def snapshot_clock(clock, monkeypatch):
+    monkeypatch.setattr(snapshot, "time", clock)
+    return clock
+
+
+def edit(path, change):
+    with open(path) as f:
+        document = json.load(f)
+    change(document)
+    with open(path, "w") as f:
+        json.dump(document, f)
+
+
+def test_round_trip(path):
+    write_snapshot(path, CONTENT, KEY)
+
+    assert read_snapshot(path, KEY, max_age=60) == CONTENT
+    assert read_snapshot(path + ".missing", KEY) is None
+
+
+@pytest.mark.parametrize("change", [
+    lambda document: document["content"]["jwks"]["keys"].append({"kid": "attacker"}),
+    lambda document: document.update(created_at=document["created_at"] + 3600),
+    lambda document: document.pop("created_at"),
+    lambda document: document.update(checksum="0" * 64),
+    lambda document: document.update(version=2),
+])
+def test_tampered_snapshots_are_rejected(path, change):
+    write_snapshot(path, CONTENT, KEY)
+    edit(path, change)
+
+    assert read_snapshot(path, KEY) is None
+
+
+def test_snapshot_must_be_written_with_the_configured_key(path):
+    write_snapshot(path, CONTENT, KEY)
+    assert read_snapshot(path, b"x" * 32) is None
+    assert read_snapshot(path) is None
+
+    write_snapshot(path, CONTENT)
+    assert read_snapshot(path) == CONTENT
+    assert read_snapshot(path, KEY) is None
+
+
+def test_truncated_snapshot_is_rejected(path):
+    write_snapshot(path, CONTENT, KEY)
+    with open(path, "r+") as f:
+        f.truncate(20)
+
+    assert read_snapshot(path, KEY) is None
+
+
+def test_expired_snapshot_is_rejected(path, snapshot_clock):
+    write_snapshot(path, CONTENT, KEY)
+
+    snapshot_clock.advance(59)
+    assert read_snapshot(path, KEY, max_age=60) == CONTENT
+    snapshot_clock.advance(2)
+    assert read_snapshot(path, KEY, max_age=60) is None
+    assert read_snapshot(path, KEY) == CONTENT
+
+
+async def test_new_worker_validates_tokens_from_the_snapshot(make_provider, emulator, tokens, path):
+    first = make_provider(snapshot_path=path)
+    await first.bootstrap()
+
+    # Keycloak is down when the next worker starts
+    emulator.set_fault("jwks_fetch", error_rate=1.0, error_status=503)
+    second = make_provider(snapshot_path=path)
+    assert second.load_snapshot()
+    assert (await second.verify_token(tokens.access_token()))["sub"] == tokens.user_id
+
+
+async def test_provider_ignores_expired_and_foreign_snapshots(make_provider, path, snapshot_clock):
+    await make_provider(snapshot_path=path, snapshot_max_age=3600).bootstrap()
+
+    snapshot_clock.advance(3601)
+    assert not make_provider(snapshot_path=path, snapshot_max_age=3600).load_snapshot()
+    assert make_provider(snapshot_path=path, snapshot_max_age=None).load_snapshot()
+    assert not make_provider(snapshot_path=path, snapshot_key="another-secret").load_snapshot()
+
+
+async def test_unchanged_key_set_renews_the_snapshot(make_provider, emulator, path, snapshot_clock):
+    provider = make_provider(snapshot_path=path, snapshot_max_age=3600)
+    await provider.bootstrap()
+
+    snapshot_clock.advance(3000)
+    await provider.refresh_jwks()
+    assert emulator.requests["jwks_fetch"] == 2
+
+    snapshot_clock.advance(3000)
+    assert make_provider(snapshot_path=path, snapshot_max_age=3600).load_snapshot()
@@ -0,0 +1,3 @@
+"""
+Development and testing tools, not part of the auth_provider package
+"""
@@ -0,0 +1,1167 @@
+"""
+In-process Keycloak emulator for load testing and offline development
+
+Emulates the OIDC and admin REST endpoints used by KeycloakAuthProvider and
+scripts/migrate-users.py: discovery, certs, auth, token, introspect,
+userinfo, logout, users, role-mappings, roles, clients, groups and
+partialImport. Latency and errors can be injected per operation so caching,
+pooling and concurrency behaviour can be measured deterministically.
+
+In-process use with httpx:
+
+    emulator = KeycloakEmulator(base_url="http://keycloak.test")
+    emulator.load_realm_export("realms/munistream-realm.json")
+    provider = KeycloakAuthProvider(
+        "http://keycloak.test", "munistream", "munistream-backend",
+        client_secret="changeme-backend-secret-in-production",
+        transport=emulator.transport()
+    )
+
+As a standalone server (e.g. for python-keycloak based scripts):
+
+    python -m tools.keycloak_emulator --port 8080 \\
+        --realm-export realms/munistream-realm.json --latency 0.005
+
+The emulator keeps all state in memory and only checks that admin API
+tokens are valid; it does not enforce fine-grained admin permissions.
+"""
+from typing import Optional, Dict, Any, List, Set, Tuple
+from urllib.parse import parse_qs, urlencode
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import random
+import secrets
+import time
+import uuid
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, RedirectResponse, Response
+from jose import jwk, jwt, JWTError
+
+logger = logging.getLogger(__name__)
+
+# Operation names match the ones reported by the provider's instrumentation
+OPERATIONS = (
+    "discovery", "jwks_fetch", "authorize", "token", "introspection",
+    "userinfo", "logout", "admin"
+)
+
+
+class Fault:
+    """Latency and error injection settings for one emulated operation"""
+
+    __slots__ = ("latency", "jitter", "error_rate", "error_status")
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503
+    ):
+        """
+        Args:
+            latency: Seconds added to every request
+            jitter: Extra random latency, uniform in [0, jitter] seconds
+            error_rate: Probability (0-1) of answering with ``error_status``
+            error_status: HTTP status of injected errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _generate_key(algorithm: str) -> Any:
+    if algorithm.startswith("RS"):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    curves = {"ES256": ec.SECP256R1(), "ES384": ec.SECP384R1(), "ES512": ec.SECP521R1()}
+    if algorithm not in curves:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+    return ec.generate_private_key(curves[algorithm])
+
+
+class EmulatedRealm:
+    """
+    In-memory state of one emulated realm
+
+    Users are stored as Keycloak user representations keyed by id, with
+    lower-cased username/email indexes as in Keycloak.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        algorithms: Tuple[str, ...] = ("RS256",),
+        access_token_lifespan: int = 300,
+        sso_session_idle_timeout: int = 1800,
+        duplicate_emails_allowed: bool = False
+    ):
+        """
+        Args:
+            name: Realm name
+            algorithms: Signing algorithms with one key each; tokens are
+                signed with the first unless another is requested
+            access_token_lifespan: Access token lifetime in seconds
+            sso_session_idle_timeout: Refresh token lifetime in seconds
+            duplicate_emails_allowed: Allow several users with one email
+        """
+        self.name = name
+        self.id = str(uuid.uuid4())
+        self.access_token_lifespan = access_token_lifespan
+        self.sso_session_idle_timeout = sso_session_idle_timeout
+        self.duplicate_emails_allowed = duplicate_emails_allowed
+
+        self.keys: Dict[str, Tuple[str, str, str]] = {}
+        jwks = []
+        for algorithm in algorithms:
+            private_key = _generate_key(algorithm)
+            private_pem = private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ).decode()
+            public_pem = private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo
+            ).decode()
+            kid = secrets.token_urlsafe(16)
+            public_jwk = jwk.construct(public_pem, algorithm).to_dict()
+            public_jwk.update({"kid": kid, "use": "sig", "alg": algorithm})
+            jwks.append(public_jwk)
+            self.keys[algorithm] = (kid, private_pem, public_pem)
+        self.default_algorithm = algorithms[0]
+        self._keys_by_kid = {kid: (algorithm, public_pem) for algorithm, (kid, _, public_pem) in self.keys.items()}
+        self.jwks = {"keys": jwks}
+        self.jwks_etag = '"' + hashlib.sha256(json.dumps(self.jwks, sort_keys=True).encode()).hexdigest()[:32] + '"'
+
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.usernames: Dict[str, str] = {}
+        self.emails: Dict[str, Set[str]] = {}
+        self.passwords: Dict[str, str] = {}
+        self.role_mappings: Dict[str, Set[str]] = {}
+        self.roles: Dict[str, Dict[str, Any]] = {}
+        self.role_composites: Dict[str, List[Dict[str, Any]]] = {}
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.client_roles: Dict[str, List[Dict[str, Any]]] = {}
+        self.groups: List[Dict[str, Any]] = []
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.codes: Dict[str, Dict[str, Any]] = {}
+
+    # Roles and clients
+
+    def add_role(self, name: str, description: str = "", composites: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        role = self.roles.get(name)
+        if role is None:
+            role = {
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "description": description,
+                "composite": bool(composites),
+                "clientRole": False,
+                "containerId": self.id
+            }
+            self.roles[name] = role
+        if composites:
+            self.role_composites[role["id"]] = [
+                self.add_role(child) for child in composites.get("realm", [])
+            ]
+            role["composite"] = True
+        return role
+
+    def add_client(
+        self,
+        client_id: str,
+        secret: Optional[str] = None,
+        public_client: Optional[bool] = None,
+        service_accounts_enabled: bool = False
+    ) -> Dict[str, Any]:
+        client = {
+            "id": str(uuid.uuid4()),
+            "clientId": client_id,
+            "secret": secret,
+            "publicClient": secret is None if public_client is None else public_client,
+            "serviceAccountsEnabled": service_accounts_enabled
+        }
+        self.clients[client_id] = client
+        self.client_roles.setdefault(client["id"], [])
+        if service_accounts_enabled:
+            user_id = self.create_user({"username": f"service-account-{client_id}", "enabled": True})
+            client["serviceAccountUserId"] = user_id
+        return client
+
+    def add_client_role(self, client_id: str, name: str, description: str = "") -> Dict[str, Any]:
+        client = self.clients[client_id]
+        role = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "description": description,
+            "composite": False,
+            "clientRole": True,
+            "containerId": client["id"]
+        }
+        self.client_roles[client["id"]].append(role)
+        return role
+
+    def authenticate_client(self, client_id: Optional[str], client_secret: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Get the client if the credentials are valid (public clients need no secret)"""
+        client = self.clients.get(client_id or "")
+        if client is None:
+            return None
+        if not client["publicClient"] and not secrets.compare_digest(client["secret"] or "", client_secret or ""):
+            return None
+        return client
+
+    # Users
+
+    def find_user(self, username: Optional[str] = None, email: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if username:
+            user_id = self.usernames.get(username.lower())
+            if user_id is not None:
+                return self.users[user_id]
+        if email:
+            for user_id in self.emails.get(email.lower(), ()):
+                return self.users[user_id]
+        return None
+
+    def conflict(self, representation: Dict[str, Any], ignore_id: Optional[str] = None) -> Optional[str]:
+        """Return the Keycloak conflict message for a user representation, if any"""
+        username = (representation.get("username") or "").lower()
+        if username and self.usernames.get(username, ignore_id) != ignore_id:
+            return "User exists with same username"
+        email = (representation.get("email") or "").lower()
+        if email and not self.duplicate_emails_allowed:
+            if self.emails.get(email, set()) - {ignore_id}:
+                return "User exists with same email"
+        return None
+
+    def create_user(self, representation: Dict[str, Any], user_id: Optional[str] = None) -> str:
+        username = (representation.get("username") or representation.get("email") or "").lower()
+        if not username:
+            raise ValueError("User name is missing")
+        user_id = user_id or representation.get("id") or str(uuid.uuid4())
+        user = {
+            "id": user_id,
+            "username": username,
+            "enabled": representation.get("enabled", True),
+            "emailVerified": representation.get("emailVerified", False),
+            "createdTimestamp": int(time.time() * 1000),
+            "attributes": {}
+        }
+        self.users[user_id] = user
+        self.usernames[username] = user_id
+        self.role_mappings.setdefault(user_id, set())
+        self.update_user(user_id, representation)
+
+        for credential in representation.get("credentials", []):
+            if credential.get("type", "password") == "password" and "value" in credential:
+                self.passwords[user_id] = credential["value"]
+        return user_id
+
+    def update_user(self, user_id: str, representation: Dict[str, Any]) -> None:
+        user = self.users[user_id]
+        old_email = user.get("email")
+        for field in ("firstName", "lastName", "enabled", "emailVerified", "requiredActions"):
+            if field in representation:
+                user[field] = representation[field]
+        if representation.get("email") is not None:
+            user["email"] = representation["email"].lower()
+        if "attributes" in representation:
+            user["attributes"] = {
+                key: value if isinstance(value, list) else [str(value)]
+                for key, value in (representation["attributes"] or {}).items()
+            }
+
+        if old_email != user.get("email"):
+            if old_email:
+                self.emails.get(old_email, set()).discard(user_id)
+            if user.get("email"):
+                self.emails.setdefault(user["email"], set()).add(user_id)
+
+    def delete_user(self, user_id: str) -> None:
+        user = self.users.pop(user_id)
+        self.usernames.pop(user["username"], None)
+        if user.get("email"):
+            self.emails.get(user["email"], set()).discard(user_id)
+        self.passwords.pop(user_id, None)
+        self.role_mappings.pop(user_id, None)
+        for sid in [sid for sid, session in self.sessions.items() if session["user_id"] == user_id]:
+            del self.sessions[sid]
+
+    def search_users(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Filter users like GET /admin/realms/{realm}/users"""
+        exact = params.get("exact", "false").lower() == "true"
+
+        def matches(value: Optional[str], expected: str) -> bool:
+            value = (value or "").lower()
+            expected = expected.lower()
+            return value == expected if exact else expected in value
+
+        if exact and "username" in params:
+            user = self.find_user(username=params["username"])
+            candidates = [user] if user is not None else []
+        elif exact and "email" in params:
+            candidates = [self.users[user_id] for user_id in self.emails.get(params["email"].lower(), ())]
+        else:
+            candidates = list(self.users.values())
+
+        results = []
+        for user in candidates:
+            if any(
+                field in params and not matches(user.get(field), params[field])
+                for field in ("username", "email", "firstName", "lastName")
+            ):
+                continue
+            search = params.get("search")
+            if search and search != "*" and not any(
+                search.strip("*").lower() in (user.get(field) or "").lower()
+                for field in ("username", "email", "firstName", "lastName")
+            ):
+                continue
+            if params.get("q"):
+                wanted = dict(term.split(":", 1) for term in params["q"].split() if ":" in term)
+                if any(value not in user["attributes"].get(key, []) for key, value in wanted.items()):
+                    continue
+            results.append(user)
+
+        first = int(params.get("first", 0))
+        maximum = int(params.get("max", 100))
+        return results[first:first + maximum]
+
+    # Tokens
+
+    def sign(self, claims: Dict[str, Any], algorithm: Optional[str] = None) -> str:
+        kid, private_pem, _ = self.keys[algorithm or self.default_algorithm]
+        return jwt.encode(claims, private_pem, algorithm=algorithm or self.default_algorithm, headers={"kid": kid})
+
+    def decode(self, token: str, token_type: str = "Bearer") -> Optional[Dict[str, Any]]:
+        """Verify a token issued by this realm; None if invalid, expired or revoked"""
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm, public_pem = self._keys_by_kid[header.get("kid")]
+            claims = jwt.decode(token, public_pem, algorithms=[algorithm], options={"verify_aud": False})
+        except (JWTError, KeyError):
+            return None
+        if claims.get("typ") != token_type:
+            return None
+        if "sid" in claims and claims["sid"] not in self.sessions:
+            return None
+        return claims
+
+    def realm_roles_of(self, user_id: str) -> List[str]:
+        """Effective realm roles of a user, including composites"""
+        roles = set()
+        stack = list(self.role_mappings.get(user_id, ()))
+        while stack:
+            name = stack.pop()
+            if name in roles or name not in self.roles:
+                continue
+            roles.add(name)
+            stack.extend(child["name"] for child in self.role_composites.get(self.roles[name]["id"], []))
+        return sorted(roles)
+
+    def issue_tokens(
+        self,
+        issuer: str,
+        user_id: str,
+        client_id: str,
+        scope: str = "openid profile email",
+        session_id: Optional[str] = None,
+        algorithm: Optional[str] = None,
+        audience: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Mint an access/refresh token pair like the token endpoint
+
+        Args:
+            issuer: Issuer URL (``<server_url>/realms/<realm>``)
+            user_id: Subject user id
+            client_id: Authorized party
+            scope: Granted scopes; ``openid`` adds an ID token
+            session_id: Session to attach, or None for a session-less token
+            algorithm: Signing algorithm, defaults to the realm's first key
+            audience: Audience, defaults to every confidential client
+
+        Returns:
+            Token endpoint response
+        """
+        user = self.users[user_id]
+        now = int(time.time())
+        if audience is None:
+            audience = sorted(
+                {client_id} | {c["clientId"] for c in self.clients.values() if not c["publicClient"]}
+            )
+
+        claims = {
+            "exp": now + self.access_token_lifespan,
+            "iat": now,
+            "jti": str(uuid.uuid4()),
+            "iss": issuer,
+            "aud": audience,
+            "sub": user_id,
+            "typ": "Bearer",
+            "azp": client_id,
+            "scope": scope,
+            "realm_access": {"roles": self.realm_roles_of(user_id)},
+            "resource_access": {},
+            "email_verified": user.get("emailVerified", False),
+            "preferred_username": user["username"],
+        }
+        if user.get("email"):
+            claims["email"] = user["email"]
+        name = " ".join(part for part in (user.get("firstName"), user.get("lastName")) if part)
+        if name:
+            claims.update(name=name, given_name=user.get("firstName"), family_name=user.get("lastName"))
+        if session_id:
+            claims["sid"] = claims["session_state"] = session_id
+
+        response = {
+            "access_token": self.sign(claims, algorithm),
+            "expires_in": self.access_token_lifespan,
+            "token_type": "Bearer",
+            "not-before-policy": 0,
+            "scope": scope
+        }
+        if session_id:
+            refresh_claims = {
+                "exp": now + self.sso_session_idle_timeout,
+                "iat": now,
+                "jti": str(uuid.uuid4()),
+                "iss": issuer,
+                "aud": issuer,
+                "sub": user_id,
+                "typ": "Refresh",
+                "azp": client_id,
+                "sid": session_id,
+                "scope": scope
+            }
+            response.update(
+                refresh_token=self.sign(refresh_claims, algorithm),
+                refresh_expires_in=self.sso_session_idle_timeout,
+                session_state=session_id
+            )
+        else:
+            response["refresh_expires_in"] = 0
+        if "openid" in scope.split():
+            id_claims = {k: v for k, v in claims.items() if k not in ("realm_access", "resource_access", "scope")}
+            id_claims.update(typ="ID", aud=client_id, jti=str(uuid.uuid4()))
+            response["id_token"] = self.sign(id_claims, algorithm)
+        return response
+
+    def start_session(self, user_id: str, client_id: str) -> str:
+        session_id = str(uuid.uuid4())
+        self.sessions[session_id] = {"user_id": user_id, "client_id": client_id, "started": int(time.time())}
+        return session_id
+
+    # Realm exports
+
+    @classmethod
+    def from_realm_export(cls, realm: Dict[str, Any], algorithms: Tuple[str, ...] = ("RS256",)) -> "EmulatedRealm":
+        """
+        Build a realm from a Keycloak realm export (roles, clients, groups
+        and users)
+        """
+        emulated = cls(
+            realm["realm"],
+            algorithms=algorithms,
+            access_token_lifespan=realm.get("accessTokenLifespan", 300),
+            sso_session_idle_timeout=realm.get("ssoSessionIdleTimeout", 1800),
+            duplicate_emails_allowed=realm.get("duplicateEmailsAllowed", False)
+        )
+
+        for role in realm.get("roles", {}).get("realm", []):
+            emulated.add_role(role["name"], role.get("description", ""), role.get("composites"))
+        for client in realm.get("clients", []):
+            emulated.add_client(
+                client["clientId"],
+                secret=client.get("secret"),
+                public_client=client.get("publicClient", False),
+                service_accounts_enabled=client.get("serviceAccountsEnabled", False)
+            )
+        for client_id, roles in realm.get("roles", {}).get("client", {}).items():
+            if client_id not in emulated.clients:
+                emulated.add_client(client_id, public_client=False)
+            for role in roles:
+                emulated.add_client_role(client_id, role["name"], role.get("description", ""))
+        emulated.groups = realm.get("groups", [])
+        stack = [(group, "") for group in emulated.groups]
+        while stack:
+            group, parent_path = stack.pop()
+            group.setdefault("id", str(uuid.uuid4()))
+            group.setdefault("path", f"{parent_path}/{group['name']}")
+            stack.extend((subgroup, group["path"]) for subgroup in group.get("subGroups", []))
+
+        for user in realm.get("users", []):
+            user_id = emulated.create_user(user)
+            emulated.role_mappings[user_id].update(
+                role for role in user.get("realmRoles", []) if role in emulated.roles
+            )
+        return emulated
+
+
+def _form(body: bytes) -> Dict[str, str]:
+    """Parse an application/x-www-form-urlencoded body"""
+    return {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+
+def _oauth_error(status_code: int, error: str, description: str = "") -> JSONResponse:
+    return JSONResponse({"error": error, "error_description": description}, status_code=status_code)
+
+
+def _admin_error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse({"errorMessage": message}, status_code=status_code)
+
+
+class KeycloakEmulator:
+    """
+    Keycloak stand-in serving one or more emulated realms
+
+    A ``master`` realm with the admin user and the ``admin-cli`` client is
+    always present so admin clients can log in as they do against Keycloak.
+    Request counts per operation are kept in ``requests``; faults are set
+    per operation (see OPERATIONS) or for all of them with ``"*"``, either
+    with ``set_fault`` or at runtime through ``PUT /_emulator/faults/{op}``.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        admin_username: str = "admin",
+        admin_password: str = "admin123",
+        algorithms: Tuple[str, ...] = ("RS256",),
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            base_url: Public server URL used as token issuer; defaults to
+                the URL of each request, as Keycloak does without a
+                configured hostname
+            admin_username: Master realm admin user name
+            admin_password: Master realm admin password
+            algorithms: Signing algorithms of realms created by the emulator
+            seed: Random seed for reproducible fault injection
+        """
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.algorithms = algorithms
+        self.realms: Dict[str, EmulatedRealm] = {}
+        self.faults: Dict[str, Fault] = {}
+        self.requests: Dict[str, int] = {operation: 0 for operation in OPERATIONS}
+        self.injected_errors: Dict[str, int] = {operation: 0 for operation in OPERATIONS}
+        self._random = random.Random(seed)
+
+        master = self.add_realm(EmulatedRealm("master", algorithms=algorithms))
+        master.add_role("admin", "Master realm administrator")
+        master.add_client("admin-cli", public_client=True)
+        admin_id = master.create_user({
+            "username": admin_username,
+            "enabled": True,
+            "credentials": [{"type": "password", "value": admin_password}]
+        })
+        master.role_mappings[admin_id].add("admin")
+
+        self.app = self._build_app()
+
+    # Configuration
+
+    def add_realm(self, realm: EmulatedRealm) -> EmulatedRealm:
+        self.realms[realm.name] = realm
+        return realm
+
+    def realm(self, name: str) -> EmulatedRealm:
+        return self.realms[name]
+
+    def load_realm_export(self, path: str) -> EmulatedRealm:
+        """
+        Add a realm from a Keycloak realm export file
+
+        Args:
+            path: Path to the realm JSON (e.g. realms/munistream-realm.json)
+        """
+        with open(path) as f:
+            return self.add_realm(EmulatedRealm.from_realm_export(json.load(f), self.algorithms))
+
+    def set_fault(self, operation: str = "*", **settings: Any) -> Fault:
+        """
+        Configure latency/error injection for an operation
+
+        Args:
+            operation: One of OPERATIONS, or ``"*"`` for the default
+            **settings: Fault arguments (latency, jitter, error_rate, error_status)
+        """
+        if operation != "*" and operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        fault = self.faults[operation] = Fault(**settings)
+        return fault
+
+    def clear_faults(self) -> None:
+        self.faults.clear()
+
+    def transport(self) -> httpx.ASGITransport:
+        """httpx transport routing requests to this emulator in-process"""
+        return httpx.ASGITransport(app=self.app)
+
+    # Helpers
+
+    async def _enter(self, operation: str) -> None:
+        """Count the request and apply the configured fault"""
+        self.requests[operation] += 1
+        fault = self.faults.get(operation) or self.faults.get("*")
+        if fault is None:
+            return
+
+        delay = fault.latency
+        if fault.jitter:
+            delay += self._random.uniform(0, fault.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if fault.error_rate and self._random.random() < fault.error_rate:
+            self.injected_errors[operation] += 1
+            raise HTTPException(status_code=fault.error_status, detail=f"Injected {operation} fault")
+
+    def _get_realm(self, name: str) -> EmulatedRealm:
+        realm = self.realms.get(name)
+        if realm is None:
+            raise HTTPException(status_code=404, detail="Realm does not exist")
+        return realm
+
+    def _issuer(self, request: Request, realm: EmulatedRealm) -> str:
+        base_url = self.base_url or str(request.base_url).rstrip('/')
+        return f"{base_url}/realms/{realm.name}"
+
+    @staticmethod
+    def _bearer(request: Request) -> Optional[str]:
+        authorization = request.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        return token if scheme.lower() == "bearer" and token else None
+
+    @staticmethod
+    def _client_credentials(request: Request, form: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("basic "):
+            decoded = base64.b64decode(authorization[6:]).decode("utf-8")
+            client_id, _, client_secret = decoded.partition(":")
+            return client_id, client_secret
+        return form.get("client_id"), form.get("client_secret")
+
+    def _require_admin(self, request: Request, realm: EmulatedRealm) -> None:
+        token = self._bearer(request)
+        if token is None:
+            raise HTTPException(status_code=401, detail="HTTP 401 Unauthorized")
+        for candidate in (self.realms["master"], realm):
+            if candidate.decode(token) is not None:
+                return
+        raise HTTPException(status_code=401, detail="HTTP 401 Unauthorized")
+
+    def _get_user(self, realm: EmulatedRealm, user_id: str) -> Dict[str, Any]:
+        user = realm.users.get(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    # Application
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Keycloak emulator", docs_url=None, redoc_url=None, openapi_url=None)
+
+        @app.exception_handler(HTTPException)
+        async def http_error(request: Request, exc: HTTPException) -> JSONResponse:
+            if request.url.path.startswith("/admin/"):
+                return _admin_error(exc.status_code, str(exc.detail))
+            return _oauth_error(exc.status_code, "request_failed", str(exc.detail))
+
+        self._add_oidc_routes(app)
+        self._add_admin_routes(app)
+        self._add_control_routes(app)
+        return app
+
+    def _add_oidc_routes(self, app: FastAPI) -> None:
+        oidc = "/realms/{realm_name}/protocol/openid-connect"
+
+        @app.get("/realms/{realm_name}/.well-known/openid-configuration")
+        async def discovery(realm_name: str, request: Request):
+            await self._enter("discovery")
+            realm = self._get_realm(realm_name)
+            issuer = self._issuer(request, realm)
+            endpoints = f"{issuer}/protocol/openid-connect"
+            return {
+                "issuer": issuer,
+                "authorization_endpoint": f"{endpoints}/auth",
+                "token_endpoint": f"{endpoints}/token",
+                "introspection_endpoint": f"{endpoints}/token/introspect",
+                "userinfo_endpoint": f"{endpoints}/userinfo",
+                "end_session_endpoint": f"{endpoints}/logout",
+                "jwks_uri": f"{endpoints}/certs",
+                "grant_types_supported": ["authorization_code", "refresh_token", "password", "client_credentials"],
+                "response_types_supported": ["code"],
+                "id_token_signing_alg_values_supported": list(realm.keys),
+                "code_challenge_methods_supported": ["plain", "S256"]
+            }
+
+        @app.get(f"{oidc}/certs")
+        async def certs(realm_name: str, request: Request):
+            await self._enter("jwks_fetch")
+            realm = self._get_realm(realm_name)
+            headers = {"ETag": realm.jwks_etag, "Cache-Control": "no-cache"}
+            if request.headers.get("if-none-match") == realm.jwks_etag:
+                return Response(status_code=304, headers=headers)
+            return JSONResponse(realm.jwks, headers=headers)
+
+        @app.get(f"{oidc}/auth")
+        async def authorize(realm_name: str, request: Request):
+            """Log in the ``login_hint`` user without a login page and redirect with a code"""
+            await self._enter("authorize")
+            realm = self._get_realm(realm_name)
+            params = request.query_params
+            client = realm.clients.get(params.get("client_id", ""))
+            if client is None or "redirect_uri" not in params:
+                return _oauth_error(400, "invalid_request", "Unknown client or missing redirect_uri")
+            user = realm.find_user(username=params.get("login_hint"), email=params.get("login_hint"))
+            if user is None:
+                return _oauth_error(400, "login_required", "Pass login_hint with an existing user")
+
+            code = secrets.token_urlsafe(32)
+            realm.codes[code] = {
+                "client_id": client["clientId"],
+                "user_id": user["id"],
+                "redirect_uri": params["redirect_uri"],
+                "scope": params.get("scope", "openid"),
+                "expires_at": time.time() + 60
+            }
+            query = {"code": code, "iss": self._issuer(request, realm)}
+            if "state" in params:
+                query["state"] = params["state"]
+            separator = "&" if "?" in params["redirect_uri"] else "?"
+            return RedirectResponse(f"{params['redirect_uri']}{separator}{urlencode(query)}", status_code=302)
+
+        @app.post(f"{oidc}/token")
+        async def token(realm_name: str, request: Request):
+            await self._enter("token")
+            realm = self._get_realm(realm_name)
+            form = _form(await request.body())
+            client_id, client_secret = self._client_credentials(request, form)
+            client = realm.authenticate_client(client_id, client_secret)
+            if client is None:
+                return _oauth_error(401, "unauthorized_client", "Invalid client or Invalid client credentials")
+
+            issuer = self._issuer(request, realm)
+            grant_type = form.get("grant_type")
+            scope = form.get("scope", "openid profile email")
+
+            if grant_type == "password":
+                user = realm.find_user(username=form.get("username"), email=form.get("username"))
+                if user is None or realm.passwords.get(user["id"]) != form.get("password"):
+                    return _oauth_error(401, "invalid_grant", "Invalid user credentials")
+                if not user["enabled"]:
+                    return _oauth_error(400, "invalid_grant", "Account disabled")
+                session_id = realm.start_session(user["id"], client["clientId"])
+                return realm.issue_tokens(issuer, user["id"], client["clientId"], scope, session_id)
+
+            if grant_type == "client_credentials":
+                if not client.get("serviceAccountsEnabled"):
+                    return _oauth_error(401, "unauthorized_client", "Client not enabled to retrieve service account")
+                return realm.issue_tokens(issuer, client["serviceAccountUserId"], client["clientId"], scope)
+
+            if grant_type == "refresh_token":
+                claims = realm.decode(form.get("refresh_token", ""), "Refresh")
+                if claims is None or claims["sub"] not in realm.users:
+                    return _oauth_error(400, "invalid_grant", "Invalid refresh token")
+                return realm.issue_tokens(issuer, claims["sub"], client["clientId"], claims.get("scope", scope), claims["sid"])
+
+            if grant_type == "authorization_code":
+                grant = realm.codes.pop(form.get("code", ""), None)
+                if grant is None or grant["expires_at"] < time.time():
+                    return _oauth_error(400, "invalid_grant", "Code not valid")
+                if grant["client_id"] != client["clientId"] or grant["redirect_uri"] != form.get("redirect_uri"):
+                    return _oauth_error(400, "invalid_grant", "Incorrect redirect_uri")
+                session_id = realm.start_session(grant["user_id"], client["clientId"])
+                return realm.issue_tokens(issuer, grant["user_id"], client["clientId"], grant["scope"], session_id)
+
+            return _oauth_error(400, "unsupported_grant_type", f"Unsupported grant_type: {grant_type}")
+
+        @app.post(f"{oidc}/token/introspect")
+        async def introspect(realm_name: str, request: Request):
+            await self._enter("introspection")
+            realm = self._get_realm(realm_name)
+            form = _form(await request.body())
+            client_id, client_secret = self._client_credentials(request, form)
+            client = realm.authenticate_client(client_id, client_secret)
+            if client is None or client["publicClient"]:
+                return _oauth_error(401, "unauthorized_client", "Authentication failed")
+
+            claims = realm.decode(form.get("token", ""))
+            if claims is None:
+                return {"active": False}
+            return {**claims, "active": True, "client_id": claims["azp"], "username": claims["preferred_username"]}
+
+        @app.get(f"{oidc}/userinfo")
+        async def userinfo(realm_name: str, request: Request):
+            await self._enter("userinfo")
+            realm = self._get_realm(realm_name)
+            claims = realm.decode(self._bearer(request) or "")
+            if claims is None:
+                return _oauth_error(401, "invalid_token", "Token verification failed")
+            fields = ("sub", "email", "email_verified", "preferred_username", "name", "given_name", "family_name")
+            return {field: claims[field] for field in fields if field in claims}
+
+        @app.post(f"{oidc}/logout")
+        async def logout(realm_name: str, request: Request):
+            await self._enter("logout")
+            realm = self._get_realm(realm_name)
+            form = _form(await request.body())
+            client_id, client_secret = self._client_credentials(request, form)
+            if realm.authenticate_client(client_id, client_secret) is None:
+                return _oauth_error(401, "unauthorized_client", "Invalid client credentials")
+
+            claims = realm.decode(form.get("refresh_token", ""), "Refresh")
+            if claims is None:
+                return _oauth_error(400, "invalid_grant", "Invalid refresh token")
+            realm.sessions.pop(claims["sid"], None)
+            return Response(status_code=204)
+
+    def _add_admin_routes(self, app: FastAPI) -> None:
+        admin = "/admin/realms/{realm_name}"
+
+        async def admin_realm(request: Request, realm_name: str) -> EmulatedRealm:
+            await self._enter("admin")
+            realm = self._get_realm(realm_name)
+            self._require_admin(request, realm)
+            return realm
+
+        @app.get(admin)
+        async def get_realm(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return {
+                "id": realm.id,
+                "realm": realm.name,
+                "enabled": True,
+                "accessTokenLifespan": realm.access_token_lifespan,
+                "ssoSessionIdleTimeout": realm.sso_session_idle_timeout,
+                "duplicateEmailsAllowed": realm.duplicate_emails_allowed
+            }
+
+        @app.get(f"{admin}/users")
+        async def get_users(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return realm.search_users(dict(request.query_params))
+
+        @app.get(f"{admin}/users/count")
+        async def count_users(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            params = {k: v for k, v in request.query_params.items() if k not in ("first", "max")}
+            return len(realm.search_users({**params, "max": str(len(realm.users))}))
+
+        @app.post(f"{admin}/users")
+        async def create_user(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            representation = await request.json()
+            conflict = realm.conflict(representation)
+            if conflict:
+                return _admin_error(409, conflict)
+            try:
+                user_id = realm.create_user(representation)
+            except ValueError as e:
+                return _admin_error(400, str(e))
+            return Response(status_code=201, headers={"Location": f"{request.url}/{user_id}"})
+
+        @app.get(f"{admin}/users/{{user_id}}")
+        async def get_user(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return self._get_user(realm, user_id)
+
+        @app.put(f"{admin}/users/{{user_id}}")
+        async def update_user(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            representation = await request.json()
+            conflict = realm.conflict(representation, ignore_id=user_id)
+            if conflict:
+                return _admin_error(409, conflict)
+            realm.update_user(user_id, representation)
+            return Response(status_code=204)
+
+        @app.delete(f"{admin}/users/{{user_id}}")
+        async def delete_user(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            realm.delete_user(user_id)
+            return Response(status_code=204)
+
+        @app.put(f"{admin}/users/{{user_id}}/reset-password")
+        async def reset_password(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            user = self._get_user(realm, user_id)
+            credential = await request.json()
+            realm.passwords[user_id] = credential["value"]
+            if credential.get("temporary"):
+                user["requiredActions"] = ["UPDATE_PASSWORD"]
+            return Response(status_code=204)
+
+        @app.get(f"{admin}/users/{{user_id}}/role-mappings")
+        async def get_role_mappings(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            mappings = [realm.roles[name] for name in sorted(realm.role_mappings[user_id])]
+            return {"realmMappings": mappings} if mappings else {}
+
+        @app.get(f"{admin}/users/{{user_id}}/role-mappings/realm")
+        async def get_realm_role_mappings(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            return [realm.roles[name] for name in sorted(realm.role_mappings[user_id])]
+
+        @app.get(f"{admin}/users/{{user_id}}/role-mappings/realm/composite")
+        async def get_effective_realm_roles(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            return [realm.roles[name] for name in realm.realm_roles_of(user_id)]
+
+        async def role_names(realm: EmulatedRealm, request: Request) -> List[str]:
+            names = [role.get("name") for role in await request.json()]
+            missing = [name for name in names if name not in realm.roles]
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Role not found: {missing[0]}")
+            return names
+
+        @app.post(f"{admin}/users/{{user_id}}/role-mappings/realm")
+        async def add_realm_role_mappings(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            realm.role_mappings[user_id].update(await role_names(realm, request))
+            return Response(status_code=204)
+
+        @app.delete(f"{admin}/users/{{user_id}}/role-mappings/realm")
+        async def delete_realm_role_mappings(realm_name: str, user_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            self._get_user(realm, user_id)
+            realm.role_mappings[user_id].difference_update(await role_names(realm, request))
+            return Response(status_code=204)
+
+        @app.get(f"{admin}/roles")
+        async def get_roles(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return list(realm.roles.values())
+
+        @app.get(f"{admin}/roles/{{role_name}}")
+        async def get_role(realm_name: str, role_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            role = realm.roles.get(role_name)
+            if role is None:
+                return _admin_error(404, "Could not find role")
+            return role
+
+        @app.get(f"{admin}/roles/{{role_name}}/users")
+        async def get_role_members(realm_name: str, role_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            if role_name not in realm.roles:
+                return _admin_error(404, "Could not find role")
+            first = int(request.query_params.get("first", 0))
+            maximum = int(request.query_params.get("max", 100))
+            members = [
+                user for user_id, user in realm.users.items() if role_name in realm.role_mappings[user_id]
+            ]
+            return members[first:first + maximum]
+
+        @app.get(f"{admin}/roles-by-id/{{role_id}}/composites")
+        async def get_role_composites(realm_name: str, role_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return realm.role_composites.get(role_id, [])
+
+        @app.get(f"{admin}/clients")
+        async def get_clients(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return [
+                {key: value for key, value in client.items() if key not in ("secret", "serviceAccountUserId")}
+                for client in realm.clients.values()
+            ]
+
+        @app.get(f"{admin}/clients/{{client_uuid}}/roles")
+        async def get_client_roles(realm_name: str, client_uuid: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            if client_uuid not in realm.client_roles:
+                return _admin_error(404, "Could not find client")
+            return realm.client_roles[client_uuid]
+
+        def group_page(groups: List[Dict[str, Any]], request: Request, default_max: int) -> List[Dict[str, Any]]:
+            # Like Keycloak 23+, subgroups are only listed by /groups/{id}/children
+            first = int(request.query_params.get("first", 0))
+            maximum = int(request.query_params.get("max", default_max))
+            return [
+                dict(
+                    {key: value for key, value in group.items() if key != "subGroups"},
+                    subGroupCount=len(group.get("subGroups", []))
+                )
+                for group in groups[first:first + maximum]
+            ]
+
+        @app.get(f"{admin}/groups")
+        async def get_groups(realm_name: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            return group_page(realm.groups, request, 100)
+
+        @app.get(f"{admin}/groups/{{group_id}}/children")
+        async def get_group_children(realm_name: str, group_id: str, request: Request):
+            realm = await admin_realm(request, realm_name)
+            stack = list(realm.groups)
+            while stack:
+                group = stack.pop()
+                if group.get("id") == group_id:
+                    return group_page(group.get("subGroups", []), request, 10)
+                stack.extend(group.get("subGroups", []))
+            return _admin_error(404, "Could not find group by id")
+
+        @app.post(f"{admin}/partialImport")
+        async def partial_import(realm_name: str, request: Request):
+            """Import users and realm roles with the FAIL, SKIP or OVERWRITE policy"""
+            realm = await admin_realm(request, realm_name)
+            body = await request.json()
+            policy = body.get("ifResourceExists", "FAIL")
+            if policy not in ("FAIL", "SKIP", "OVERWRITE"):
+                return _admin_error(400, f"Unknown ifResourceExists policy: {policy}")
+
+            roles = body.get("roles", {}).get("realm", [])
+            users = body.get("users", [])
+            new_roles = {role["name"] for role in roles}
+
+            # Validate everything first so a failing import changes nothing
+            existing_users: List[Optional[Dict[str, Any]]] = []
+            seen: Set[str] = set()
+            for user in users:
+                username = (user.get("username") or user.get("email") or "").lower()
+                if not username:
+                    return _admin_error(400, "User name is missing")
+                if username in seen:
+                    return _admin_error(400, f"Duplicate user '{username}' in import")
+                seen.add(username)
+                unknown = [r for r in user.get("realmRoles", []) if r not in realm.roles and r not in new_roles]
+                if unknown:
+                    return _admin_error(400, f"Role not found: {unknown[0]}")
+                existing = realm.find_user(
+                    username=username,
+                    email=None if realm.duplicate_emails_allowed else user.get("email")
+                )
+                if existing is not None and policy == "FAIL":
+                    return _admin_error(409, f"User '{existing['username']}' already exists")
+                existing_users.append(existing)
+            if policy == "FAIL":
+                for role in roles:
+                    if role["name"] in realm.roles:
+                        return _admin_error(409, f"Realm role '{role['name']}' already exists")
+
+            results = []
+            counts = {"ADDED": 0, "SKIPPED": 0, "OVERWRITTEN": 0}
+
+            def record(action: str, resource_type: str, name: str, resource_id: str) -> None:
+                counts[action] += 1
+                results.append({
+                    "action": action, "resourceType": resource_type,
+                    "resourceName": name, "id": resource_id
+                })
+
+            for role in roles:
+                existing_role = realm.roles.get(role["name"])
+                if existing_role is not None and policy == "SKIP":
+                    record("SKIPPED", "REALM_ROLE", role["name"], existing_role["id"])
+                    continue
+                if existing_role is not None:
+                    existing_role.update(description=role.get("description", ""))
+                    record("OVERWRITTEN", "REALM_ROLE", role["name"], existing_role["id"])
+                    continue
+                created = realm.add_role(role["name"], role.get("description", ""), role.get("composites"))
+                record("ADDED", "REALM_ROLE", role["name"], created["id"])
+
+            for user, existing in zip(users, existing_users):
+                if existing is not None and policy == "SKIP":
+                    record("SKIPPED", "USER", existing["username"], existing["id"])
+                    continue
+                action = "ADDED"
+                if existing is not None:
+                    # Keycloak replaces overwritten users with a new one
+                    realm.delete_user(existing["id"])
+                    action = "OVERWRITTEN"
+                user_id = realm.create_user(user)
+                realm.role_mappings[user_id].update(user.get("realmRoles", []))
+                record(action, "USER", realm.users[user_id]["username"], user_id)
+
+            return {
+                "added": counts["ADDED"],
+                "skipped": counts["SKIPPED"],
+                "overwritten": counts["OVERWRITTEN"],
+                "results": results
+            }
+
+    def _add_control_routes(self, app: FastAPI) -> None:
+        @app.get("/_emulator/stats")
+        async def stats():
+            return {
+                "requests": self.requests,
+                "injected_errors": self.injected_errors,
+                "faults": {operation: fault.to_dict() for operation, fault in self.faults.items()},
+                "realms": {
+                    name: {"users": len(realm.users), "sessions": len(realm.sessions)}
+                    for name, realm in self.realms.items()
+                }
+            }
+
+        @app.put("/_emulator/faults/{operation}")
+        async def put_fault(operation: str, request: Request):
+            try:
+                fault = self.set_fault(operation, **(await request.json()))
+            except (TypeError, ValueError) as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+            return fault.to_dict()
+
+        @app.delete("/_emulator/faults")
+        async def delete_faults():
+            self.clear_faults()
+            return Response(status_code=204)
+
+
+def main() -> None:
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the in-process Keycloak emulator as a server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--base-url", help="Issuer base URL, defaults to the request URL")
+    parser.add_argument("--realm-export", action="append", default=[], help="Realm export file to load")
+    parser.add_argument("--algorithm", action="append", help="Signing algorithm (repeatable, default RS256)")
+    parser.add_argument("--admin-user", default="admin")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency in seconds for every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected error")
+    parser.add_argument("--error-status", type=int, default=503, help="Status code of injected errors")
+    parser.add_argument("--seed", type=int, help="Random seed for fault injection")
+    args = parser.parse_args()
+
+    emulator = KeycloakEmulator(
+        base_url=args.base_url,
+        admin_username=args.admin_user,
+        admin_password=args.admin_password,
+        algorithms=tuple(args.algorithm or ("RS256",)),
+        seed=args.seed
+    )
+    for path in args.realm_export:
+        realm = emulator.load_realm_export(path)
+        logger.info(f"Loaded realm {realm.name} from {path}")
+    if args.latency or args.jitter or args.error_rate:
+        emulator.set_fault(
+            latency=args.latency, jitter=args.jitter,
+            error_rate=args.error_rate, error_status=args.error_status
+        )
+
+    uvicorn.run(emulator.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()